@@ -1,5 +1,6 @@
 # Description: 初始化数据库，包括创建表、导入数据、更新向量空间等操作
 from datetime import datetime
+import json
 import multiprocessing as mp
 import sys
 import time
@@ -9,6 +10,7 @@ import click
 
 from chatchat.settings import Settings
 from chatchat.server.knowledge_base.migrate import (
+    convert_index,
     create_tables,
     folder2db,
     import_from_db,
@@ -50,6 +52,8 @@ def worker(args: dict):
             folder2db(
                 kb_names=args.get("kb_name"), mode="increment", embed_model=args.get("embed_model")
             )
+        elif args.get("convert_index"):
+            convert_index(args.get("kb_name"), json.loads(args.get("convert_index")))
         elif args.get("prune_db"):
             prune_db_docs(args.get("kb_name"))
         elif args.get("prune_folder"):
@@ -127,6 +131,16 @@ def worker(args: dict):
             """
         ),
 )
+@click.option(
+        "--convert-index",
+        type=str,
+        help=(
+            """
+            convert FAISS vector stores to the given index spec in JSON and rebuild the index,
+            e.g. '{"quantizer": "int8"}' or '{"index_type": "ivf_pq", "pq_m": 16}'.
+            """
+        ),
+)
 @click.option(
         "-n",
         "--kb-name",
@@ -239,7 +239,8 @@ def _lazy_load_key(settings: BaseSettings):
 
 _T = t.TypeVar("_T", bound=BaseFileSettings)
 
-@cached(max_size=1, algorithm=CachingAlgorithmFlag.LRU, thread_safe=True, custom_key_maker=_lazy_load_key)
+# 每个配置类各占一个条目，否则交替访问不同的配置时每次都会重新加载配置文件
+@cached(max_size=16, algorithm=CachingAlgorithmFlag.LRU, thread_safe=True, custom_key_maker=_lazy_load_key)
 def _cached_settings(settings: _T) -> _T:
     """
     the sesstings is cached, and refreshed when configuration files changed
@@ -1,5 +1,7 @@
 from urllib.parse import urlencode
 
+from fastapi import HTTPException
+
 from chatchat.settings import Settings
 from chatchat.server.agent.tools_factory.tools_registry import (
     BaseToolOutput,
@@ -7,27 +9,47 @@ from chatchat.server.agent.tools_factory.tools_registry import (
     format_context,
 )
 from chatchat.server.knowledge_base.kb_api import list_kbs
-from chatchat.server.knowledge_base.kb_doc_api import search_docs
+from chatchat.server.knowledge_base.kb_doc_api import search_docs, search_docs_in_kbs
 from chatchat.server.pydantic_v1 import Field
 from chatchat.server.utils import get_tool_config
+from chatchat.utils import build_logger
+
+logger = build_logger()
 
 template = (
     "Use local knowledgebase from one or more of these:\n{KB_info}\n to get information，Only local data on "
-    "this knowledge use this tool. The 'database' should be one of the above [{key}]."
+    "this knowledge use this tool. The 'database' should be one of the above [{key}], "
+    "separate multiple databases with ','."
 )
 KB_info_str = "\n".join([f"{key}: {value}" for key, value in Settings.kb_settings.KB_INFO.items()])
 template_knowledge = template.format(KB_info=KB_info_str, key="samples")
 
 
 def search_knowledgebase(query: str, database: str, config: dict):
-    docs = search_docs(
-        query=query,
-        knowledge_base_name=database,
-        top_k=config["top_k"],
-        score_threshold=config["score_threshold"],
-        file_name="",
-        metadata={},
-    )
+    databases = [x.strip() for x in database.split(",") if x.strip()]
+    if len(databases) > 1:
+        try:
+            docs = search_docs_in_kbs(
+                query=query,
+                knowledge_base_names=databases,
+                top_k=config["top_k"],
+                score_threshold=config["score_threshold"],
+            )
+        except HTTPException as e:
+            # 模型给出的知识库名称有误时，与检索单个知识库一致，返回空结果
+            logger.warning(f"检索知识库 {database} 失败：{e.detail}")
+            docs = []
+    else:
+        docs = search_docs(
+            query=query,
+            knowledge_base_name=database,
+            top_k=config["top_k"],
+            score_threshold=config["score_threshold"],
+            file_name="",
+            metadata={},
+            nprobe=None,
+            ef_search=None,
+        )
     return {"knowledge_base": database, "docs": docs}
 
 
@@ -8,13 +8,22 @@ from chatchat.settings import Settings
 from chatchat.server.api_server.api_schemas import OpenAIChatInput, OpenAIChatOutput
 from chatchat.server.chat.file_chat import upload_temp_docs
 from chatchat.server.chat.kb_chat import kb_chat
-from chatchat.server.knowledge_base.kb_api import create_kb, delete_kb, list_kbs
+from chatchat.server.knowledge_base.kb_api import (
+    create_kb,
+    delete_kb,
+    kb_cache_stats,
+    list_kbs,
+    pin_kb,
+)
 from chatchat.server.knowledge_base.kb_doc_api import (
     delete_docs,
     download_doc,
+    list_docs,
     list_files,
     recreate_vector_store,
     search_docs,
+    search_docs_batch,
+    search_docs_in_kbs,
     update_docs,
     update_info,
     upload_docs,
@@ -78,14 +87,34 @@ kb_router.post(
     "/delete_knowledge_base", response_model=BaseResponse, summary="删除知识库"
 )(delete_kb)
 
+kb_router.get(
+    "/cache_stats", response_model=BaseResponse, summary="获取向量库缓存统计"
+)(kb_cache_stats)
+
+kb_router.post(
+    "/pin_knowledge_base", response_model=BaseResponse, summary="设置知识库是否常驻内存"
+)(pin_kb)
+
 kb_router.get(
     "/list_files", response_model=ListResponse, summary="获取知识库内的文件列表"
 )(list_files)
 
+kb_router.post(
+    "/list_docs", response_model=BaseResponse, summary="分页获取知识库内的文档"
+)(list_docs)
+
 kb_router.post("/search_docs", response_model=List[dict], summary="搜索知识库")(
     search_docs
 )
 
+kb_router.post(
+    "/search_docs_batch", response_model=List[List[dict]], summary="批量搜索知识库"
+)(search_docs_batch)
+
+kb_router.post(
+    "/search_docs_in_kbs", response_model=List[dict], summary="同时搜索多个知识库"
+)(search_docs_in_kbs)
+
 kb_router.post(
     "/upload_docs",
     response_model=BaseResponse,
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import httpx
+import openai
+
+from chatchat.settings import Settings
+from chatchat.server.utils import get_model_platforms
+from chatchat.utils import build_logger
+
+logger = build_logger()
+
+
+DEFAULT_API_CONCURRENCIES = 5  # 默认单个模型最大并发数
+# 尚无耗时统计时使用的估计值（秒）
+_DEFAULT_LATENCY = 1.0
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    平台不可用的错误：连接错误、超时、限流与 5xx。换一个平台可能成功，并计入平台健康状态
+    """
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code in (408, 429)
+    return False
+
+
+def is_model_missing(error: BaseException) -> bool:
+    """
+    平台上没有该模型（404）：换一个平台可能成功，但平台本身是正常的，不计入失败
+    """
+    return isinstance(error, openai.APIStatusError) and error.status_code == 404
+
+
+class PlatformState:
+    """
+    某平台上一个模型的负载、耗时与健康状态
+    """
+
+    def __init__(self, model_name: str, platform_name: str, concurrency: int):
+        self.model_name = model_name
+        self.platform_name = platform_name
+        self.concurrency = max(concurrency, 1)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        # 已转发到该平台、尚未结束的请求数（包括等待并发名额的请求）
+        self.outstanding = 0
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        # 总耗时与首个 token 耗时的指数加权平均（秒）
+        self.latency: Optional[float] = None
+        self.ttft: Optional[float] = None
+        # 熔断：open_until 之前不转发；之后放行一个试探请求（probing）
+        self.open_until = 0.0
+        self.probing = False
+        self.last_error = ""
+
+    def is_open(self, now: float) -> bool:
+        return now < self.open_until or (self.open_until > 0 and self.probing)
+
+    def expected_latency(self, stream: bool, default: float) -> float:
+        if stream and self.ttft is not None:
+            return self.ttft
+        return self.latency if self.latency is not None else default
+
+    def stats(self) -> Dict:
+        now = time.time()
+        return {
+            "platform_name": self.platform_name,
+            "concurrency": self.concurrency,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "ewma_latency": self.latency,
+            "ewma_ttft": self.ttft,
+            "circuit": "open" if now < self.open_until else ("half-open" if self.open_until else "closed"),
+            "last_error": self.last_error,
+        }
+
+
+class Route:
+    """
+    一次转发：记录首个 token 时间、成功或失败，结束时调用 release（可重复调用）
+    """
+
+    def __init__(self, router: "ModelRouter", state: PlatformState):
+        self.router = router
+        self.state = state
+        self.start = time.perf_counter()
+        self._released = False
+        # 是否已记录成功或失败
+        self._recorded = False
+
+    @property
+    def platform_name(self) -> str:
+        return self.state.platform_name
+
+    def first_token(self):
+        self.router._observe(self.state, "ttft", time.perf_counter() - self.start)
+
+    def success(self):
+        state = self.state
+        self._recorded = True
+        self.router._observe(state, "latency", time.perf_counter() - self.start)
+        state.successes += 1
+        state.consecutive_failures = 0
+        state.open_until = 0.0
+        state.probing = False
+
+    def failure(self, error: BaseException):
+        """
+        记录平台不可用的错误（见 is_retryable）。请求本身有误等其它错误不应调用，以免影响平台健康状态
+        """
+        state = self.state
+        self._recorded = True
+        state.failures += 1
+        state.last_error = f"{error.__class__.__name__}: {error}"
+        state.consecutive_failures += 1
+        if state.probing or state.consecutive_failures >= self.router.failure_threshold:
+            state.open_until = time.time() + self.router.cooldown
+            logger.warning(
+                f"模型 {state.model_name} 在平台 {state.platform_name} 连续失败 {state.consecutive_failures} 次，"
+                f"暂停转发 {self.router.cooldown} 秒：{state.last_error}"
+            )
+        state.probing = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            if not self._recorded:
+                # 请求被取消，未得到结果：若为熔断后的试探请求，允许再次试探
+                self.state.probing = False
+            self.state.outstanding -= 1
+            self.state.semaphore.release()
+
+
+class ModelRouter:
+    """
+    在提供同名模型的多个平台间调度请求：
+    1. 按 (未完成请求数 + 1) / 并发数 * 平均耗时（流式请求用首个 token 耗时）选择得分最低的平台；
+    2. 连续失败 failure_threshold 次的平台熔断 cooldown 秒，之后放行一个试探请求，成功后恢复；
+    3. 调用方可排除已失败的平台重新选择，以便在返回首个 token 前自动切换平台重试。
+    只应在同一个事件循环中使用。
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30, alpha: float = 0.3):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self._states: Dict[Tuple[str, str], PlatformState] = {}
+
+    def _observe(self, state: PlatformState, field: str, value: float):
+        old = getattr(state, field)
+        setattr(state, field, value if old is None else old + self.alpha * (value - old))
+
+    def states(self, model_name: str) -> List[PlatformState]:
+        infos = get_model_platforms(model_name)
+        assert infos, f"specified model '{model_name}' cannot be found in MODEL_PLATFORMS."
+        states = []
+        for info in infos:
+            key = (model_name, info["platform_name"])
+            if (state := self._states.get(key)) is None:
+                concurrency = info.get("api_concurrencies") or DEFAULT_API_CONCURRENCIES
+                state = self._states[key] = PlatformState(model_name, info["platform_name"], concurrency)
+            states.append(state)
+        return states
+
+    def select(
+        self,
+        model_name: str,
+        exclude: Iterable[str] = (),
+        stream: bool = False,
+        allow_open: bool = True,
+    ) -> Optional[PlatformState]:
+        """
+        选择平台，没有可用平台时返回 None。allow_open=True 时若所有平台都已熔断，选择最早恢复的平台
+        """
+        now = time.time()
+        candidates = [s for s in self.states(model_name) if s.platform_name not in exclude]
+        available = [s for s in candidates if not s.is_open(now)]
+        if not available:
+            if not allow_open or not candidates:
+                return None
+            return min(candidates, key=lambda s: s.open_until)
+
+        known = [s.latency for s in available if s.latency is not None]
+        default = sum(known) / len(known) if known else _DEFAULT_LATENCY
+        state = min(
+            available,
+            key=lambda s: (s.outstanding + 1) / s.concurrency * s.expected_latency(stream, default),
+        )
+        if state.open_until and now >= state.open_until:
+            # 熔断时间已过，本次请求作为试探
+            state.probing = True
+        return state
+
+    async def acquire(
+        self,
+        model_name: str,
+        exclude: Iterable[str] = (),
+        stream: bool = False,
+        allow_open: bool = True,
+    ) -> Optional[Route]:
+        state = self.select(model_name, exclude=exclude, stream=stream, allow_open=allow_open)
+        if state is None:
+            return None
+        state.outstanding += 1
+        state.requests += 1
+        try:
+            await state.semaphore.acquire()
+        except BaseException:
+            state.outstanding -= 1
+            raise
+        return Route(self, state)
+
+    def stats(self) -> Dict[str, List[Dict]]:
+        result: Dict[str, List[Dict]] = {}
+        for (model_name, _), state in self._states.items():
+            result.setdefault(model_name, []).append(state.stats())
+        return result
+
+
+model_router = ModelRouter(
+    failure_threshold=Settings.model_settings.MODEL_ROUTER_FAILURE_THRESHOLD,
+    cooldown=Settings.model_settings.MODEL_ROUTER_COOLDOWN,
+)
@@ -2,20 +2,26 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import operator
 import os
 import shutil
-from contextlib import asynccontextmanager
+import weakref
 from datetime import datetime
 from pathlib import Path
-from typing import AsyncGenerator, Dict, Iterable, Tuple
+from typing import Dict, Generator, Iterable
 
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import FileResponse
-from openai import AsyncClient
+from starlette.background import BackgroundTask
 from sse_starlette.sse import EventSourceResponse, ServerSentEvent
 
 from chatchat.settings import Settings
-from chatchat.server.utils import get_config_platforms, get_model_info, get_OpenAIClient
+from chatchat.server.api_server.model_router import (
+    is_model_missing,
+    is_retryable,
+    model_router,
+)
+from chatchat.server.utils import get_config_platforms, get_OpenAIClient
 from chatchat.utils import build_logger
 
 from .api_schemas import *
@@ -23,44 +29,27 @@ from .api_schemas import *
 logger = build_logger()
 
 
-DEFAULT_API_CONCURRENCIES = 5  # 默认单个模型最大并发数
-model_semaphores: Dict[
-    Tuple[str, str], asyncio.Semaphore
-] = {}  # key: (model_name, platform)
 openai_router = APIRouter(prefix="/v1", tags=["OpenAI 兼容平台整合接口"])
 
 
-@asynccontextmanager
-async def get_model_client(model_name: str) -> AsyncGenerator[AsyncClient]:
-    """
-    对重名模型进行调度，依次选择：空闲的模型 -> 当前访问数最少的模型
-    """
-    max_semaphore = 0
-    selected_platform = ""
-    model_infos = get_model_info(model_name=model_name, multiple=True)
-    assert model_infos, f"specified model '{model_name}' cannot be found in MODEL_PLATFORMS."
-
-    for m, c in model_infos.items():
-        key = (m, c["platform_name"])
-        api_concurrencies = c.get("api_concurrencies", DEFAULT_API_CONCURRENCIES)
-        if key not in model_semaphores:
-            model_semaphores[key] = asyncio.Semaphore(api_concurrencies)
-        semaphore = model_semaphores[key]
-        if semaphore._value >= api_concurrencies:
-            selected_platform = c["platform_name"]
-            break
-        elif semaphore._value > max_semaphore:
-            selected_platform = c["platform_name"]
+def _extra_outputs(items: Iterable, extra_json: Dict) -> Generator[str]:
+    for x in items:
+        if isinstance(x, str):
+            x = OpenAIChatOutput(content=x, object="chat.completion.chunk")
+        elif isinstance(x, dict):
+            x = OpenAIChatOutput.model_validate(x)
+        else:
+            raise RuntimeError(f"unsupported value: {items}")
+        for k, v in extra_json.items():
+            setattr(x, k, v)
+        yield x.model_dump_json()
 
-    key = (m, selected_platform)
-    semaphore = model_semaphores[key]
-    try:
-        await semaphore.acquire()
-        yield get_OpenAIClient(platform_name=selected_platform, is_async=True)
-    except Exception:
-        logger.exception(f"failed when request to {key}")
-    finally:
-        semaphore.release()
+
+def _request_params(body) -> Dict:
+    params = body.model_dump(exclude_unset=True)
+    if params.get("max_tokens") == 0:
+        params["max_tokens"] = Settings.model_settings.MAX_TOKENS
+    return params
 
 
 async def openai_request(
@@ -72,32 +61,16 @@ async def openai_request(
 
     async def generator():
         try:
-            for x in header:
-                if isinstance(x, str):
-                    x = OpenAIChatOutput(content=x, object="chat.completion.chunk")
-                elif isinstance(x, dict):
-                    x = OpenAIChatOutput.model_validate(x)
-                else:
-                    raise RuntimeError(f"unsupported value: {header}")
-                for k, v in extra_json.items():
-                    setattr(x, k, v)
-                yield x.model_dump_json()
+            for x in _extra_outputs(header, extra_json):
+                yield x
 
             async for chunk in await method(**params):
                 for k, v in extra_json.items():
                     setattr(chunk, k, v)
                 yield chunk.model_dump_json()
 
-            for x in tail:
-                if isinstance(x, str):
-                    x = OpenAIChatOutput(content=x, object="chat.completion.chunk")
-                elif isinstance(x, dict):
-                    x = OpenAIChatOutput.model_validate(x)
-                else:
-                    raise RuntimeError(f"unsupported value: {tail}")
-                for k, v in extra_json.items():
-                    setattr(x, k, v)
-                yield x.model_dump_json()
+            for x in _extra_outputs(tail, extra_json):
+                yield x
         except asyncio.exceptions.CancelledError:
             logger.warning("streaming progress has been interrupted by user.")
             return
@@ -105,9 +78,7 @@ async def openai_request(
             logger.error(f"openai request error: {e}")
             yield {"data": json.dumps({"error": str(e)})}
 
-    params = body.model_dump(exclude_unset=True)
-    if params.get("max_tokens") == 0:
-        params["max_tokens"] = Settings.model_settings.MAX_TOKENS
+    params = _request_params(body)
 
     if hasattr(body, "stream") and body.stream:
         return EventSourceResponse(generator())
@@ -118,6 +89,122 @@ async def openai_request(
         return result.model_dump()
 
 
+async def _close_stream(chunks):
+    if chunks is None:
+        return
+    try:
+        await chunks.close()
+    except BaseException:
+        pass
+
+
+def _failed_response(error: Exception, stream: bool):
+    # 与 openai_request 一致：流式请求以事件返回错误，非流式请求抛出异常
+    if not stream:
+        raise error
+
+    async def generator():
+        yield {"data": json.dumps({"error": str(error)})}
+
+    return EventSourceResponse(generator())
+
+
+async def openai_routed_request(
+    model_name: str,
+    resource: str,
+    body,
+    extra_json: Dict = {},
+    header: Iterable = [],
+    tail: Iterable = [],
+):
+    """
+    与 openai_request 相同，但由 model_router 在提供该模型的平台间调度：
+    在收到首个 token（非流式请求为完整结果）之前遇到平台不可用（见 is_retryable）或平台上没有该模型时，
+    换一个平台重试；其它错误（如请求参数有误）直接返回，不计入平台失败。
+    resource 为客户端上的方法路径，如 "chat.completions.create"
+    """
+    params = _request_params(body)
+    stream = bool(getattr(body, "stream", False))
+    get_method = operator.attrgetter(resource)
+    tried = []
+    last_error = None
+    while True:
+        route = await model_router.acquire(
+            model_name, exclude=tried, stream=stream, allow_open=not tried
+        )
+        if route is None:
+            return _failed_response(last_error, stream)
+        chunks = None
+        handed_off = False
+        try:
+            method = get_method(get_OpenAIClient(platform_name=route.platform_name, is_async=True))
+            if not stream:
+                result = await method(**params)
+                route.success()
+                for k, v in extra_json.items():
+                    setattr(result, k, v)
+                return result.model_dump()
+            chunks = await method(**params)
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = None
+            route.first_token()
+            handed_off = True
+            break
+        except Exception as e:
+            if is_retryable(e):
+                route.failure(e)
+            elif not is_model_missing(e):
+                return _failed_response(e, stream)
+            tried.append(route.platform_name)
+            last_error = e
+            logger.warning(f"request to {(model_name, route.platform_name)} failed: {e}，尝试其它平台")
+        finally:
+            # 出错、客户端断开（CancelledError）或切换平台时关闭未读完的响应并归还名额
+            if not handed_off:
+                await _close_stream(chunks)
+                route.release()
+
+    async def generator():
+        try:
+            for x in _extra_outputs(header, extra_json):
+                yield x
+
+            if first is not None:
+                for k, v in extra_json.items():
+                    setattr(first, k, v)
+                yield first.model_dump_json()
+                async for chunk in chunks:
+                    for k, v in extra_json.items():
+                        setattr(chunk, k, v)
+                    yield chunk.model_dump_json()
+            route.success()
+
+            for x in _extra_outputs(tail, extra_json):
+                yield x
+        except asyncio.exceptions.CancelledError:
+            logger.warning("streaming progress has been interrupted by user.")
+            return
+        except Exception as e:
+            if is_retryable(e):
+                route.failure(e)
+            logger.error(f"openai request error: {e}")
+            yield {"data": json.dumps({"error": str(e)})}
+        finally:
+            await _close_stream(chunks)
+            route.release()
+
+    async def cleanup():
+        await _close_stream(chunks)
+        route.release()
+
+    # 生成器未被迭代（如响应发送前客户端已断开）时，由响应结束后的后台任务或对象回收时归还名额
+    response = EventSourceResponse(generator(), background=BackgroundTask(cleanup))
+    weakref.finalize(response, route.release)
+    return response
+
+
 @openai_router.get("/models")
 async def list_models() -> Dict:
     """
@@ -148,9 +235,7 @@ async def list_models() -> Dict:
 async def create_chat_completions(
     body: OpenAIChatInput,
 ):
-    async with get_model_client(body.model) as client:
-        result = await openai_request(client.chat.completions.create, body)
-        return result
+    return await openai_routed_request(body.model, "chat.completions.create", body)
 
 
 @openai_router.post("/completions")
@@ -158,8 +243,7 @@ async def create_completions(
     request: Request,
     body: OpenAIChatInput,
 ):
-    async with get_model_client(body.model) as client:
-        return await openai_request(client.completions.create, body)
+    return await openai_routed_request(body.model, "completions.create", body)
 
 
 @openai_router.post("/embeddings")
@@ -177,8 +261,7 @@ async def create_image_generations(
     request: Request,
     body: OpenAIImageGenerationsInput,
 ):
-    async with get_model_client(body.model) as client:
-        return await openai_request(client.images.generate, body)
+    return await openai_routed_request(body.model, "images.generate", body)
 
 
 @openai_router.post("/images/variations")
@@ -186,8 +269,7 @@ async def create_image_variations(
     request: Request,
     body: OpenAIImageVariationsInput,
 ):
-    async with get_model_client(body.model) as client:
-        return await openai_request(client.images.create_variation, body)
+    return await openai_routed_request(body.model, "images.create_variation", body)
 
 
 @openai_router.post("/images/edit")
@@ -195,8 +277,7 @@ async def create_image_edit(
     request: Request,
     body: OpenAIImageEditsInput,
 ):
-    async with get_model_client(body.model) as client:
-        return await openai_request(client.images.edit, body)
+    return await openai_routed_request(body.model, "images.edit", body)
 
 
 @openai_router.post("/audio/translations", deprecated="暂不支持")
@@ -204,8 +285,7 @@ async def create_audio_translations(
     request: Request,
     body: OpenAIAudioTranslationsInput,
 ):
-    async with get_model_client(body.model) as client:
-        return await openai_request(client.audio.translations.create, body)
+    return await openai_routed_request(body.model, "audio.translations.create", body)
 
 
 @openai_router.post("/audio/transcriptions", deprecated="暂不支持")
@@ -213,8 +293,7 @@ async def create_audio_transcriptions(
     request: Request,
     body: OpenAIAudioTranscriptionsInput,
 ):
-    async with get_model_client(body.model) as client:
-        return await openai_request(client.audio.transcriptions.create, body)
+    return await openai_routed_request(body.model, "audio.transcriptions.create", body)
 
 
 @openai_router.post("/audio/speech", deprecated="暂不支持")
@@ -222,8 +301,7 @@ async def create_audio_speech(
     request: Request,
     body: OpenAIAudioSpeechInput,
 ):
-    async with get_model_client(body.model) as client:
-        return await openai_request(client.audio.speech.create, body)
+    return await openai_routed_request(body.model, "audio.speech.create", body)
 
 
 def _get_file_id(
@@ -28,3 +28,10 @@ def get_server_prompt_template(
     if prompt_template is None:
         return BaseResponse.error("Prompt template not found")
     return BaseResponse.success(prompt_template)
+
+
+@server_router.get("/model_router_stats", summary="获取重名模型调度的各平台统计", response_model=BaseResponse)
+def get_model_router_stats():
+    from chatchat.server.api_server.model_router import model_router
+
+    return BaseResponse.success(model_router.stats())
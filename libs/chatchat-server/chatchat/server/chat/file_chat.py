@@ -85,7 +85,7 @@ def upload_temp_docs(
     返回临时目录名称作为ID，同时也是临时向量库的ID。
     """
     if prev_id is not None:
-        memo_faiss_pool.pop(prev_id)
+        memo_faiss_pool.drop_vector_store(prev_id)
 
     failed_files = []
     documents = []
@@ -141,7 +141,7 @@ async def file_chat(
         description="使用的prompt模板名称(在 prompt_settings.yaml 中配置)",
     ),
 ):
-    if knowledge_id not in memo_faiss_pool.keys():
+    if not memo_faiss_pool.exists(knowledge_id):
         # return BaseResponse(code=404, msg=f"未找到临时知识库 {knowledge_id}，请先上传文件")
         return BaseResponse(
             code=404,
@@ -180,7 +180,8 @@ async def file_chat(
             )
             embed_func = get_Embeddings()
             embeddings = await embed_func.aembed_query(query)
-            with memo_faiss_pool.acquire(knowledge_id) as vs:
+            vector_store = memo_faiss_pool.load_vector_store(knowledge_id, create=False)
+            with vector_store.acquire(shared=True) as vs:
                 docs = vs.similarity_search_with_score_by_vector(
                     embeddings, k=top_k, score_threshold=score_threshold
                 )
@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import Optional
 
 from pydantic import BaseModel
-from sqlalchemy import Column, DateTime, Integer, String, func
+from sqlalchemy import JSON, Column, DateTime, Integer, String, func
 
 from chatchat.server.db.base import Base
 
@@ -18,6 +18,7 @@ class KnowledgeBaseModel(Base):
     kb_info = Column(String(200), comment="知识库简介(用于Agent)")
     vs_type = Column(String(50), comment="向量库类型")
     embed_model = Column(String(50), comment="嵌入模型名称")
+    index_spec = Column(JSON, default={}, comment="向量索引参数")
     file_count = Column(Integer, default=0, comment="文件数量")
     create_time = Column(DateTime, default=func.now(), comment="创建时间")
 
@@ -32,6 +33,7 @@ class KnowledgeBaseSchema(BaseModel):
     kb_info: Optional[str]
     vs_type: Optional[str]
     embed_model: Optional[str]
+    index_spec: Optional[dict] = None
     file_count: Optional[int]
     create_time: Optional[datetime]
 
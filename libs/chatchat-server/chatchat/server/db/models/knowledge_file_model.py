@@ -37,6 +37,7 @@ class FileDocModel(Base):
     file_name = Column(String(255), comment="文件名称")
     doc_id = Column(String(50), comment="向量库文档ID")
     meta_data = Column(JSON, default={})
+    content_hash = Column(String(40), comment="文本内容哈希，文本未变化时复用其向量")
 
     def __repr__(self):
         return f"<FileDoc(id='{self.id}', kb_name='{self.kb_name}', file_name='{self.file_name}', doc_id='{self.doc_id}', metadata='{self.meta_data}')>"
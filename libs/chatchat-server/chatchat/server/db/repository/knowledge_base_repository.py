@@ -6,7 +6,7 @@ from chatchat.server.db.session import with_session
 
 
 @with_session
-def add_kb_to_db(session, kb_name, kb_info, vs_type, embed_model):
+def add_kb_to_db(session, kb_name, kb_info, vs_type, embed_model, index_spec=None):
     # 创建知识库实例
     kb = (
         session.query(KnowledgeBaseModel)
@@ -15,13 +15,19 @@ def add_kb_to_db(session, kb_name, kb_info, vs_type, embed_model):
     )
     if not kb:
         kb = KnowledgeBaseModel(
-            kb_name=kb_name, kb_info=kb_info, vs_type=vs_type, embed_model=embed_model
+            kb_name=kb_name,
+            kb_info=kb_info,
+            vs_type=vs_type,
+            embed_model=embed_model,
+            index_spec=index_spec or {},
         )
         session.add(kb)
     else:  # update kb with new vs_type and embed_model
         kb.kb_info = kb_info
         kb.vs_type = vs_type
         kb.embed_model = embed_model
+        if index_spec is not None:
+            kb.index_spec = index_spec
     return True
 
 
@@ -61,6 +67,28 @@ def load_kb_from_db(session, kb_name):
     return kb_name, vs_type, embed_model
 
 
+@with_session
+def get_kb_index_spec(session, kb_name) -> dict:
+    kb = (
+        session.query(KnowledgeBaseModel)
+        .filter(KnowledgeBaseModel.kb_name.ilike(kb_name))
+        .first()
+    )
+    return dict(kb.index_spec or {}) if kb else {}
+
+
+@with_session
+def update_kb_index_spec(session, kb_name, index_spec: dict) -> bool:
+    kb = (
+        session.query(KnowledgeBaseModel)
+        .filter(KnowledgeBaseModel.kb_name.ilike(kb_name))
+        .first()
+    )
+    if kb:
+        kb.index_spec = index_spec
+    return kb is not None
+
+
 @with_session
 def delete_kb_from_db(session, kb_name):
     kb = (
@@ -86,6 +114,7 @@ def get_kb_detail(session, kb_name: str) -> dict:
             "kb_info": kb.kb_info,
             "vs_type": kb.vs_type,
             "embed_model": kb.embed_model,
+            "index_spec": kb.index_spec or {},
             "file_count": kb.file_count,
             "create_time": kb.create_time,
         }
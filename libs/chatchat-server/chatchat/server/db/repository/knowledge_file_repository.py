@@ -27,24 +27,70 @@ def list_file_num_docs_id_by_kb_name_and_file_name(
     return [int(_id[0]) for _id in doc_ids]
 
 
+def _query_docs(session, kb_name: str, file_name: str = None, metadata: Dict = {}):
+    docs = session.query(FileDocModel).filter(FileDocModel.kb_name.ilike(kb_name))
+    if file_name:
+        docs = docs.filter(FileDocModel.file_name.ilike(file_name))
+    for k, v in metadata.items():
+        docs = docs.filter(FileDocModel.meta_data[k].as_string() == str(v))
+    return docs
+
+
 @with_session
 def list_docs_from_db(
     session,
     kb_name: str,
     file_name: str = None,
     metadata: Dict = {},
+    offset: int = 0,
+    limit: int = None,
+    after: int = None,
 ) -> List[Dict]:
     """
-    列出某知识库某文件对应的所有Document。
-    返回形式：[{"id": str, "metadata": dict}, ...]
+    列出某知识库某文件对应的所有Document，按添加顺序排列。
+    offset/limit 用于分页；after 为上一页最后一条的 row_id，指定时只返回其后的记录。
+    返回形式：[{"id": str, "metadata": dict, "row_id": int}, ...]
     """
-    docs = session.query(FileDocModel).filter(FileDocModel.kb_name.ilike(kb_name))
-    if file_name:
-        docs = docs.filter(FileDocModel.file_name.ilike(file_name))
-    for k, v in metadata.items():
-        docs = docs.filter(FileDocModel.meta_data[k].as_string() == str(v))
+    docs = _query_docs(session, kb_name, file_name, metadata).order_by(FileDocModel.id)
+    if after is not None:
+        docs = docs.filter(FileDocModel.id > after)
+    if offset:
+        docs = docs.offset(offset)
+    if limit is not None:
+        docs = docs.limit(limit)
+
+    return [
+        {"id": x.doc_id, "metadata": x.meta_data, "row_id": x.id} for x in docs.all()
+    ]
+
 
-    return [{"id": x.doc_id, "metadata": x.metadata} for x in docs.all()]
+@with_session
+def count_docs_from_db(
+    session,
+    kb_name: str,
+    file_name: str = None,
+    metadata: Dict = {},
+) -> int:
+    return _query_docs(session, kb_name, file_name, metadata).count()
+
+
+@with_session
+def list_doc_hashes_from_db(
+    session,
+    kb_name: str,
+    file_name: str = None,
+) -> Dict[str, str]:
+    """
+    列出某知识库（某文件）中记录了内容哈希的Document。
+    返回形式：{doc_id: content_hash, ...}
+    """
+    query = session.query(FileDocModel.doc_id, FileDocModel.content_hash).filter(
+        FileDocModel.kb_name.ilike(kb_name),
+        FileDocModel.content_hash.isnot(None),
+    )
+    if file_name:
+        query = query.filter(FileDocModel.file_name.ilike(file_name))
+    return {doc_id: content_hash for doc_id, content_hash in query.all()}
 
 
 @with_session
@@ -70,7 +116,7 @@ def delete_docs_from_db(
 def add_docs_to_db(session, kb_name: str, file_name: str, doc_infos: List[Dict]):
     """
     将某知识库某文件对应的所有Document信息添加到数据库。
-    doc_infos形式：[{"id": str, "metadata": dict}, ...]
+    doc_infos形式：[{"id": str, "metadata": dict, "content_hash": str}, ...]，content_hash 可省略
     """
     # ! 这里会出现doc_infos为None的情况，需要进一步排查
     if doc_infos is None:
@@ -84,6 +130,7 @@ def add_docs_to_db(session, kb_name: str, file_name: str, doc_infos: List[Dict])
             file_name=file_name,
             doc_id=d["id"],
             meta_data=d["metadata"],
+            content_hash=d.get("content_hash"),
         )
         session.add(obj)
     return True
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from chatchat.settings import Settings
+
+
+class _Request:
+    __slots__ = ("text", "event", "lead", "result", "error", "submitted")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.event = threading.Event()
+        self.lead = False
+        self.result: Optional[List[float]] = None
+        self.error: Optional[BaseException] = None
+        self.submitted = time.perf_counter()
+
+
+class QueryBatcher:
+    """
+    合并并发的单条查询向量请求：有其它批次正在发送时，队首的请求等待至多 max_wait 秒、凑满 max_batch 条
+    或其它批次全部完成，然后以一次批量请求调用 embed_func，再把结果分发给各个调用方；
+    没有其它批次正在发送时立即发送，低并发时不增加延迟。
+    不使用后台线程，由队首请求所在的线程负责发送批次。
+    """
+
+    def __init__(
+        self,
+        embed_func: Callable[[List[str]], List[List[float]]],
+        max_wait: float = 0.005,
+        max_batch: int = 32,
+    ):
+        self.embed_func = embed_func
+        self.max_wait = max_wait
+        self.max_batch = max(max_batch, 1)
+        self._queue: List[_Request] = []
+        # 正在发送的批次数
+        self._inflight = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "max_batch_size": 0,
+            "wait_time": 0.0,
+            "embed_time": 0.0,
+            "errors": 0,
+        }
+
+    def embed(self, text: str) -> List[float]:
+        req = _Request(text)
+        with self._cond:
+            self._queue.append(req)
+            if len(self._queue) == 1:
+                req.lead = True
+            elif len(self._queue) >= self.max_batch:
+                self._cond.notify_all()
+        if not req.lead:
+            req.event.wait()
+        # 被提升为队首时 event 也会被设置，此时由本线程发送下一批
+        if req.lead:
+            self._lead()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _lead(self):
+        with self._cond:
+            deadline = time.perf_counter() + self.max_wait
+            while len(self._queue) < self.max_batch and self._inflight:
+                remain = deadline - time.perf_counter()
+                if remain <= 0:
+                    break
+                self._cond.wait(remain)
+            batch = self._queue[: self.max_batch]
+            del self._queue[: self.max_batch]
+            self._inflight += 1
+            if self._queue:
+                self._queue[0].lead = True
+                self._queue[0].event.set()
+
+        start = time.perf_counter()
+        try:
+            vectors = self.embed_func([req.text for req in batch])
+            if len(vectors) != len(batch):
+                raise RuntimeError(
+                    f"Embedding 模型返回了 {len(vectors)} 个向量，请求了 {len(batch)} 条文本"
+                )
+            error = None
+        except Exception as e:
+            vectors, error = [None] * len(batch), e
+        end = time.perf_counter()
+        with self._cond:
+            self._inflight -= 1
+            # 等待中的队首请求不必再等
+            self._cond.notify_all()
+
+        with self._stats_lock:
+            self._stats["requests"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+            self._stats["wait_time"] += sum(start - req.submitted for req in batch)
+            self._stats["embed_time"] += end - start
+            self._stats["errors"] += error is not None
+        for req, vector in zip(batch, vectors):
+            req.result, req.error = vector, error
+            req.event.set()
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        requests, batches = stats["requests"], stats["batches"]
+        stats.update(
+            max_wait=self.max_wait,
+            max_batch=self.max_batch,
+            avg_batch_size=requests / batches if batches else 0.0,
+            avg_wait_time=stats["wait_time"] / requests if requests else 0.0,
+            avg_embed_time=stats["embed_time"] / batches if batches else 0.0,
+        )
+        return stats
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    embed_query 经 QueryBatcher 与其它线程的并发查询合并为批量请求，其它方法直接透传。
+    只用于查询与文档使用相同处理方式的 Embeddings（如 LocalAIEmbeddings）。
+    """
+
+    def __init__(self, embeddings: Embeddings, batcher: QueryBatcher):
+        self.embeddings = embeddings
+        self.batcher = batcher
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__dict__["embeddings"], name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.embed(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # 查询与文档处理方式相同，多条查询直接作为一个批次发送，不必经过 QueryBatcher 等待
+        return self.embeddings.embed_documents(texts)
+
+
+# key -> (创建时的模型配置, QueryBatcher)
+_batchers: Dict[str, Tuple[Any, QueryBatcher]] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_query_batcher(key: str, embeddings: Embeddings, config: Any = None) -> QueryBatcher:
+    """
+    同一模型共享一个 QueryBatcher，批次使用创建时的 embeddings 发送。
+    config 为模型配置对象，与创建时不是同一对象（配置已重新加载）时重新创建，原有的批次照常完成
+    """
+    with _batchers_lock:
+        cached = _batchers.get(key)
+        if cached is None or cached[0] is not config:
+            batcher = QueryBatcher(
+                embeddings.embed_documents,
+                max_wait=Settings.model_settings.EMBEDDING_BATCH_WAIT / 1000,
+                max_batch=Settings.model_settings.EMBEDDING_BATCH_SIZE,
+            )
+            _batchers[key] = (config, batcher)
+            return batcher
+        return cached[1]
+
+
+def batcher_stats() -> Dict[str, Dict]:
+    with _batchers_lock:
+        return {key: batcher.stats() for key, (_, batcher) in _batchers.items()}
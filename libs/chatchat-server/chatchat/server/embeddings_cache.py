@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from chatchat.settings import Settings
+from chatchat.server.embeddings_batcher import BatchingEmbeddings
+
+# 每个缓存条目除向量外的大致开销（键、OrderedDict 节点等）
+_ENTRY_OVERHEAD = 200
+
+# 当前线程中可以直接复用的文档向量：(embed_model, {文本哈希: 向量})
+_reused_vectors: ContextVar[Optional[tuple]] = ContextVar("reused_vectors", default=None)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+@contextmanager
+def reusing_embeddings(embed_model: str, vectors: Dict[str, Sequence[float]]):
+    """
+    在此范围内，embed_model 的 embed_documents 对哈希在 vectors 中的文本直接返回已有向量，
+    用于重建向量库或更新文件时复用未变化文本的向量
+    """
+    token = _reused_vectors.set((embed_model, vectors) if vectors else None)
+    try:
+        yield
+    finally:
+        _reused_vectors.reset(token)
+
+
+class EmbeddingCache:
+    """
+    进程内共享的 Embedding 向量 LRU 缓存，按占用字节数限制大小；
+    可选地同时缓存到 sqlite 文件中，超过磁盘上限时删除最早写入的条目。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        disk_path: str = None,
+        max_disk_bytes: int = 0,
+    ):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self.max_disk_bytes = max_disk_bytes
+        if disk_path and max_disk_bytes > 0:
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            # 删除条目后用 incremental_vacuum 归还空间，不需要重写整个文件的 VACUUM。
+            # 已有的数据库文件需要 VACUUM 一次才能切换，只在启动时进行
+            if self._db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                self._db.execute("VACUUM")
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._db.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or self._db is not None
+
+    @staticmethod
+    def make_key(embed_model: str, kind: str, text: str) -> str:
+        return f"{embed_model}:{kind}:{text_hash(text)}"
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        if not self.enabled:
+            return [None] * len(keys)
+        results = []
+        missed = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                else:
+                    missed.append(i)
+                results.append(vector)
+
+        if missed and self._db is not None:
+            found = self._load_from_disk([keys[i] for i in missed])
+            for i in missed:
+                if (vector := found.get(keys[i])) is not None:
+                    results[i] = vector
+                    self._put(keys[i], vector)
+                    self.disk_hits += 1
+        with self._lock:
+            self.misses += sum(1 for x in results if x is None)
+        return results
+
+    def set_many(self, items: Dict[str, np.ndarray]):
+        for key, vector in items.items():
+            self._put(key, vector)
+        if self._db is not None and items:
+            with self._lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in items.items()],
+                )
+                self._db.commit()
+                self._prune_disk()
+
+    def _put(self, key: str, vector: np.ndarray):
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            if (old := self._cache.pop(key, None)) is not None:
+                self.nbytes -= old.nbytes + _ENTRY_OVERHEAD
+            self._cache[key] = vector
+            self.nbytes += vector.nbytes + _ENTRY_OVERHEAD
+            while self.nbytes > self.max_bytes and self._cache:
+                _, old = self._cache.popitem(last=False)
+                self.nbytes -= old.nbytes + _ENTRY_OVERHEAD
+
+    def _load_from_disk(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _prune_disk(self):
+        page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self._db.execute("PRAGMA page_count").fetchone()[0]
+        free_count = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+        if page_size * (page_count - free_count) <= self.max_disk_bytes:
+            return
+        count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        # 删除最早写入的 1/4
+        self._db.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)",
+            (max(1, count // 4),),
+        )
+        self._db.commit()
+        # 只截断空闲页，耗时与删除的数据量成正比。该 PRAGMA 每一步只释放一页，须用 executescript 执行完
+        self._db.executescript("PRAGMA incremental_vacuum;")
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.nbytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    为 get_Embeddings 返回的 Embeddings 加上缓存：相同模型、相同文本只调用一次 Embedding 模型。
+    embed_query 与 embed_documents 分别缓存（部分模型对查询文本有不同的处理）。
+    """
+
+    def __init__(self, embeddings: Embeddings, embed_model: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.embed_model = embed_model
+        self.cache = cache
+
+    def __getattr__(self, name: str) -> Any:
+        # 其它属性（如 model、chunk_size）透传给实际的 Embeddings
+        return getattr(self.__dict__["embeddings"], name)
+
+    def _embed(self, texts: List[str], kind: str) -> List[List[float]]:
+        keys = [self.cache.make_key(self.embed_model, kind, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        reused = _reused_vectors.get()
+        if kind == "doc" and reused is not None and reused[0] == self.embed_model:
+            for i, (text, vector) in enumerate(zip(texts, vectors)):
+                if vector is None and (found := reused[1].get(text_hash(text))) is not None:
+                    vectors[i] = np.asarray(found, dtype=np.float32)
+        # 同一批次中重复的文本只计算一次
+        missing: Dict[str, str] = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        if missing:
+            from chatchat.server.embeddings_health import embed_health, is_unavailable_error
+
+            try:
+                if kind == "query":
+                    embedded = embed_queries(self.embeddings, list(missing.values()))
+                else:
+                    embedded = self.embeddings.embed_documents(list(missing.values()))
+            except Exception as e:
+                if is_unavailable_error(e):
+                    embed_health.report_failure(self.embed_model, e)
+                raise
+            embed_health.report_success(self.embed_model)
+            new = {
+                key: np.asarray(vector, dtype=np.float32)
+                for key, vector in zip(missing, embedded)
+            }
+            self.cache.set_many(new)
+            vectors = [new[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+        return [vector.tolist() for vector in vectors]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts), "doc")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query")[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts), "query")
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    按查询语义（embed_query）计算多条文本的向量，用于批量检索。
+    Embeddings 提供 embed_queries 时一次完成（如 CachedEmbeddings、BatchingEmbeddings），否则逐条调用 embed_query
+    """
+    if isinstance(embeddings, (CachedEmbeddings, BatchingEmbeddings)):
+        return embeddings.embed_queries(texts)
+    return [embeddings.embed_query(text) for text in texts]
+
+
+embedding_cache = EmbeddingCache(
+    max_bytes=int(Settings.model_settings.EMBEDDING_CACHE_SIZE * 1024 * 1024),
+    disk_path=str(Settings.basic_settings.DATA_PATH / "cache" / "embeddings.db"),
+    max_disk_bytes=int(Settings.model_settings.EMBEDDING_CACHE_DISK_SIZE * 1024 * 1024),
+)
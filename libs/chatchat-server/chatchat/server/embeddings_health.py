@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+import httpx
+import openai
+import requests
+
+from chatchat.settings import Settings
+from chatchat.utils import build_logger
+
+logger = build_logger()
+
+
+def is_unavailable_error(error: BaseException) -> bool:
+    """
+    连接失败、超时、限流（429）与服务端错误（5xx）说明模型服务不可用；
+    其它错误（如输入过长等 4xx 错误、解析结果出错）与服务是否可用无关
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status_code, int):
+        return status_code == 429 or status_code >= 500
+    return isinstance(
+        error,
+        (
+            ConnectionError,
+            TimeoutError,
+            openai.APIConnectionError,
+            httpx.TransportError,
+            requests.ConnectionError,
+            requests.Timeout,
+        ),
+    )
+
+
+class EmbedHealthRegistry:
+    """
+    Embedding 模型可用性的缓存。
+    每个模型首次检查时同步探测一次，之后返回缓存的状态；状态超过 ttl 秒后在后台线程中重新探测，
+    探测完成前仍返回旧状态。实际的 Embedding 调用成功或因服务不可用而失败时（见 is_unavailable_error）
+    通过 report_success/report_failure 更新状态，
+    因此检索等请求中不会再额外调用 Embedding 模型。ttl <= 0 时每次检查都同步探测。
+    """
+
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        # embed_model -> (是否可用, 错误信息, 更新时间)
+        self._status: Dict[str, Tuple[bool, str, float]] = {}
+        self._refreshing: Set[str] = set()
+        self._lock = threading.Lock()
+        self._probe_locks: Dict[str, threading.Lock] = {}
+        self.probes = 0
+
+    def _probe(self, embed_model: str) -> Tuple[bool, str]:
+        from chatchat.server.utils import get_Embeddings
+
+        self.probes += 1
+        try:
+            embeddings = get_Embeddings(embed_model=embed_model, cache=False)
+            embeddings.embed_query("this is a test")
+            self.report_success(embed_model)
+            return True, ""
+        except Exception as e:
+            return False, self.report_failure(embed_model, e)
+
+    def _probe_lock(self, embed_model: str) -> threading.Lock:
+        with self._lock:
+            return self._probe_locks.setdefault(embed_model, threading.Lock())
+
+    def _refresh_in_background(self, embed_model: str):
+        with self._lock:
+            if embed_model in self._refreshing:
+                return
+            self._refreshing.add(embed_model)
+
+        def refresh():
+            try:
+                self._probe(embed_model)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(embed_model)
+
+        threading.Thread(target=refresh, name="embed-health", daemon=True).start()
+
+    def check(self, embed_model: str) -> Tuple[bool, str]:
+        if self.ttl <= 0:
+            return self._probe(embed_model)
+        status = self._status.get(embed_model)
+        if status is None:
+            # 同一模型的并发首次检查只探测一次
+            with self._probe_lock(embed_model):
+                if (status := self._status.get(embed_model)) is None:
+                    return self._probe(embed_model)
+        ok, msg, updated = status
+        if time.time() - updated > self.ttl:
+            self._refresh_in_background(embed_model)
+        return ok, msg
+
+    def report_success(self, embed_model: str):
+        self._status[embed_model] = (True, "", time.time())
+
+    def report_failure(self, embed_model: str, error: Exception) -> str:
+        msg = f"failed to access embed model '{embed_model}': {error}"
+        logger.error(msg)
+        self._status[embed_model] = (False, msg, time.time())
+        return msg
+
+    def status(self, embed_model: str) -> Optional[Tuple[bool, str, float]]:
+        return self._status.get(embed_model)
+
+
+embed_health = EmbedHealthRegistry(ttl=Settings.model_settings.EMBEDDING_HEALTH_TTL)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 
 from abc import ABCMeta, abstractmethod
+from typing import Dict
 
 from langchain.vectorstores import VectorStore
 
@@ -19,6 +20,7 @@ class BaseRetrieverService(metaclass=ABCMeta):
         vectorstore: VectorStore,
         top_k: int,
         score_threshold: int | float,
+        search_kwargs: Dict = None,
     ):
         pass
 
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import heapq
+import math
+import os
+import pickle
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain.docstore.document import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from chatchat.server.knowledge_base.kb_cache.metadata_index import match_metadata
+
+
+def default_preprocessing_func(text: str) -> List[str]:
+    # 延迟导入 jieba，避免模块加载时初始化词典
+    import jieba
+
+    return jieba.lcut_for_search(text)
+
+
+class BM25Index:
+    """
+    可增量维护的 BM25 倒排索引。
+    文档以 id 标识，支持增删与落盘，检索时只需对 query 分词。
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        k1: float = 1.5,
+        b: float = 0.75,
+        preprocess_func: Callable[[str], List[str]] = default_preprocessing_func,
+    ):
+        self.k1 = k1
+        self.b = b
+        self.preprocess_func = preprocess_func
+        # term -> {doc_id: term frequency}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        # doc_id -> (doc length, terms of the doc)
+        self.docs: Dict[str, Tuple[int, Tuple[str, ...]]] = {}
+        self.total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.docs
+
+    def _tokenize(self, text: str) -> List[str]:
+        return [t for t in self.preprocess_func(text) if t.strip()]
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]):
+        for id, text in zip(ids, texts):
+            if id in self.docs:
+                self.delete([id])
+            tokens = self._tokenize(text)
+            tf = Counter(tokens)
+            for term, freq in tf.items():
+                self.postings.setdefault(term, {})[id] = freq
+            self.docs[id] = (len(tokens), tuple(tf))
+            self.total_len += len(tokens)
+
+    def delete(self, ids: Iterable[str]):
+        for id in ids:
+            if (item := self.docs.pop(id, None)) is None:
+                continue
+            length, terms = item
+            self.total_len -= length
+            for term in terms:
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(id, None)
+                    if not posting:
+                        del self.postings[term]
+
+    def clear(self):
+        self.postings.clear()
+        self.docs.clear()
+        self.total_len = 0
+
+    def idf(self, term: str) -> float:
+        n = len(self.postings.get(term, ()))
+        return math.log((len(self.docs) - n + 0.5) / (n + 0.5) + 1)
+
+    def get_scores(self, query: str) -> Dict[str, float]:
+        """
+        返回包含 query 中任一词项的文档及其 BM25 得分
+        """
+        if not self.docs:
+            return {}
+        avgdl = self.total_len / len(self.docs) or 1.0
+        scores: Dict[str, float] = {}
+        for term in self._tokenize(query):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf(term)
+            for id, freq in posting.items():
+                dl = self.docs[id][0]
+                denom = freq + self.k1 * (1 - self.b + self.b * dl / avgdl)
+                scores[id] = scores.get(id, 0.0) + idf * freq * (self.k1 + 1) / denom
+        return scores
+
+    def search(
+        self, query: str, k: int = 4, ids: Optional[Set[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        ids: 只在这些文档中检索
+        """
+        scores = self.get_scores(query)
+        if ids is not None:
+            scores = {id: score for id, score in scores.items() if id in ids}
+        return heapq.nlargest(k, scores.items(), key=lambda x: x[1])
+
+    def save(self, path: str):
+        state = {
+            "version": self.VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "postings": self.postings,
+            "docs": self.docs,
+            "total_len": self.total_len,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as fp:
+            pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        preprocess_func: Callable[[str], List[str]] = default_preprocessing_func,
+    ) -> Optional["BM25Index"]:
+        """
+        从文件加载索引，文件不存在或版本不匹配时返回 None
+        """
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as fp:
+            state = pickle.load(fp)
+        if state.get("version") != cls.VERSION:
+            return None
+        index = cls(k1=state["k1"], b=state["b"], preprocess_func=preprocess_func)
+        index.postings = state["postings"]
+        index.docs = state["docs"]
+        index.total_len = state["total_len"]
+        return index
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """
+    基于 BM25Index 的关键词检索器，文档内容从向量库的 docstore 中按 id 获取。
+    ids 限定检索范围；filter 为无法转换成 ids 的 metadata 过滤条件，检索后逐个过滤
+    """
+
+    index: Any
+    docstore: Any
+    k: int = 4
+    ids: Optional[Set[str]] = None
+    filter: Optional[Dict[str, Any]] = None
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+    ) -> List[Document]:
+        k = self.k if self.filter is None else len(self.index)
+        docs = []
+        for id, _ in self.index.search(query, k, ids=self.ids):
+            doc = self.docstore.search(id)
+            if not isinstance(doc, Document):
+                continue
+            if self.filter is not None and not match_metadata(doc.metadata, self.filter):
+                continue
+            docs.append(doc)
+            if len(docs) >= self.k:
+                break
+        return docs
@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+from typing import Dict, List
+
+from langchain.docstore.document import Document
 from langchain.retrievers import EnsembleRetriever
 from langchain.vectorstores import VectorStore
 from langchain_community.retrievers import BM25Retriever
 from langchain_core.retrievers import BaseRetriever
 
 from chatchat.server.file_rag.retrievers.base import BaseRetrieverService
+from chatchat.server.file_rag.retrievers.bm25 import BM25IndexRetriever
+from chatchat.server.knowledge_base.kb_cache.metadata_index import match_metadata
 
 
 class EnsembleRetrieverService(BaseRetrieverService):
@@ -23,22 +28,43 @@ class EnsembleRetrieverService(BaseRetrieverService):
         vectorstore: VectorStore,
         top_k: int,
         score_threshold: int | float,
+        search_kwargs: Dict = None,
     ):
         faiss_retriever = vectorstore.as_retriever(
             search_type="similarity_score_threshold",
-            search_kwargs={"score_threshold": score_threshold, "k": top_k},
-        )
-        # TODO: 换个不用torch的实现方式
-        # from cutword.cutword import Cutter
-        import jieba
-
-        # cutter = Cutter()
-        docs = list(vectorstore.docstore._dict.values())
-        bm25_retriever = BM25Retriever.from_documents(
-            docs,
-            preprocess_func=jieba.lcut_for_search,
+            search_kwargs={
+                "score_threshold": score_threshold,
+                "k": top_k,
+                **(search_kwargs or {}),
+            },
         )
-        bm25_retriever.k = top_k
+        filter = (search_kwargs or {}).get("filter")
+        if (bm25_index := getattr(vectorstore, "bm25_index", None)) is not None:
+            # 向量库维护了持久化的 BM25 索引，检索时只需对 query 分词
+            ids = None
+            if filter and hasattr(vectorstore, "get_ids_by_metadata"):
+                ids = vectorstore.get_ids_by_metadata(filter)
+            bm25_retriever = BM25IndexRetriever(
+                index=bm25_index,
+                docstore=vectorstore.docstore,
+                k=top_k,
+                ids=ids,
+                filter=filter if filter and ids is None else None,
+            )
+        else:
+            # TODO: 换个不用torch的实现方式
+            # from cutword.cutword import Cutter
+            import jieba
+
+            # cutter = Cutter()
+            docs = list(vectorstore.docstore._dict.values())
+            if filter:
+                docs = [doc for doc in docs if match_metadata(doc.metadata, filter)]
+            bm25_retriever = BM25Retriever.from_documents(
+                docs,
+                preprocess_func=jieba.lcut_for_search,
+            )
+            bm25_retriever.k = top_k
         ensemble_retriever = EnsembleRetriever(
             retrievers=[bm25_retriever, faiss_retriever], weights=[0.5, 0.5]
         )
@@ -46,3 +72,18 @@ class EnsembleRetrieverService(BaseRetrieverService):
 
     def get_relevant_documents(self, query: str):
         return self.retriever.get_relevant_documents(query)[: self.top_k]
+
+    def get_relevant_documents_batch(
+        self, queries: List[str], vector_docs: List[List[Document]]
+    ) -> List[List[Document]]:
+        """
+        vector_docs 为批量向量检索的结果，只对每个 query 执行 BM25 检索后融合
+        """
+        bm25_retriever = self.retriever.retrievers[0]
+        results = []
+        for query, docs in zip(queries, vector_docs):
+            fused = self.retriever.weighted_reciprocal_rank(
+                [bm25_retriever.invoke(query), docs]
+            )
+            results.append(fused[: self.top_k])
+        return results
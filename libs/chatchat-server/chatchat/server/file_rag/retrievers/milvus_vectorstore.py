@@ -12,7 +12,7 @@ from langchain_core.callbacks.manager import (
         CallbackManagerForRetrieverRun
 )
 
-from typing import List
+from typing import Dict, List
 
 class MilvusRetriever(VectorStoreRetriever):
     def _get_relevant_documents(
@@ -110,10 +110,12 @@ class MilvusVectorstoreRetrieverService(BaseRetrieverService):
         vectorstore: VectorStore,
         top_k: int,
         score_threshold: int or float,
+        search_kwargs: Dict = None,
     ):
         retriever = MilvusRetriever(vectorstore=vectorstore, 
                                     search_type="similarity_score_threshold",
-                                    search_kwargs={"score_threshold": score_threshold, "k": top_k}
+                                    search_kwargs={"score_threshold": score_threshold, "k": top_k,
+                                                   **(search_kwargs or {})}
                                     )
         
         return MilvusVectorstoreRetrieverService(retriever=retriever, top_k=top_k)
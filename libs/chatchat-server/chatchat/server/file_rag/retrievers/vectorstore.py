@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 
+from typing import Dict
+
 from langchain.vectorstores import VectorStore
 from langchain_core.retrievers import BaseRetriever
 
@@ -22,10 +24,15 @@ class VectorstoreRetrieverService(BaseRetrieverService):
         vectorstore: VectorStore,
         top_k: int,
         score_threshold: int | float,
+        search_kwargs: Dict = None,
     ):
         retriever = vectorstore.as_retriever(
             search_type="similarity_score_threshold",
-            search_kwargs={"score_threshold": score_threshold, "k": top_k},
+            search_kwargs={
+                "score_threshold": score_threshold,
+                "k": top_k,
+                **(search_kwargs or {}),
+            },
         )
         return VectorstoreRetrieverService(retriever=retriever, top_k=top_k)
 
@@ -23,6 +23,11 @@ def create_kb(
     vector_store_type: str = Body(Settings.kb_settings.DEFAULT_VS_TYPE),
     kb_info: str = Body("", description="知识库内容简介，用于Agent选择知识库。"),
     embed_model: str = Body(get_default_embedding()),
+    index_spec: dict = Body(
+        {},
+        description="向量索引参数，目前仅 faiss 支持，如 {\"index_type\": \"hnsw\"}，"
+                    "可选 flat/hnsw/ivf_flat/ivf_pq，未指定的参数使用 kbs_config 中的默认值",
+    ),
 ) -> BaseResponse:
     # Create selected knowledge base
     if not validate_kb_name(knowledge_base_name):
@@ -34,10 +39,14 @@ def create_kb(
     if kb is not None:
         return BaseResponse(code=404, msg=f"已存在同名知识库 {knowledge_base_name}")
 
-    kb = KBServiceFactory.get_service(
-        knowledge_base_name, vector_store_type, embed_model, kb_info=kb_info
-    )
     try:
+        kb = KBServiceFactory.get_service(
+            knowledge_base_name,
+            vector_store_type,
+            embed_model,
+            kb_info=kb_info,
+            index_spec=index_spec,
+        )
         kb.create_kb()
     except Exception as e:
         msg = f"创建知识库出错： {e}"
@@ -71,3 +80,43 @@ def delete_kb(
         return BaseResponse(code=500, msg=msg)
 
     return BaseResponse(code=500, msg=f"删除知识库失败 {knowledge_base_name}")
+
+
+def kb_cache_stats() -> BaseResponse:
+    # FAISS 向量库缓存的命中/淘汰/加载统计，以及检索结果、Embedding 缓存和查询合并统计
+    from chatchat.server.knowledge_base.kb_cache.faiss_cache import (
+        kb_faiss_pool,
+        memo_faiss_pool,
+    )
+    from chatchat.server.knowledge_base.kb_cache.search_cache import search_result_cache
+    from chatchat.server.embeddings_batcher import batcher_stats
+    from chatchat.server.embeddings_cache import embedding_cache
+
+    return BaseResponse(
+        data={
+            "kb_faiss_pool": kb_faiss_pool.stats(),
+            "memo_faiss_pool": memo_faiss_pool.stats(),
+            "search_result_cache": search_result_cache.stats(),
+            "embedding_cache": embedding_cache.stats(),
+            "embedding_batchers": batcher_stats(),
+        }
+    )
+
+
+def pin_kb(
+    knowledge_base_name: str = Body(..., examples=["samples"]),
+    pinned: bool = Body(True, description="True 为常驻内存，False 为取消常驻"),
+) -> BaseResponse:
+    # 设置 FAISS 知识库是否常驻内存
+    from chatchat.server.knowledge_base.kb_cache.faiss_cache import kb_faiss_pool
+
+    if not validate_kb_name(knowledge_base_name):
+        return BaseResponse(code=403, msg="Don't attack me")
+    if KBServiceFactory.get_service_by_name(knowledge_base_name) is None:
+        return BaseResponse(code=404, msg=f"未找到知识库 {knowledge_base_name}")
+
+    if pinned:
+        kb_faiss_pool.pin(knowledge_base_name)
+        return BaseResponse(code=200, msg=f"知识库 {knowledge_base_name} 已设为常驻内存")
+    kb_faiss_pool.unpin(knowledge_base_name)
+    return BaseResponse(code=200, msg=f"已取消知识库 {knowledge_base_name} 的常驻内存")
@@ -1,7 +1,8 @@
 import threading
+import time
 from collections import OrderedDict
 from contextlib import contextmanager
-from typing import Any, List, Tuple, Union, Generator
+from typing import Any, Dict, Generator, Iterable, List, Optional, Set, Tuple, Union
 
 from langchain.embeddings.base import Embeddings
 from langchain.vectorstores.faiss import FAISS
@@ -12,6 +13,73 @@ from chatchat.utils import build_logger
 logger = build_logger()
 
 
+class RWLock:
+    """
+    可重入的读写锁，写者优先：有写者等待时新的读者会被阻塞，避免持续检索导致写入饥饿。
+    持有写锁的线程可以再次获取读锁或写锁；持有读锁的线程不能升级为写锁。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers: Dict[int, int] = {}
+        self._writer: Optional[int] = None
+        self._writer_count = 0
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_count += 1
+                return
+            if me not in self._readers:
+                while self._writer is not None or self._writers_waiting:
+                    self._cond.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_count -= 1
+                return
+            count = self._readers.get(me, 0) - 1
+            if count < 0:
+                raise RuntimeError("cannot release un-acquired read lock")
+            if count == 0:
+                del self._readers[me]
+                if not self._readers:
+                    self._cond.notify_all()
+            else:
+                self._readers[me] = count
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_count += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("cannot upgrade a read lock to write lock")
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+            self._writer_count = 1
+
+    def release_write(self):
+        with self._cond:
+            if self._writer != threading.get_ident():
+                raise RuntimeError("cannot release un-acquired write lock")
+            self._writer_count -= 1
+            if self._writer_count == 0:
+                self._writer = None
+                self._cond.notify_all()
+
+
 class ThreadSafeObject:
     def __init__(
         self, key: Union[str, Tuple], obj: Any = None, pool: "CachePool" = None
@@ -19,8 +87,10 @@ class ThreadSafeObject:
         self._obj = obj
         self._key = key
         self._pool = pool
-        self._lock = threading.RLock()
+        self._lock = RWLock()
         self._loaded = threading.Event()
+        # 对象占用内存的估计值（字节），每次独占操作结束、释放锁之前更新
+        self.nbytes = 0
 
     def __repr__(self) -> str:
         cls = type(self).__name__
@@ -31,17 +101,43 @@ class ThreadSafeObject:
         return self._key
 
     @contextmanager
-    def acquire(self, owner: str = "", msg: str = "") -> Generator[None, None, FAISS]:
+    def acquire(
+        self, owner: str = "", msg: str = "", shared: bool = False
+    ) -> Generator[None, None, FAISS]:
+        """
+        获取对象的使用权。shared=True 时获取共享（读）锁，多个只读操作（如检索）可以并发执行；
+        否则获取独占（写）锁。
+        """
         owner = owner or f"thread {threading.get_native_id()}"
+        if shared:
+            acquire, release = self._lock.acquire_read, self._lock.release_read
+        else:
+            acquire, release = self._lock.acquire_write, self._lock.release_write
+        acquire()
         try:
-            self._lock.acquire()
             if self._pool is not None:
-                self._pool._cache.move_to_end(self.key)
+                self._pool.touch(self.key)
             logger.debug(f"{owner} 开始操作：{self.key}。{msg}")
             yield self._obj
         finally:
             logger.debug(f"{owner} 结束操作：{self.key}。{msg}")
-            self._lock.release()
+            try:
+                if not shared and self._pool is not None:
+                    # 释放独占锁之前更新内存估计，避免与其它线程的写入交错
+                    self.nbytes = self.get_nbytes()
+            finally:
+                release()
+        if not shared and self._pool is not None:
+            self._pool.check_limits()
+
+    def get_nbytes(self) -> int:
+        """
+        估算对象占用的内存，供缓存池按内存上限淘汰，子类按需实现
+        """
+        return 0
+
+    def is_loaded(self) -> bool:
+        return self._loaded.is_set()
 
     def start_loading(self):
         self._loaded.clear()
@@ -62,18 +158,151 @@ class ThreadSafeObject:
 
 
 class CachePool:
-    def __init__(self, cache_num: int = -1):
+    """
+    按最近最少使用（LRU）淘汰的对象缓存池。
+    cache_num 限制缓存数量，max_bytes 限制缓存对象估计占用的内存总量（<=0 表示不限制）；
+    pinned 中的对象常驻内存不会被淘汰，键为元组时以第一个元素（如知识库名称）匹配；
+    ttl > 0 时，空闲（未被访问）超过 ttl 秒的对象也会被淘汰。
+    """
+
+    def __init__(
+        self,
+        cache_num: int = -1,
+        max_bytes: int = 0,
+        pinned: Iterable[str] = (),
+        ttl: float = 0,
+    ):
         self._cache_num = cache_num
+        self._max_bytes = max_bytes
+        self._pinned: Set = set(pinned)
+        self._ttl = ttl
         self._cache = OrderedDict()
+        self._last_used: Dict = {}
+        # 已淘汰、on_evict 尚未处理完的对象
+        self._evicting: Dict = {}
         self.atomic = threading.RLock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "loads": 0,
+            "load_time": 0.0,
+        }
 
     def keys(self) -> List[str]:
         return list(self._cache.keys())
 
-    def _check_count(self):
-        if isinstance(self._cache_num, int) and self._cache_num > 0:
-            while len(self._cache) > self._cache_num:
-                self._cache.popitem(last=False)
+    def is_pinned(self, key: Union[str, Tuple]) -> bool:
+        if key in self._pinned:
+            return True
+        return isinstance(key, tuple) and bool(key) and key[0] in self._pinned
+
+    def pin(self, key: Union[str, Tuple]):
+        self._pinned.add(key)
+
+    def unpin(self, key: Union[str, Tuple]):
+        self._pinned.discard(key)
+        self.check_limits()
+
+    def touch(self, key: Union[str, Tuple]):
+        with self.atomic:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self._last_used[key] = time.time()
+
+    def total_bytes(self) -> int:
+        return sum(item.nbytes for item in self._cache.values())
+
+    def _over_limits(self) -> bool:
+        if isinstance(self._cache_num, int) and 0 < self._cache_num < len(self._cache):
+            return True
+        return 0 < self._max_bytes < self.total_bytes()
+
+    def _expired(self, key: Union[str, Tuple], now: float) -> bool:
+        return self._ttl > 0 and now - self._last_used.get(key, now) > self._ttl
+
+    def check_limits(self):
+        """
+        从最久未使用的对象开始淘汰空闲超时的对象，并淘汰至满足数量与内存上限。
+        常驻对象、正在加载的对象不会被淘汰，最近使用的对象只会因空闲超时被淘汰。
+        被淘汰的对象交给 on_evict 处理。
+        """
+        evicted = []
+        with self.atomic:
+            now = time.time()
+            candidates = list(self._cache.items())
+            for i, (key, item) in enumerate(candidates):
+                expired = self._expired(key, now)
+                if not expired and (i == len(candidates) - 1 or not self._over_limits()):
+                    break
+                if self.is_pinned(key) or (
+                    isinstance(item, ThreadSafeObject) and not item.is_loaded()
+                ):
+                    continue
+                self._cache.pop(key, None)
+                self._last_used.pop(key, None)
+                self._evicting[key] = item
+                evicted.append((key, item))
+                if expired:
+                    self._stats["expirations"] += 1
+                    logger.info(f"缓存对象空闲超过 {self._ttl} 秒，释放对象：{key}")
+                else:
+                    self._stats["evictions"] += 1
+                    logger.info(f"缓存已满，释放对象：{key}")
+            if self._over_limits():
+                logger.warning(
+                    f"缓存对象占用内存 {self.total_bytes() / 1024 / 1024:.1f} MB，"
+                    f"数量 {len(self._cache)}，无法淘汰至上限以内"
+                )
+        for key, item in evicted:
+            self.on_evict(key, item)
+
+    def on_evict(self, key: Union[str, Tuple], item: Any):
+        """
+        对象被淘汰后调用，子类可在此保存对象；处理完成后须调用 evict_done。
+        调用方可能持有 atomic，耗时或需要获取对象锁的操作应在其它线程中进行
+        """
+        self.evict_done(key, item)
+
+    def evict_done(self, key: Union[str, Tuple], item: Any):
+        with self.atomic:
+            if self._evicting.get(key) is item:
+                del self._evicting[key]
+
+    def record_hit(self):
+        self._stats["hits"] += 1
+
+    def record_miss(self):
+        self._stats["misses"] += 1
+
+    def record_load(self, seconds: float):
+        self._stats["loads"] += 1
+        self._stats["load_time"] += seconds
+
+    def stats(self) -> Dict:
+        """
+        返回缓存命中/未命中/淘汰/加载耗时等统计，以及各缓存对象的内存估计
+        """
+        with self.atomic:
+            items = [
+                {
+                    "key": key,
+                    "nbytes": getattr(item, "nbytes", 0),
+                    "pinned": self.is_pinned(key),
+                }
+                for key, item in self._cache.items()
+            ]
+        stats = dict(self._stats)
+        stats["avg_load_time"] = stats["load_time"] / stats["loads"] if stats["loads"] else 0.0
+        stats.update(
+            cache_num=self._cache_num,
+            max_bytes=self._max_bytes,
+            ttl=self._ttl,
+            total_bytes=sum(x["nbytes"] for x in items),
+            items=items,
+        )
+        return stats
 
     def get(self, key: str) -> ThreadSafeObject:
         if cache := self._cache.get(key):
@@ -82,21 +311,31 @@ class CachePool:
 
     def set(self, key: str, obj: ThreadSafeObject) -> ThreadSafeObject:
         self._cache[key] = obj
-        self._check_count()
+        self._last_used[key] = time.time()
+        self.check_limits()
         return obj
 
     def pop(self, key: str = None) -> ThreadSafeObject:
         if key is None:
-            return self._cache.popitem(last=False)
+            key, obj = self._cache.popitem(last=False)
+            self._last_used.pop(key, None)
+            return key, obj
         else:
+            self._last_used.pop(key, None)
             return self._cache.pop(key, None)
 
-    def acquire(self, key: Union[str, Tuple], owner: str = "", msg: str = ""):
+    def acquire(
+        self,
+        key: Union[str, Tuple],
+        owner: str = "",
+        msg: str = "",
+        shared: bool = False,
+    ):
         cache = self.get(key)
         if cache is None:
             raise RuntimeError(f"请求的资源 {key} 不存在")
         elif isinstance(cache, ThreadSafeObject):
-            self._cache.move_to_end(key)
-            return cache.acquire(owner=owner, msg=msg)
+            self.touch(key)
+            return cache.acquire(owner=owner, msg=msg, shared=shared)
         else:
             return cache
@@ -0,0 +1,492 @@
+import abc
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import struct
+import threading
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from langchain.docstore.base import AddableMixin, Docstore
+from langchain.docstore.document import Document
+
+from chatchat.utils import build_logger
+
+
+logger = build_logger()
+
+
+def _dump_metadata(metadata: Dict) -> str:
+    return json.dumps(metadata, ensure_ascii=False, default=str)
+
+
+def _import_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "Could not import zstandard python package. "
+            "Please install it with `pip install zstandard`."
+        )
+    return zstandard
+
+
+class _LazyDocDict(MutableMapping):
+    """
+    以 dict 接口访问磁盘文档库，兼容直接读写 docstore._dict 的代码，只有被访问的文档才会被读取
+    """
+
+    def __init__(self, docstore: "DiskDocstore"):
+        self._docstore = docstore
+
+    def __getitem__(self, id: str) -> Document:
+        doc = self._docstore.get(id)
+        if doc is None:
+            raise KeyError(id)
+        return doc
+
+    def __setitem__(self, id: str, doc: Document):
+        self._docstore.add({id: doc})
+
+    def __delitem__(self, id: str):
+        if id not in self:
+            raise KeyError(id)
+        self._docstore.delete([id])
+
+    def __contains__(self, id: object) -> bool:
+        return isinstance(id, str) and self._docstore.exists(id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._docstore.ids())
+
+    def __len__(self) -> int:
+        return self._docstore.count()
+
+    def items(self):
+        return self._docstore.iter_docs()
+
+    def values(self):
+        return (doc for _, doc in self._docstore.iter_docs())
+
+
+class DiskDocstore(Docstore, AddableMixin, abc.ABC):
+    """
+    保存在向量库目录中的文档库。
+    随 index.pkl 序列化时只保存文件名，加载向量库后通过 bind 重新指定所在目录。
+    子类须实现 get/ids 以及 AddableMixin 的 add/delete。
+    """
+
+    file_name: str
+
+    def __init__(self, folder_path: str = None):
+        self.folder_path = folder_path
+        self._dict = _LazyDocDict(self)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.folder_path, self.file_name)
+
+    def bind(self, folder_path: str):
+        self.close()
+        self.folder_path = folder_path
+
+    def close(self):
+        pass
+
+    def persist(self):
+        """
+        保存向量库时调用，将未落盘的数据写入磁盘
+        """
+        pass
+
+    def copy_to(self, folder_path: str):
+        """
+        将文档库文件复制到其它目录（另存向量库时使用）
+        """
+        shutil.copyfile(self.path, os.path.join(folder_path, self.file_name))
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def search(self, search: str) -> Union[str, Document]:
+        doc = self.get(search)
+        if doc is None:
+            return f"ID {search} not found."
+        doc.metadata["id"] = search
+        return doc
+
+    @abc.abstractmethod
+    def get(self, id: str) -> Union[Document, None]:
+        """
+        读取文档，不存在时返回 None
+        """
+
+    def mget(self, ids: List[str]) -> List[Union[Document, None]]:
+        return [self.get(id) for id in ids]
+
+    def exists(self, id: str) -> bool:
+        return self.get(id) is not None
+
+    @abc.abstractmethod
+    def ids(self) -> List[str]:
+        """
+        返回全部文档 id
+        """
+
+    def count(self) -> int:
+        return len(self.ids())
+
+    def iter_docs(self) -> Iterator[Tuple[str, Document]]:
+        for id in self.ids():
+            if (doc := self.get(id)) is not None:
+                yield id, doc
+
+
+class SQLiteDocstore(DiskDocstore):
+    """
+    基于 SQLite 的文档库，文档按需读取，写入即落盘
+    """
+
+    file_name = "docstore.db"
+
+    def __init__(self, folder_path: str = None):
+        super().__init__(folder_path)
+        self._local = threading.local()
+        self._conns = []
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # sqlite 连接不能跨线程使用，每个线程使用各自的连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.folder_path, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs "
+                "(id TEXT PRIMARY KEY, page_content TEXT, metadata TEXT)"
+            )
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+        self._local = threading.local()
+
+    def copy_to(self, folder_path: str):
+        dest = sqlite3.connect(os.path.join(folder_path, self.file_name))
+        try:
+            self.conn.backup(dest)
+        finally:
+            dest.close()
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        with self.conn as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO docs (id, page_content, metadata) VALUES (?, ?, ?)",
+                [
+                    (id, doc.page_content, _dump_metadata(doc.metadata))
+                    for id, doc in texts.items()
+                ],
+            )
+
+    def delete(self, ids: List) -> None:
+        with self.conn as conn:
+            conn.executemany("DELETE FROM docs WHERE id = ?", [(id,) for id in ids])
+
+    def get(self, id: str) -> Union[Document, None]:
+        row = self.conn.execute(
+            "SELECT page_content, metadata FROM docs WHERE id = ?", (id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def mget(self, ids: List[str]) -> List[Union[Document, None]]:
+        docs = {}
+        for i in range(0, len(ids), 500):
+            batch = ids[i : i + 500]
+            rows = self.conn.execute(
+                "SELECT id, page_content, metadata FROM docs WHERE id IN "
+                f"({','.join('?' * len(batch))})",
+                batch,
+            )
+            for id, page_content, metadata in rows:
+                docs[id] = Document(page_content=page_content, metadata=json.loads(metadata))
+        return [docs.get(id) for id in ids]
+
+    def exists(self, id: str) -> bool:
+        row = self.conn.execute("SELECT 1 FROM docs WHERE id = ?", (id,)).fetchone()
+        return row is not None
+
+    def ids(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT id FROM docs")]
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def iter_docs(self) -> Iterator[Tuple[str, Document]]:
+        rows = self.conn.execute("SELECT id, page_content, metadata FROM docs")
+        for id, page_content, metadata in rows:
+            yield id, Document(page_content=page_content, metadata=json.loads(metadata))
+
+
+class FileDocstore(DiskDocstore):
+    """
+    追加写入的文档库：文档依次追加到 docstore.data，内存中只保留 id -> 偏移位置的索引，读取时按偏移读出单个文档。
+    删除文档时追加删除标记；保存向量库时写出偏移索引 docstore.idx，无效数据过多时压缩数据文件。
+    compress=True 时使用 zstd 压缩新写入的文档（需要安装 zstandard）。
+    """
+
+    file_name = "docstore.data"
+    index_file_name = "docstore.idx"
+    # id 长度、内容长度、标记位
+    HEADER = struct.Struct("<IIB")
+    FLAG_COMPRESSED = 1
+    FLAG_DELETED = 2
+    # 无效数据占比超过该值时，保存时压缩数据文件
+    COMPACT_RATIO = 0.5
+
+    def __init__(self, folder_path: str = None, compress: bool = False):
+        super().__init__(folder_path)
+        self.compress = compress
+        self._lock = threading.RLock()
+        self._offsets: Optional[Dict[str, Tuple[int, int, int]]] = None
+        self._garbage = 0
+        self._reader = None
+        self._writer = None
+
+    def __getstate__(self):
+        return {"compress": self.compress}
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.folder_path, self.index_file_name)
+
+    @property
+    def offsets(self) -> Dict[str, Tuple[int, int, int]]:
+        if self._offsets is None:
+            with self._lock:
+                if self._offsets is None:
+                    self._load_offsets()
+        return self._offsets
+
+    def _load_offsets(self):
+        """
+        读取偏移索引，再扫描索引保存之后追加的记录
+        """
+        offsets, garbage, start = {}, 0, 0
+        if os.path.isfile(self.index_path) and os.path.isfile(self.path):
+            with open(self.index_path, "rb") as fp:
+                state = pickle.load(fp)
+            if state["size"] <= os.path.getsize(self.path):
+                offsets, garbage, start = state["offsets"], state["garbage"], state["size"]
+        if os.path.isfile(self.path):
+            with open(self.path, "r+b") as fp:
+                fp.seek(start)
+                garbage += self._scan(fp, offsets)
+        self._offsets, self._garbage = offsets, garbage
+
+    def _scan(self, fp, offsets: Dict) -> int:
+        """
+        从当前位置扫描记录，更新 offsets，返回无效数据的大小。
+        文件末尾有写入中断的残缺记录时将其截断，避免之后追加的记录接在残缺数据之后
+        """
+        garbage = 0
+        file_size = os.fstat(fp.fileno()).st_size
+        while True:
+            start = fp.tell()
+            header = fp.read(self.HEADER.size)
+            if not header:
+                break
+            if len(header) == self.HEADER.size:
+                id_len, size, flags = self.HEADER.unpack(header)
+                offset = start + self.HEADER.size + id_len
+                id_bytes = fp.read(id_len)
+            if len(header) < self.HEADER.size or offset + size > file_size:
+                logger.warning(f"文档库 {self.path} 末尾有 {file_size - start} 字节残缺数据，已截断")
+                fp.truncate(start)
+                break
+            id = id_bytes.decode()
+            fp.seek(size, os.SEEK_CUR)
+            if id in offsets:
+                garbage += self._record_size(id, offsets[id][1])
+            if flags & self.FLAG_DELETED:
+                garbage += self.HEADER.size + id_len
+                offsets.pop(id, None)
+            else:
+                offsets[id] = (offset, size, flags)
+        return garbage
+
+    def _record_size(self, id: str, size: int) -> int:
+        return self.HEADER.size + len(id.encode()) + size
+
+    def _encode(self, doc: Document) -> Tuple[bytes, int]:
+        data = json.dumps(
+            {"page_content": doc.page_content, "metadata": doc.metadata},
+            ensure_ascii=False,
+            default=str,
+        ).encode()
+        if self.compress:
+            return _import_zstd().ZstdCompressor().compress(data), self.FLAG_COMPRESSED
+        return data, 0
+
+    def _decode(self, data: bytes, flags: int) -> Document:
+        if flags & self.FLAG_COMPRESSED:
+            data = _import_zstd().ZstdDecompressor().decompress(data)
+        return Document(**json.loads(data))
+
+    def _append(self, records: List[Tuple[str, bytes, int]]):
+        offsets = self.offsets
+        if self._writer is None:
+            os.makedirs(self.folder_path, exist_ok=True)
+            self._writer = open(self.path, "ab")
+        pos = self._writer.tell()
+        buf = bytearray()
+        for id, data, flags in records:
+            id_bytes = id.encode()
+            if id in offsets:
+                self._garbage += self._record_size(id, offsets[id][1])
+            buf += self.HEADER.pack(len(id_bytes), len(data), flags) + id_bytes
+            if flags & self.FLAG_DELETED:
+                self._garbage += self.HEADER.size + len(id_bytes)
+                offsets.pop(id, None)
+            else:
+                offsets[id] = (pos + len(buf), len(data), flags)
+            buf += data
+        self._writer.write(buf)
+        self._writer.flush()
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        with self._lock:
+            self._append([(id, *self._encode(doc)) for id, doc in texts.items()])
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            offsets = self.offsets
+            self._append([(id, b"", self.FLAG_DELETED) for id in ids if id in offsets])
+
+    def _read(self, offset: int, size: int) -> bytes:
+        if self._reader is None:
+            self._reader = open(self.path, "rb")
+        self._reader.seek(offset)
+        return self._reader.read(size)
+
+    def get(self, id: str) -> Union[Document, None]:
+        with self._lock:
+            if (entry := self.offsets.get(id)) is None:
+                return None
+            offset, size, flags = entry
+            data = self._read(offset, size)
+        return self._decode(data, flags)
+
+    def exists(self, id: str) -> bool:
+        return id in self.offsets
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self.offsets)
+
+    def count(self) -> int:
+        return len(self.offsets)
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            self._offsets = None
+
+    def compact(self):
+        """
+        只保留有效记录，重写数据文件
+        """
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            offsets = {}
+            with open(tmp_path, "wb") as fp:
+                for id, (offset, size, flags) in self.offsets.items():
+                    id_bytes = id.encode()
+                    data = self._read(offset, size)
+                    fp.write(self.HEADER.pack(len(id_bytes), size, flags) + id_bytes)
+                    offsets[id] = (fp.tell(), size, flags)
+                    fp.write(data)
+            self.close()
+            os.replace(tmp_path, self.path)
+            self._offsets, self._garbage = offsets, 0
+
+    def persist(self):
+        with self._lock:
+            if not os.path.isfile(self.path):
+                self._append([])
+            size = os.path.getsize(self.path)
+            if size and self._garbage > size * self.COMPACT_RATIO:
+                self.compact()
+                size = os.path.getsize(self.path)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "wb") as fp:
+                pickle.dump(
+                    {"size": size, "offsets": self.offsets, "garbage": self._garbage},
+                    fp,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_path, self.index_path)
+
+    def copy_to(self, folder_path: str):
+        with self._lock:
+            self.persist()
+            shutil.copyfile(self.path, os.path.join(folder_path, self.file_name))
+            shutil.copyfile(self.index_path, os.path.join(folder_path, self.index_file_name))
+
+
+DOCSTORE_TYPES = {
+    "sqlite": SQLiteDocstore,
+    "file": FileDocstore,
+}
+
+
+def convert_docstore(
+    docstore: Docstore,
+    docstore_type: str,
+    folder_path: str,
+    compress: bool = False,
+) -> Docstore:
+    """
+    将向量库的文档库转换为指定类型（memory/sqlite/file），类型相同时原样返回
+    """
+    if docstore_type == "memory":
+        if isinstance(docstore, DiskDocstore):
+            from langchain.docstore.in_memory import InMemoryDocstore
+
+            return InMemoryDocstore(dict(docstore.iter_docs()))
+        return docstore
+
+    cls = DOCSTORE_TYPES[docstore_type]
+    if type(docstore) is cls:
+        if isinstance(docstore, FileDocstore):
+            docstore.compress = compress
+        return docstore
+    new_docstore = cls(folder_path)
+    if isinstance(new_docstore, FileDocstore):
+        new_docstore.compress = compress
+    new_docstore.delete(new_docstore.ids())
+    if isinstance(new_docstore, FileDocstore):
+        new_docstore.compact()
+    items = list(docstore._dict.items())
+    for i in range(0, len(items), 1000):
+        new_docstore.add(dict(items[i : i + 1000]))
+    return new_docstore
@@ -1,11 +1,45 @@
+import atexit
+import operator
 import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Set, Tuple, Union
 
+import faiss
+import numpy as np
 from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.embeddings.base import Embeddings
 from langchain.schema import Document
 from langchain.vectorstores.faiss import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 
 from chatchat.settings import Settings
+from chatchat.server.file_rag.retrievers.bm25 import BM25Index
 from chatchat.server.knowledge_base.kb_cache.base import *
+from chatchat.server.knowledge_base.kb_cache.docstore import DiskDocstore, convert_docstore
+from chatchat.server.knowledge_base.kb_cache.faiss_index import (
+    FaissIndexSpec,
+    build_index,
+    index_encoding,
+    index_kind,
+    index_nbytes,
+    materialize_index,
+    needs_rebuild,
+    prepare_index,
+    search_params,
+)
+from chatchat.server.knowledge_base.kb_cache.metadata_index import (
+    MetadataIndex,
+    SourceIndex,
+)
+from chatchat.server.knowledge_base.kb_cache.persist import PersistScheduler
+from chatchat.server.knowledge_base.kb_cache.raw_vectors import RawVectors
 from chatchat.server.knowledge_base.utils import get_vs_path
 from chatchat.server.utils import get_Embeddings, get_default_embedding
 
@@ -24,29 +58,939 @@ def _new_ds_search(self, search: str) -> Union[str, Document]:
 InMemoryDocstore.search = _new_ds_search
 
 
+# 每个文档在 id 映射、metadata、source 索引等结构中的大致开销（字节）
+_DOC_OVERHEAD = 512
+
+
+def _docs_nbytes(docs: Iterable[Document]) -> int:
+    return sum(sys.getsizeof(doc.page_content) for doc in docs if isinstance(doc, Document))
+
+
+class IndexedFAISS(FAISS):
+    """
+    在 langchain FAISS 基础上：
+    1. 同步维护 BM25 关键词索引，增删文档时增量更新，并随向量库一起保存到 index.bm25 文件；
+    2. 支持 flat 以外的近似索引（IVF/HNSW），此时 index_to_docstore_id 的键是稳定的向量标签而非位置，
+       向量数达到阈值后由 ThreadSafeFaiss 在后台训练/重建索引；
+    3. 支持以内存映射方式只读加载索引，首次写入前自动转为内存索引；文档可以保存在磁盘文档库中按需读取；
+    4. 维护 source -> 文档 id 的倒排索引（index.source），按文件删除/查询文档时无需遍历 docstore；
+    5. 启用增量日志后，保存时只把自上次保存以来的增删操作追加到 index.log，加载时重放，
+       日志超过快照大小的一定比例时才重写完整快照；
+    6. 维护 metadata 键值 -> 文档 id 的倒排索引（index.meta），按 metadata 过滤检索时
+       通过 IDSelector 只在满足条件的向量中检索，而不是检索后再过滤；
+    7. 使用压缩索引（标量量化/PQ）时，可在磁盘上保留原始 float32 向量（index.f32），
+       检索时多取若干倍候选结果，按原始向量重新计算距离后排序。
+    """
+
+    bm25_index: Optional[BM25Index] = None
+    source_index: Optional[SourceIndex] = None
+    metadata_index: Optional[MetadataIndex] = None
+    raw_vectors: Optional[RawVectors] = None
+    # 文档 id -> 向量标签，按需从 index_to_docstore_id 构建，增删向量时同步更新，整体替换索引后失效
+    _id_to_label: Optional[Dict[str, int]] = None
+    index_spec: Optional[FaissIndexSpec] = None
+    _tombstone_sel: Optional[Tuple] = None
+    # 后台重建索引期间被修改过的文档 id，替换索引时需要重新同步
+    _changed_ids: Optional[set] = None
+    # 以内存映射方式加载且尚未写入时，为映射的索引文件路径
+    _mmap_path: Optional[str] = None
+    # 启用增量日志时，为日志所在目录及尚未写入日志的操作
+    _log_folder: Optional[str] = None
+    _pending_ops: Optional[List[Tuple]] = None
+    # 索引或文档库被整体替换后，下次保存必须写完整快照
+    _needs_snapshot: bool = False
+    # 内存文档库中文档内容占用的内存（字节），首次估算后随增删文档增量更新
+    _docstore_nbytes: Optional[int] = None
+
+    @classmethod
+    def load_local(
+        cls,
+        folder_path: str,
+        embeddings: Embeddings,
+        index_name: str = "index",
+        *,
+        allow_dangerous_deserialization: bool = False,
+        mmap: bool = False,
+        **kwargs: Any,
+    ) -> "IndexedFAISS":
+        """
+        与 FAISS.load_local 相同，另外支持：
+        mmap: 以内存映射、只读方式加载索引，不必把整个索引读入内存
+        磁盘文档库只保存了文件名，加载后绑定到 folder_path
+        """
+        if not allow_dangerous_deserialization:
+            raise ValueError(
+                "The de-serialization relies loading a pickle file, "
+                "set `allow_dangerous_deserialization` to `True` to enable it."
+            )
+        path = Path(folder_path)
+        index_path = str(path / f"{index_name}.faiss")
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(index_path, flags)
+        with open(path / f"{index_name}.pkl", "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        if isinstance(docstore, DiskDocstore):
+            docstore.bind(folder_path)
+
+        vector_store = cls(embeddings, index, docstore, index_to_docstore_id, **kwargs)
+        if mmap and index_kind(index) == "ivf":
+            # 只有 IVF 索引的倒排表会被映射，其它类型的索引仍然读入内存
+            vector_store._mmap_path = index_path
+        else:
+            prepare_index(index)
+        return vector_store
+
+    def _ensure_writable(self):
+        """
+        内存映射的索引是只读的，写入前将其转为内存索引
+        """
+        if self._mmap_path is not None:
+            self.index = prepare_index(materialize_index(self.index))
+            self._mmap_path = None
+            logger.info("已将内存映射的向量索引转为内存索引")
+
+    def use_docstore(
+        self, docstore_type: str, folder_path: str, compress: bool = False
+    ) -> bool:
+        """
+        将文档库转换为指定类型（memory/sqlite/file），发生转换时返回 True
+        """
+        docstore = convert_docstore(
+            self.docstore, docstore_type, folder_path, compress=compress
+        )
+        if docstore is self.docstore:
+            return False
+        self.docstore = docstore
+        self._docstore_nbytes = None
+        self._needs_snapshot = True
+        logger.info(f"已将向量库 {folder_path} 的文档库转换为 {docstore_type}")
+        return True
+
+    # FAISS 所有添加文档的方法（add_texts/aadd_texts/add_embeddings/from_*）最终都调用私有的 __add
+    def _FAISS__add(
+        self,
+        texts: Iterable[str],
+        embeddings: Iterable[List[float]],
+        metadatas: Optional[Iterable[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Duplicate ids found in the ids list.")
+        if not (len(texts) == len(metadatas) == len(ids)):
+            raise ValueError("texts, metadatas and ids must have the same length.")
+
+        vectors = np.array(embeddings, dtype=np.float32).reshape(len(texts), -1)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        docs = [
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(texts, metadatas)
+        ]
+        self._apply_add(ids, vectors, docs)
+        self._log_op("add", ids, vectors, docs)
+        return ids
+
+    def _apply_add(
+        self,
+        ids: List[str],
+        vectors: np.ndarray,
+        docs: List[Document],
+        write_docstore: bool = True,
+    ):
+        self._add_vectors(vectors, ids)
+        if write_docstore:
+            self.docstore.add(dict(zip(ids, docs)))
+            self._track_docstore_nbytes(docs)
+        if self.bm25_index is not None:
+            self.bm25_index.add(ids, [doc.page_content for doc in docs])
+        if self.source_index is not None:
+            self.source_index.add(ids, [doc.metadata for doc in docs])
+        if self.metadata_index is not None:
+            self.metadata_index.add(ids, [doc.metadata for doc in docs])
+        if self.raw_vectors is not None:
+            self.raw_vectors.add(ids, vectors)
+        if self._changed_ids is not None:
+            self._changed_ids.update(ids)
+
+    def _apply_delete(self, ids: List[str], write_docstore: bool = True):
+        self._remove_vectors(ids)
+        if write_docstore:
+            if self._docstore_nbytes is not None:
+                self._track_docstore_nbytes(
+                    [self.docstore._dict.get(id) for id in ids], sign=-1
+                )
+            self.docstore.delete(ids)
+        if self.bm25_index is not None:
+            self.bm25_index.delete(ids)
+        if self.source_index is not None:
+            self.source_index.delete(ids)
+        if self.metadata_index is not None:
+            self.metadata_index.delete(ids)
+        if self.raw_vectors is not None:
+            self.raw_vectors.delete(ids)
+        if self._changed_ids is not None:
+            self._changed_ids.update(ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        missing_ids = {id for id in ids if self._find_label(id) is None}
+        if missing_ids:
+            raise ValueError(
+                f"Some specified ids do not exist in the current store. Ids not found: "
+                f"{missing_ids}"
+            )
+        self._apply_delete(ids)
+        self._log_op("delete", ids)
+        return True
+
+    def merge_from(self, target: FAISS) -> None:
+        labels = list(target.index_to_docstore_id.keys())
+        ids = list(target.index_to_docstore_id.values())
+        docs = [target.docstore.search(id) for id in ids]
+        vectors = self._reconstruct(labels, index=target.index)
+        self._apply_add(ids, vectors, docs)
+        self._log_op("add", ids, vectors, docs)
+
+    def _add_vectors(self, vectors: np.ndarray, ids: List[str]):
+        self._ensure_writable()
+        kind = index_kind(self.index)
+        if kind == "ivf":
+            start = max(self.index_to_docstore_id, default=-1) + 1
+            labels = np.arange(start, start + len(ids), dtype=np.int64)
+            self.index.add_with_ids(vectors, labels)
+        else:
+            # flat 的标签即位置；hnsw 的标签按添加顺序递增（包含已删除的墓碑）
+            start = self.index.ntotal
+            self.index.add(vectors)
+        new = {start + j: id for j, id in enumerate(ids)}
+        self.index_to_docstore_id.update(new)
+        if self._id_to_label is not None:
+            self._id_to_label.update((id, label) for label, id in new.items())
+        self._tombstone_sel = None
+
+    def _remove_vectors(self, ids: List[str]):
+        self._ensure_writable()
+        labels = {self._label_of(id_) for id_ in ids}
+        kind = index_kind(self.index)
+        if kind == "flat":
+            # flat 索引删除后其余向量的位置（即标签）前移，只能重新编号
+            self.index.remove_ids(np.fromiter(labels, dtype=np.int64))
+            remaining_ids = [
+                id_
+                for i, id_ in sorted(self.index_to_docstore_id.items())
+                if i not in labels
+            ]
+            self.index_to_docstore_id = {i: id_ for i, id_ in enumerate(remaining_ids)}
+            self._id_to_label = {id_: i for i, id_ in enumerate(remaining_ids)}
+        else:
+            if kind == "ivf":
+                self.index.remove_ids(np.fromiter(labels, dtype=np.int64))
+            for label in labels:
+                self._id_to_label.pop(self.index_to_docstore_id.pop(label), None)
+        self._tombstone_sel = None
+
+    def _reconstruct(self, labels: List[int], index: faiss.Index = None) -> np.ndarray:
+        index = index or self.index
+        if not labels:
+            return np.empty((0, index.d), dtype=np.float32)
+        prepare_index(index)
+        return index.reconstruct_batch(np.array(labels, dtype=np.int64))
+
+    def _exact_vectors(self, labels: List[int]) -> np.ndarray:
+        """
+        取出指定标签的向量：优先使用保留的原始向量，没有时从索引中重建（压缩索引中为近似值）
+        """
+        if self.raw_vectors is None or not labels:
+            return self._reconstruct(labels)
+        ids = [self.index_to_docstore_id[label] for label in labels]
+        vectors = self.raw_vectors.get(ids)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            for i, vector in zip(missing, self._reconstruct([labels[i] for i in missing])):
+                vectors[i] = vector
+        return np.stack(vectors)
+
+    def get_vectors_by_ids(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        取出指定文档的向量（压缩索引且未保留原始向量时为近似值），不存在的 id 被忽略
+        """
+        found = [
+            (label, id) for id in dict.fromkeys(ids) if (label := self._find_label(id)) is not None
+        ]
+        vectors = self._exact_vectors([label for label, _ in found])
+        return {id: vector for (_, id), vector in zip(found, vectors)}
+
+    def _tombstone_selector(self) -> Optional[faiss.IDSelector]:
+        """
+        HNSW 索引中已删除向量的过滤器
+        """
+        if (
+            index_kind(self.index) != "hnsw"
+            or self.index.ntotal == len(self.index_to_docstore_id)
+        ):
+            return None
+        if self._tombstone_sel is None:
+            live = np.fromiter(self.index_to_docstore_id.keys(), dtype=np.int64)
+            dead = np.setdiff1d(np.arange(self.index.ntotal, dtype=np.int64), live)
+            batch = faiss.IDSelectorBatch(dead)
+            # 保留 batch 的引用，避免被回收
+            self._tombstone_sel = (batch, faiss.IDSelectorNot(batch))
+        return self._tombstone_sel[1]
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        nprobe: int = None,
+        ef_search: int = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        """
+        与 FAISS 原方法相同，另外支持 nprobe(IVF) / ef_search(HNSW) 检索参数，并跳过已删除的向量
+        """
+        return self.similarity_search_with_score_by_vectors(
+            [embedding],
+            k=k,
+            filter=filter,
+            fetch_k=fetch_k,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            **kwargs,
+        )[0]
+
+    def similarity_search_with_score_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        nprobe: int = None,
+        ef_search: int = None,
+        **kwargs: Any,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        批量检索：所有查询向量在一次 index.search 中完成，返回与 embeddings 一一对应的结果
+        """
+        vectors = np.array(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        sel = self._tombstone_selector()
+        if isinstance(filter, dict) and (ids := self.get_ids_by_metadata(filter)) is not None:
+            # 通过 metadata 索引得到满足条件的向量，检索时直接限定范围，无需再过滤
+            if not ids:
+                return [[] for _ in embeddings]
+            labels = np.fromiter(
+                (self._label_of(id) for id in ids), dtype=np.int64, count=len(ids)
+            )
+            batch = faiss.IDSelectorBatch(labels)
+            sel, filter = batch, None
+        n = k if filter is None else fetch_k
+        rerank_factor = self._rerank_factor()
+        fetch_n = n * rerank_factor
+        params = search_params(
+            self.index,
+            self.index_spec,
+            fetch_n,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            sel=sel,
+        )
+        scores, indices = self.index.search(vectors, fetch_n, params=params)
+        if rerank_factor > 1:
+            scores, indices = self._rerank(vectors, scores, indices, n)
+
+        if filter is not None:
+            filter_func = self._create_filter_func(filter)
+        score_threshold = kwargs.get("score_threshold")
+        cmp = (
+            operator.ge
+            if self.distance_strategy
+            in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+            else operator.le
+        )
+        results = []
+        for row_scores, row_indices in zip(scores, indices):
+            docs = []
+            for score, i in zip(row_scores, row_indices):
+                if (_id := self.index_to_docstore_id.get(i)) is None:
+                    continue
+                doc = self.docstore.search(_id)
+                if not isinstance(doc, Document):
+                    logger.warning(f"Could not find document for id {_id}, got {doc}")
+                    continue
+                if filter is not None and not filter_func(doc.metadata):
+                    continue
+                if score_threshold is not None and not cmp(score, score_threshold):
+                    continue
+                docs.append((doc, score))
+            results.append(docs[:k])
+        return results
+
+    def _rerank_factor(self) -> int:
+        spec = self.index_spec
+        if (
+            spec is None
+            or not spec.rerank
+            or self.raw_vectors is None
+            or index_encoding(self.index) == "none"
+        ):
+            return 1
+        return max(1, spec.rerank_factor)
+
+    def _rerank(
+        self,
+        queries: np.ndarray,
+        scores: np.ndarray,
+        indices: np.ndarray,
+        n: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        用原始向量重新计算近似检索候选结果的距离，每个查询保留距离最近的 n 个；
+        缺少原始向量的候选结果沿用近似距离
+        """
+        inner_product = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        new_scores = np.full(
+            (len(queries), n), -np.inf if inner_product else np.inf, dtype=np.float32
+        )
+        new_indices = np.full((len(queries), n), -1, dtype=np.int64)
+        for row, (query, row_scores, row_labels) in enumerate(zip(queries, scores, indices)):
+            labels, ids, approx = [], [], []
+            for score, label in zip(row_scores, row_labels):
+                if (id := self.index_to_docstore_id.get(label)) is not None:
+                    labels.append(label)
+                    ids.append(id)
+                    approx.append(score)
+            if not ids:
+                continue
+            exact = np.array(approx, dtype=np.float32)
+            vectors = self.raw_vectors.get(ids)
+            found = [i for i, vector in enumerate(vectors) if vector is not None]
+            if found:
+                matrix = np.stack([vectors[i] for i in found])
+                if inner_product:
+                    exact[found] = matrix @ query
+                else:
+                    exact[found] = ((matrix - query) ** 2).sum(axis=1)
+            order = np.argsort(-exact if inner_product else exact, kind="stable")[:n]
+            new_scores[row, : len(order)] = exact[order]
+            new_indices[row, : len(order)] = np.array(labels, dtype=np.int64)[order]
+        return new_scores, new_indices
+
+    def similarity_search_with_relevance_scores_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        score_threshold: float = None,
+        **kwargs: Any,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        批量版的 similarity_search_with_relevance_scores：得分换算为 0~1 的相关度后按 score_threshold 过滤
+        """
+        relevance_score_fn = self._select_relevance_score_fn()
+        results = []
+        for docs in self.similarity_search_with_score_by_vectors(embeddings, k=k, **kwargs):
+            docs = [(doc, relevance_score_fn(score)) for doc, score in docs]
+            if score_threshold is not None:
+                docs = [(doc, score) for doc, score in docs if score >= score_threshold]
+            results.append(docs)
+        return results
+
+    def _track_docstore_nbytes(self, docs: Iterable[Document], sign: int = 1):
+        if self._docstore_nbytes is not None and isinstance(self.docstore, InMemoryDocstore):
+            self._docstore_nbytes += sign * _docs_nbytes(docs)
+
+    def memory_usage(self) -> int:
+        """
+        估算向量库占用的内存（字节）：索引 + 内存文档库 + 每个文档的映射与关键词索引开销
+        """
+        nbytes = index_nbytes(self.index, mmap=self._mmap_path is not None)
+        n = len(self.index_to_docstore_id)
+        nbytes += n * _DOC_OVERHEAD
+        if isinstance(self.docstore, InMemoryDocstore):
+            if self._docstore_nbytes is None:
+                self._docstore_nbytes = _docs_nbytes(self.docstore._dict.values())
+            nbytes += self._docstore_nbytes
+        if self.bm25_index is not None:
+            nbytes += self.bm25_index.total_len * 8
+        if self.metadata_index is not None:
+            nbytes += len(self.metadata_index.values) * _DOC_OVERHEAD // 4
+        if self.raw_vectors is not None:
+            nbytes += self.raw_vectors.pending_nbytes + len(self.raw_vectors) * _DOC_OVERHEAD // 4
+        return nbytes
+
+    def index_needs_rebuild(self) -> bool:
+        return needs_rebuild(self.index_spec, self.index, len(self.index_to_docstore_id))
+
+    def begin_rebuild(self) -> Tuple[List[str], np.ndarray]:
+        """
+        导出当前所有向量用于后台构建新索引，并开始记录之后被修改的文档
+        """
+        self._changed_ids = set()
+        labels = list(self.index_to_docstore_id.keys())
+        ids = list(self.index_to_docstore_id.values())
+        # 有原始向量时以原始向量训练，避免反复重建时误差累积
+        return ids, self._exact_vectors(labels)
+
+    def abort_rebuild(self):
+        self._changed_ids = None
+
+    def swap_index(self, index: faiss.Index, ids: List[str]):
+        """
+        用后台构建好的索引替换当前索引（index 中向量的标签为 0..n-1，与 ids 一一对应），
+        并同步构建期间新增/删除的文档
+        """
+        changed = self._changed_ids or set()
+        fresh = [
+            (label, id_)
+            for label, id_ in self.index_to_docstore_id.items()
+            if id_ in changed
+        ]
+        vectors = self._exact_vectors([label for label, _ in fresh])
+        stale = [id_ for id_ in ids if id_ in changed]
+
+        self.index = prepare_index(index)
+        self.index_to_docstore_id = dict(enumerate(ids))
+        self._tombstone_sel = None
+        self._id_to_label = None
+        self._changed_ids = None
+        self._mmap_path = None
+        self._needs_snapshot = True
+        if stale:
+            self._remove_vectors(stale)
+        if fresh:
+            self._add_vectors(vectors, [id_ for _, id_ in fresh])
+
+    def save_local(self, folder_path: str, index_name: str = "index") -> None:
+        """
+        先写临时文件再替换，避免其它进程正在映射的索引文件被原地改写。
+        启用增量日志且保存到日志所在目录时，只追加未保存的操作，日志过大时才写完整快照。
+        """
+        if self.raw_vectors is not None:
+            Path(folder_path).mkdir(exist_ok=True, parents=True)
+            self.raw_vectors.save(folder_path, index_name)
+        if self._can_append_log(folder_path, index_name):
+            self._append_log(folder_path, index_name)
+            return
+        self._save_snapshot(folder_path, index_name)
+        if self._is_log_folder(folder_path):
+            log_path = os.path.join(folder_path, f"{index_name}.log")
+            if os.path.exists(log_path):
+                os.remove(log_path)
+            self._pending_ops = []
+            self._needs_snapshot = False
+
+    def _save_snapshot(self, folder_path: str, index_name: str = "index"):
+        path = Path(folder_path)
+        path.mkdir(exist_ok=True, parents=True)
+        index_path = path / f"{index_name}.faiss"
+        if self._mmap_path is None or not (
+            index_path.exists() and os.path.samefile(index_path, self._mmap_path)
+        ):
+            # 映射的索引未被修改过时，不需要重写原文件
+            self._ensure_writable()
+            faiss.write_index(self.index, f"{index_path}.tmp")
+            os.replace(f"{index_path}.tmp", index_path)
+
+        if isinstance(self.docstore, DiskDocstore):
+            if os.path.isdir(self.docstore.folder_path) and os.path.samefile(
+                self.docstore.folder_path, path
+            ):
+                self.docstore.persist()
+            else:
+                self.docstore.copy_to(str(path))
+        pkl_path = path / f"{index_name}.pkl"
+        with open(f"{pkl_path}.tmp", "wb") as f:
+            pickle.dump((self.docstore, self.index_to_docstore_id), f)
+        os.replace(f"{pkl_path}.tmp", pkl_path)
+
+        if self.bm25_index is not None:
+            self.bm25_index.save(os.path.join(folder_path, f"{index_name}.bm25"))
+        if self.source_index is not None:
+            self.source_index.save(os.path.join(folder_path, f"{index_name}.source"))
+        if self.metadata_index is not None:
+            self.metadata_index.save(os.path.join(folder_path, f"{index_name}.meta"))
+
+    def _is_log_folder(self, folder_path: str) -> bool:
+        return (
+            self._log_folder is not None
+            and os.path.isdir(folder_path)
+            and os.path.samefile(folder_path, self._log_folder)
+        )
+
+    def _log_op(
+        self,
+        op: str,
+        ids: List[str],
+        vectors: np.ndarray = None,
+        docs: List[Document] = None,
+    ):
+        if self._pending_ops is None:
+            return
+        if op == "add" and isinstance(self.docstore, DiskDocstore):
+            # 磁盘文档库已经持久化了文档，日志只记录向量
+            docs = None
+        self._pending_ops.append((op, list(ids), vectors, docs))
+
+    def _can_append_log(self, folder_path: str, index_name: str) -> bool:
+        if (
+            self._pending_ops is None
+            or self._needs_snapshot
+            or not self._is_log_folder(folder_path)
+        ):
+            return False
+        base_size = 0
+        for suffix in ("faiss", "pkl"):
+            file = os.path.join(folder_path, f"{index_name}.{suffix}")
+            if not os.path.isfile(file):
+                return False
+            base_size += os.path.getsize(file)
+        log_path = os.path.join(folder_path, f"{index_name}.log")
+        log_size = os.path.getsize(log_path) if os.path.isfile(log_path) else 0
+        return log_size <= base_size * Settings.kb_settings.FAISS_DELTA_LOG_RATIO
+
+    def _append_log(self, folder_path: str, index_name: str = "index"):
+        if not self._pending_ops:
+            return
+        log_path = os.path.join(folder_path, f"{index_name}.log")
+        with open(log_path, "ab") as f:
+            pickle.dump(self._pending_ops, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending_ops = []
+
+    def enable_delta_log(self, folder_path: str, index_name: str = "index"):
+        """
+        启用增量日志：重放 folder_path 中快照之后记录的操作，之后的保存只追加日志。
+        须在 enable_bm25/enable_source_index/enable_metadata_index 之后调用，以便重放的操作同步更新这些索引。
+        """
+        self._pending_ops = None
+        log_path = os.path.join(folder_path, f"{index_name}.log")
+        if os.path.isfile(log_path):
+            self._replay_log(log_path)
+        self._log_folder = folder_path
+        self._pending_ops = []
+
+    def _replay_log(self, log_path: str):
+        batches = []
+        with open(log_path, "rb") as f:
+            valid_size = 0
+            while True:
+                try:
+                    batches.append(pickle.load(f))
+                    valid_size = f.tell()
+                except EOFError:
+                    break
+                except Exception as e:
+                    logger.warning(f"增量日志 {log_path} 末尾不完整，已忽略：{e}")
+                    break
+        if valid_size < os.path.getsize(log_path):
+            with open(log_path, "r+b") as f:
+                f.truncate(valid_size)
+
+        existing = set(self.index_to_docstore_id.values())
+        n_ops = 0
+        for ops in batches:
+            for op, ids, vectors, docs in ops:
+                n_ops += 1
+                if op == "add":
+                    write_docstore = docs is not None
+                    if docs is None:
+                        docs = self.docstore.mget(ids)
+                    # 快照写入后、日志删除前中断时，日志中的操作可能已包含在快照中
+                    keep = [
+                        i for i, (id, doc) in enumerate(zip(ids, docs))
+                        if id not in existing and isinstance(doc, Document)
+                    ]
+                    if not keep:
+                        continue
+                    ids = [ids[i] for i in keep]
+                    self._apply_add(
+                        ids, vectors[keep], [docs[i] for i in keep], write_docstore
+                    )
+                    existing.update(ids)
+                elif op == "delete":
+                    ids = [id for id in ids if id in existing]
+                    if ids:
+                        self._apply_delete(ids)
+                        existing.difference_update(ids)
+        if n_ops:
+            logger.info(f"已重放增量日志 {log_path}，操作数：{n_ops}")
+
+    def _live_docs(self) -> Tuple[List[str], List[Document]]:
+        # 磁盘文档库可能领先于快照（如已删除、待重放日志的文档），跳过不存在的文档
+        ids, docs = [], []
+        for id in self.index_to_docstore_id.values():
+            doc = self.docstore.search(id)
+            if isinstance(doc, Document):
+                ids.append(id)
+                docs.append(doc)
+        return ids, docs
+
+    def enable_bm25(self, folder_path: str = None, index_name: str = "index"):
+        """
+        启用 BM25 索引：优先从 folder_path 加载，文件不存在或与向量库不一致时根据 docstore 重建
+        """
+        index = None
+        if folder_path:
+            try:
+                index = BM25Index.load(os.path.join(folder_path, f"{index_name}.bm25"))
+            except Exception as e:
+                logger.warning(f"加载 BM25 索引失败，将重新构建：{e}")
+        if index is None or len(index) != len(self.index_to_docstore_id):
+            index = BM25Index()
+            ids, docs = self._live_docs()
+            index.add(ids, [doc.page_content for doc in docs])
+            if ids:
+                logger.info(f"已根据向量库重建 BM25 索引，文档数：{len(ids)}")
+        self.bm25_index = index
+
+    def enable_source_index(self, folder_path: str = None, index_name: str = "index"):
+        """
+        启用 source 倒排索引：优先从 folder_path 加载，文件不存在或与向量库不一致时根据 docstore 重建
+        """
+        index = None
+        if folder_path:
+            try:
+                index = SourceIndex.load(os.path.join(folder_path, f"{index_name}.source"))
+            except Exception as e:
+                logger.warning(f"加载 source 索引失败，将重新构建：{e}")
+        if index is None or len(index) != len(self.index_to_docstore_id):
+            index = SourceIndex()
+            ids, docs = self._live_docs()
+            index.add(ids, [doc.metadata for doc in docs])
+            if ids:
+                logger.info(f"已根据向量库重建 source 索引，文档数：{len(ids)}")
+        self.source_index = index
+
+    def enable_metadata_index(self, folder_path: str = None, index_name: str = "index"):
+        """
+        启用 metadata 倒排索引：优先从 folder_path 加载，文件不存在或与向量库不一致时根据 docstore 重建
+        """
+        index = None
+        if folder_path:
+            try:
+                index = MetadataIndex.load(os.path.join(folder_path, f"{index_name}.meta"))
+            except Exception as e:
+                logger.warning(f"加载 metadata 索引失败，将重新构建：{e}")
+        if index is None or len(index) != len(self.index_to_docstore_id):
+            index = MetadataIndex()
+            ids, docs = self._live_docs()
+            index.add(ids, [doc.metadata for doc in docs])
+            if ids:
+                logger.info(f"已根据向量库重建 metadata 索引，文档数：{len(ids)}")
+        self.metadata_index = index
+
+    def enable_raw_vectors(self, folder_path: str = None, index_name: str = "index"):
+        """
+        保留原始向量用于重排：优先从 folder_path 加载，缺少的向量在索引未压缩时从索引中补齐。
+        须在 enable_delta_log 之前调用，以便重放的操作同步更新原始向量
+        """
+        raw = None
+        if folder_path:
+            try:
+                raw = RawVectors.load(folder_path, index_name)
+            except Exception as e:
+                logger.warning(f"加载原始向量失败：{e}")
+        if raw is None or raw.dim != self.index.d:
+            raw = RawVectors(self.index.d)
+        live = set(self.index_to_docstore_id.values())
+        raw.delete([id for id in list(raw.rows) if id not in live])
+        missing = [
+            (label, id) for label, id in self.index_to_docstore_id.items() if id not in raw
+        ]
+        if missing and index_encoding(self.index) == "none":
+            raw.add(
+                [id for _, id in missing],
+                self._reconstruct([label for label, _ in missing]),
+            )
+            logger.info(f"已根据向量库补齐原始向量，向量数：{len(missing)}")
+        elif missing:
+            logger.warning(f"有 {len(missing)} 个向量缺少原始向量，重排时将使用压缩后的近似距离")
+        self.raw_vectors = raw
+
+    def get_ids_by_metadata(self, filter: Dict[str, Any]) -> Optional[Set[str]]:
+        """
+        返回满足 filter 的文档 id，未启用 metadata 索引或无法通过索引判断时返回 None
+        """
+        if self.metadata_index is None or not filter:
+            return None
+        return self.metadata_index.get_ids(filter)
+
+    def _label_of(self, id: str) -> int:
+        if self._id_to_label is None:
+            self._id_to_label = {
+                id_: label for label, id_ in self.index_to_docstore_id.items()
+            }
+        return self._id_to_label[id]
+
+    def _find_label(self, id: str) -> Optional[int]:
+        try:
+            return self._label_of(id)
+        except KeyError:
+            return None
+
+    def get_ids_by_source(self, source: str) -> List[str]:
+        """
+        返回 metadata["source"] 为 source 的文档 id（不区分大小写）
+        """
+        if self.source_index is not None:
+            return self.source_index.get(source)
+        source = source.lower()
+        return [
+            id
+            for id in self.index_to_docstore_id.values()
+            if str(self.docstore.search(id).metadata.get("source")).lower() == source
+        ]
+
+
 class ThreadSafeFaiss(ThreadSafeObject):
+    def __init__(
+        self,
+        key: Union[str, Tuple],
+        obj: Any = None,
+        pool: "CachePool" = None,
+        path: str = None,
+    ):
+        super().__init__(key, obj=obj, pool=pool)
+        self.path = path
+        self._rebuilding = threading.Lock()
+        # 同一向量库同时只进行一次保存
+        self._persisting = threading.Lock()
+
     def __repr__(self) -> str:
         cls = type(self).__name__
         return f"<{cls}: key: {self.key}, obj: {self._obj}, docs_count: {self.docs_count()}>"
 
+    @contextmanager
+    def acquire(
+        self, owner: str = "", msg: str = "", shared: bool = False
+    ) -> Generator[None, None, FAISS]:
+        with super().acquire(owner=owner, msg=msg, shared=shared) as obj:
+            yield obj
+        if not shared:
+            self.check_index()
+
+    def check_index(self):
+        """
+        向量库写入后检查索引是否需要（重新）训练，需要时在后台线程中重建
+        """
+        vs = self._obj
+        if (
+            isinstance(vs, IndexedFAISS)
+            and vs.index_needs_rebuild()
+            and self._rebuilding.acquire(blocking=False)
+        ):
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild_index()
+        except Exception as e:
+            logger.exception(f"向量库 {self.key} 重建索引失败：{e}")
+        finally:
+            self._rebuilding.release()
+
+    def rebuild_index(self):
+        """
+        构建新索引：导出向量时持有共享锁，训练与添加向量不持有锁，最后以独占锁替换索引
+        """
+        with self.acquire(shared=True, msg="导出向量") as vs:
+            ids, vectors = vs.begin_rebuild()
+            spec, dim = vs.index_spec, vs.index.d
+        try:
+            start = time.time()
+            index = build_index(spec, vectors, dim)
+        except Exception:
+            with self.acquire(shared=True):
+                vs.abort_rebuild()
+            raise
+        with self.acquire(msg="替换索引") as current:
+            if current is not vs:
+                return
+            vs.swap_index(index, ids)
+            if self.path:
+                self.mark_dirty(len(ids))
+        logger.info(
+            f"向量库 {self.key} 已重建 {spec.index_type}({index_encoding(index)}) 索引，"
+            f"向量数：{len(ids)}，耗时 {time.time() - start:.2f}s"
+        )
+
+    def convert_index(self, index_spec: Dict = None):
+        """
+        按新的索引参数立即重建索引（如启用或关闭向量压缩），用于转换已有的知识库
+        """
+        with self._rebuilding:
+            with self.acquire(msg="转换索引") as vs:
+                vs.index_spec = FaissIndexSpec.from_config(index_spec)
+                if not vs.index_spec.keep_raw_vectors:
+                    vs.raw_vectors = None
+                elif vs.raw_vectors is None:
+                    vs.enable_raw_vectors(self.path)
+                rebuild = vs.index_needs_rebuild()
+            if rebuild:
+                self.rebuild_index()
+        if self.path:
+            self.save(self.path)
+
     def docs_count(self) -> int:
         return len(self._obj.docstore._dict)
 
+    def get_nbytes(self) -> int:
+        vs = self._obj
+        if isinstance(vs, IndexedFAISS):
+            return vs.memory_usage()
+        if isinstance(vs, FAISS):
+            return index_nbytes(vs.index) + len(vs.index_to_docstore_id) * _DOC_OVERHEAD
+        return 0
+
     def save(self, path: str, create_path: bool = True):
         with self.acquire():
             if not os.path.isdir(path) and create_path:
                 os.makedirs(path)
             ret = self._obj.save_local(path)
+            if path == self.path:
+                persist_scheduler.discard(self.key)
             logger.info(f"已将向量库 {self.key} 保存到磁盘")
         return ret
 
+    def mark_dirty(self, count: int = 1):
+        """
+        向量库写入后调用（调用方持有独占锁）：启用后台持久化时只做标记，由 persist_scheduler 合并保存；
+        否则立即同步保存
+        """
+        if not self.path:
+            return
+        if persist_scheduler.enabled:
+            persist_scheduler.mark_dirty(self, count)
+        else:
+            self._obj.save_local(self.path)
+
+    def persist(self):
+        """
+        由 persist_scheduler 调用：持有共享锁保存，保存期间检索不受影响，写入需等待。
+        保存会写出并清空增量日志、保存原始向量等，这些状态只在写入时修改，共享锁已将写入排除在外；
+        另以 _persisting 保证同一向量库的多个保存（如后台保存与加载前的 flush）依次进行
+        """
+        with self._persisting, self.acquire(shared=True, msg="保存") as vs:
+            # path 为空表示向量库已被清空或删除
+            if vs is None or not self.path or not os.path.isdir(self.path):
+                return
+            vs.save_local(self.path)
+        logger.debug(f"已将向量库 {self.key} 保存到磁盘")
+
     def clear(self):
         ret = []
         with self.acquire():
-            ids = list(self._obj.docstore._dict.keys())
+            # 以索引中的 id 为准：磁盘文档库可能含有不在索引中的文档，遍历 docstore 也更慢
+            ids = list(self._obj.index_to_docstore_id.values())
             if ids:
                 ret = self._obj.delete(ids)
-                assert len(self._obj.docstore._dict) == 0
             logger.info(f"已将向量库 {self.key} 清空")
         return ret
 
@@ -60,7 +1004,9 @@ class _FaissPool(CachePool):
         # create an empty vector store
         embeddings = get_Embeddings(embed_model=embed_model)
         doc = Document(page_content="init", metadata={})
-        vector_store = FAISS.from_documents([doc], embeddings, normalize_L2=True)
+        vector_store = IndexedFAISS.from_documents(
+            [doc], embeddings, normalize_L2=True
+        )
         ids = list(vector_store.docstore._dict.keys())
         vector_store.delete(ids)
         return vector_store
@@ -94,14 +1040,22 @@ class KBFaissPool(_FaissPool):
         vector_name: str = None,
         create: bool = True,
         embed_model: str = get_default_embedding(),
+        index_spec: Dict = None,
     ) -> ThreadSafeFaiss:
+        vector_name = vector_name or embed_model.replace(":", "_")
+        if (kb_name, vector_name) not in self._cache:
+            # 被淘汰的向量库可能还有未保存的变更，先保存（或等待正在进行的保存结束）再从磁盘加载。
+            # 保存需要获取向量库的锁，不能在持有 atomic 时进行
+            persist_scheduler.flush((kb_name, vector_name))
         self.atomic.acquire()
         locked = True
-        vector_name = vector_name or embed_model.replace(":", "_")
         cache = self.get((kb_name, vector_name))  # 用元组比拼接字符串好一些
         try:
             if cache is None:
-                item = ThreadSafeFaiss((kb_name, vector_name), pool=self)
+                self.record_miss()
+                start = time.time()
+                vs_path = get_vs_path(kb_name, vector_name)
+                item = ThreadSafeFaiss((kb_name, vector_name), pool=self, path=vs_path)
                 self.set((kb_name, vector_name), item)
                 with item.acquire(msg="初始化"):
                     self.atomic.release()
@@ -109,15 +1063,15 @@ class KBFaissPool(_FaissPool):
                     logger.info(
                         f"loading vector store in '{kb_name}/vector_store/{vector_name}' from disk."
                     )
-                    vs_path = get_vs_path(kb_name, vector_name)
 
                     if os.path.isfile(os.path.join(vs_path, "index.faiss")):
                         embeddings = get_Embeddings(embed_model=embed_model)
-                        vector_store = FAISS.load_local(
+                        vector_store = IndexedFAISS.load_local(
                             vs_path,
                             embeddings,
                             normalize_L2=True,
                             allow_dangerous_deserialization=True,
+                            mmap=Settings.kb_settings.FAISS_MMAP,
                         )
                     elif create:
                         # create an empty vector store
@@ -126,12 +1080,30 @@ class KBFaissPool(_FaissPool):
                         vector_store = self.new_vector_store(
                             kb_name=kb_name, embed_model=embed_model
                         )
-                        vector_store.save_local(vs_path)
                     else:
                         raise RuntimeError(f"knowledge base {kb_name} not exist.")
+                    vector_store.index_spec = FaissIndexSpec.from_config(index_spec)
+                    converted = vector_store.use_docstore(
+                        Settings.kb_settings.FAISS_DOCSTORE,
+                        vs_path,
+                        compress=Settings.kb_settings.FAISS_DOCSTORE_COMPRESS,
+                    )
+                    vector_store.enable_bm25(vs_path)
+                    vector_store.enable_source_index(vs_path)
+                    vector_store.enable_metadata_index(vs_path)
+                    if vector_store.index_spec.keep_raw_vectors:
+                        vector_store.enable_raw_vectors(vs_path)
+                    if Settings.kb_settings.FAISS_DELTA_LOG:
+                        vector_store.enable_delta_log(vs_path)
+                    if converted or not os.path.isfile(
+                        os.path.join(vs_path, "index.faiss")
+                    ):
+                        vector_store.save_local(vs_path)
                     item.obj = vector_store
                     item.finish_loading()
+                    self.record_load(time.time() - start)
             else:
+                self.record_hit()
                 self.atomic.release()
                 locked = False
         except Exception as e:
@@ -144,33 +1116,186 @@ class KBFaissPool(_FaissPool):
 
 class MemoFaissPool(_FaissPool):
     r"""
-    临时向量库的缓存池
+    临时向量库的缓存池。
+    被淘汰（数量超限或空闲超过 ttl）的临时向量库保存到 BASE_TEMP_DIR/<id>/vector_store，再次使用时自动加载；
+    最后一次使用超过 expire 秒的临时目录（上传的文件与保存的向量库）由后台线程删除。
     """
 
+    def __init__(self, cache_num: int = -1, ttl: float = 0, expire: float = 0):
+        super().__init__(cache_num=cache_num, ttl=ttl)
+        self._expire = expire
+        self._sweeper = None
+
+    @staticmethod
+    def temp_dir(kb_name: str) -> str:
+        return os.path.join(Settings.basic_settings.BASE_TEMP_DIR, kb_name)
+
+    @classmethod
+    def spill_path(cls, kb_name: str) -> str:
+        return os.path.join(cls.temp_dir(kb_name), "vector_store")
+
+    def exists(self, kb_name: str) -> bool:
+        """
+        临时向量库在内存中或已保存到临时目录
+        """
+        with self.atomic:
+            if kb_name in self._cache or kb_name in self._evicting:
+                return True
+        return os.path.isfile(os.path.join(self.spill_path(kb_name), "index.faiss"))
+
+    def on_evict(self, key: str, item: ThreadSafeFaiss):
+        threading.Thread(target=self._spill, args=(key, item), daemon=True).start()
+
+    def _spill(self, key: str, item: ThreadSafeFaiss):
+        try:
+            with item.acquire(shared=True, msg="保存临时向量库") as vs:
+                # 保存前已被重新使用或删除时不再保存
+                with self.atomic:
+                    if self._evicting.get(key) is not item:
+                        return
+                path = self.spill_path(key)
+                os.makedirs(path, exist_ok=True)
+                vs.save_local(path)
+                os.utime(self.temp_dir(key))
+            logger.info(f"已将临时向量库 {key} 保存到 {path}")
+        except Exception as e:
+            logger.exception(f"保存临时向量库 {key} 失败：{e}")
+        finally:
+            self.evict_done(key, item)
+
+    def drop_vector_store(self, kb_name: str):
+        """
+        从内存和临时目录中删除临时向量库，上传的文件保留
+        """
+        with self.atomic:
+            self.pop(kb_name)
+            item = self._evicting.pop(kb_name, None)
+        if item is not None:
+            # 等待正在进行的保存完成
+            with item.acquire(msg="删除"):
+                pass
+        shutil.rmtree(self.spill_path(kb_name), ignore_errors=True)
+
+    def _start_sweeper(self):
+        if self._sweeper is None and (self._ttl > 0 or self._expire > 0):
+            self._sweeper = threading.Thread(
+                target=self._sweep_forever, name="memo-faiss-sweeper", daemon=True
+            )
+            self._sweeper.start()
+
+    def _sweep_forever(self):
+        interval = min(x for x in (self._ttl, self._expire, 60) if x > 0)
+        while True:
+            time.sleep(interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.exception(f"清理临时向量库失败：{e}")
+
+    def sweep(self):
+        """
+        释放空闲超时的临时向量库，并删除过期的临时目录
+        """
+        self.check_limits()
+        if self._expire <= 0:
+            return
+        root = Settings.basic_settings.BASE_TEMP_DIR
+        now = time.time()
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            # 只处理 get_temp_dir 创建的目录，跳过 openai_files 等
+            if not (len(name) == 32 and all(c in "0123456789abcdef" for c in name)):
+                continue
+            with self.atomic:
+                if name in self._cache or name in self._evicting:
+                    continue
+                try:
+                    if now - os.path.getmtime(path) <= self._expire:
+                        continue
+                except OSError:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"已删除过期的临时目录：{path}")
+
     def load_vector_store(
         self,
         kb_name: str,
+        create: bool = True,
         embed_model: str = get_default_embedding(),
     ) -> ThreadSafeFaiss:
+        self._start_sweeper()
         self.atomic.acquire()
+        locked = True
+        item = None
         cache = self.get(kb_name)
-        if cache is None:
-            item = ThreadSafeFaiss(kb_name, pool=self)
-            self.set(kb_name, item)
-            with item.acquire(msg="初始化"):
+        try:
+            if cache is None and (item := self._evicting.pop(kb_name, None)):
+                # 已淘汰但尚未保存完，直接放回缓存
+                self.record_hit()
+                self.set(kb_name, item)
                 self.atomic.release()
-                logger.info(f"loading vector store in '{kb_name}' to memory.")
-                # create an empty vector store
-                vector_store = self.new_temp_vector_store(embed_model=embed_model)
-                item.obj = vector_store
+                locked = False
+            elif cache is None:
+                self.record_miss()
+                start = time.time()
+                item = ThreadSafeFaiss(kb_name, pool=self)
+                self.set(kb_name, item)
+                with item.acquire(msg="初始化"):
+                    self.atomic.release()
+                    locked = False
+                    path = self.spill_path(kb_name)
+                    if os.path.isfile(os.path.join(path, "index.faiss")):
+                        logger.info(f"loading vector store in '{path}' to memory.")
+                        vector_store = FAISS.load_local(
+                            path,
+                            get_Embeddings(embed_model=embed_model),
+                            normalize_L2=True,
+                            allow_dangerous_deserialization=True,
+                        )
+                    elif create:
+                        logger.info(f"loading vector store in '{kb_name}' to memory.")
+                        # create an empty vector store
+                        vector_store = self.new_temp_vector_store(embed_model=embed_model)
+                    else:
+                        raise RuntimeError(f"临时知识库 {kb_name} 不存在")
+                    item.obj = vector_store
+                    item.finish_loading()
+                    self.record_load(time.time() - start)
+            else:
+                self.record_hit()
+                self.atomic.release()
+                locked = False
+        except Exception as e:
+            if locked:
+                self.atomic.release()
+            if item is not None and not item.is_loaded():
+                # 移除加载失败的对象，避免其它请求一直等待
+                with self.atomic:
+                    if self._cache.get(kb_name) is item:
+                        self.pop(kb_name)
                 item.finish_loading()
-        else:
-            self.atomic.release()
+            logger.exception(e)
+            raise RuntimeError(f"临时向量库 {kb_name} 加载失败。")
         return self.get(kb_name)
 
 
-kb_faiss_pool = KBFaissPool(cache_num=Settings.kb_settings.CACHED_VS_NUM)
-memo_faiss_pool = MemoFaissPool(cache_num=Settings.kb_settings.CACHED_MEMO_VS_NUM)
+persist_scheduler = PersistScheduler(
+    interval=Settings.kb_settings.FAISS_PERSIST_INTERVAL,
+    max_dirty=Settings.kb_settings.FAISS_PERSIST_MAX_DIRTY,
+)
+# 命令行等不经过 FastAPI lifespan 的场景，在进程退出前保存
+atexit.register(persist_scheduler.stop)
+
+kb_faiss_pool = KBFaissPool(
+    cache_num=Settings.kb_settings.CACHED_VS_NUM,
+    max_bytes=int(Settings.kb_settings.CACHED_VS_MEMORY * 1024 * 1024),
+    pinned=Settings.kb_settings.PINNED_KBS,
+)
+memo_faiss_pool = MemoFaissPool(
+    cache_num=Settings.kb_settings.CACHED_MEMO_VS_NUM,
+    ttl=Settings.kb_settings.MEMO_VS_TTL,
+    expire=Settings.kb_settings.MEMO_VS_EXPIRE,
+)
 #
 #
 # if __name__ == "__main__":
@@ -0,0 +1,266 @@
+from typing import Dict, Literal, Optional
+
+import faiss
+import numpy as np
+from pydantic import BaseModel
+
+from chatchat.settings import Settings
+
+
+class FaissIndexSpec(BaseModel):
+    """
+    FAISS 知识库的向量索引参数。
+    向量数达到 train_threshold 之前始终使用精确的 flat 索引，之后自动训练/构建指定类型的近似索引。
+    """
+
+    index_type: Literal["flat", "hnsw", "ivf_flat", "ivf_pq"] = "flat"
+    """索引类型"""
+
+    train_threshold: int = 10000
+    """向量数达到该值后才构建近似索引"""
+
+    nlist: int = 1024
+    """IVF 聚类中心数上限，实际取值随向量数增长，向量数增长到需要加倍 nlist 时后台重新训练"""
+
+    nprobe: int = 16
+    """IVF 检索时默认访问的聚类数"""
+
+    hnsw_m: int = 32
+    """HNSW 每个节点的邻居数"""
+
+    ef_construction: int = 64
+    """HNSW 构建时的搜索深度"""
+
+    ef_search: int = 64
+    """HNSW 检索时默认的搜索深度"""
+
+    pq_m: int = 16
+    """IVF-PQ 子向量个数，须能整除向量维度"""
+
+    pq_nbits: int = 8
+    """IVF-PQ 每个子向量的编码位数"""
+
+    quantizer: Literal["none", "fp16", "int8"] = "none"
+    """向量的标量量化方式，可与 flat/hnsw/ivf_flat 组合使用：fp16 占用为 float32 的 1/2，int8 约为 1/4。
+    ivf_pq 已使用乘积量化，忽略此参数"""
+
+    rerank: bool = True
+    """使用压缩索引（quantizer 或 ivf_pq）时，在磁盘上保留原始 float32 向量（index.f32，以内存映射方式读取），
+    检索时对近似检索的候选结果按原始向量重新计算距离排序，以弥补压缩造成的召回损失"""
+
+    rerank_factor: int = 4
+    """重排时近似检索的候选数为 k 的倍数"""
+
+    max_tombstone_ratio: float = 0.2
+    """HNSW 不支持删除，已删除向量占比超过该值时后台重建索引"""
+
+    @classmethod
+    def from_config(cls, spec: Optional[Dict] = None) -> "FaissIndexSpec":
+        """
+        以 kbs_config["faiss"] 为默认值，合并知识库自身的索引参数
+        """
+        if isinstance(spec, cls):
+            return spec
+        config = dict(Settings.kb_settings.kbs_config.get("faiss") or {})
+        config.update(spec or {})
+        return cls.model_validate(config)
+
+    @property
+    def compressed(self) -> bool:
+        return self.index_type == "ivf_pq" or self.quantizer != "none"
+
+    @property
+    def keep_raw_vectors(self) -> bool:
+        """
+        是否需要在磁盘上保留原始向量
+        """
+        return self.compressed and self.rerank
+
+
+def index_kind(index: faiss.Index) -> str:
+    """
+    返回索引的标签语义：
+    flat: 标签即位置，删除后需要重新编号（langchain FAISS 的默认行为）
+    ivf: 使用稳定标签，支持删除
+    hnsw: 标签按添加顺序递增，不支持删除，以墓碑方式过滤
+    """
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+_SQ_TYPES = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+def index_encoding(index: faiss.Index) -> str:
+    """
+    返回索引中向量的编码方式：none(float32) / fp16 / int8 / pq
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        for name, qtype in _SQ_TYPES.items():
+            if index.sq.qtype == qtype:
+                return name
+        return "sq"
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+
+def target_kind(spec: FaissIndexSpec, ntotal: int) -> str:
+    if spec.index_type == "flat" or ntotal < spec.train_threshold:
+        return "flat"
+    return "hnsw" if spec.index_type == "hnsw" else "ivf"
+
+
+def target_encoding(spec: FaissIndexSpec, ntotal: int) -> str:
+    if ntotal < spec.train_threshold:
+        return "none"
+    if spec.index_type == "ivf_pq":
+        return "pq"
+    return spec.quantizer
+
+
+def nlist_for(spec: FaissIndexSpec, ntotal: int) -> int:
+    # faiss 建议每个聚类中心至少 39 个训练样本
+    return max(1, min(spec.nlist, ntotal // 39))
+
+
+def needs_rebuild(spec: Optional[FaissIndexSpec], index: faiss.Index, n_live: int) -> bool:
+    """
+    判断当前索引是否需要（重新）构建
+    """
+    if spec is None:
+        return False
+    kind = index_kind(index)
+    target = target_kind(spec, n_live)
+    encoding = index_encoding(index)
+    if kind == "flat" and encoding == "none":
+        return target != "flat" or target_encoding(spec, n_live) != "none"
+    if spec.index_type == "flat" and not spec.compressed:
+        return True
+    if n_live < spec.train_threshold:  # 删除文档后向量数低于阈值，保留现有的近似/压缩索引
+        return False
+    if kind != target or encoding != target_encoding(spec, n_live):
+        return True
+    if kind == "ivf":
+        return nlist_for(spec, n_live) >= 2 * index.nlist
+    if kind == "hnsw":
+        return index.ntotal - n_live > spec.max_tombstone_ratio * index.ntotal
+    return False
+
+
+def build_index(spec: FaissIndexSpec, vectors: np.ndarray, dim: int) -> faiss.Index:
+    """
+    根据索引参数构建（并训练）索引，添加 vectors 后其标签为 0..n-1
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, dim)
+    n = len(vectors)
+    kind = target_kind(spec, n)
+    encoding = target_encoding(spec, n)
+    if kind == "flat":
+        if encoding == "none":
+            index = faiss.IndexFlatL2(dim)
+        else:
+            index = faiss.IndexScalarQuantizer(dim, _SQ_TYPES[encoding], faiss.METRIC_L2)
+            index.train(vectors)
+        index.add(vectors)
+        return index
+
+    if kind == "hnsw":
+        if encoding == "none":
+            index = faiss.IndexHNSWFlat(dim, spec.hnsw_m)
+        else:
+            index = faiss.IndexHNSWSQ(dim, _SQ_TYPES[encoding], spec.hnsw_m)
+            index.train(vectors)
+        index.hnsw.efConstruction = spec.ef_construction
+        index.add(vectors)
+        return index
+
+    nlist = nlist_for(spec, n)
+    quantizer = faiss.IndexFlatL2(dim)
+    if encoding == "pq":
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, spec.pq_m, spec.pq_nbits)
+    elif encoding == "none":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    else:
+        index = faiss.IndexIVFScalarQuantizer(
+            quantizer, dim, nlist, _SQ_TYPES[encoding], faiss.METRIC_L2
+        )
+    index.train(vectors)
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    index.add_with_ids(vectors, np.arange(n, dtype=np.int64))
+    return index
+
+
+def prepare_index(index: faiss.Index) -> faiss.Index:
+    """
+    加载后的准备工作：IVF 索引需要哈希直接映射以支持按标签删除与重建
+    """
+    if index_kind(index) == "ivf" and index.direct_map.type != faiss.DirectMap.Hashtable:
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def materialize_index(index: faiss.Index) -> faiss.Index:
+    """
+    将内存映射（只读）的 IVF 倒排表复制到内存中，之后才能增删向量
+    """
+    if index_kind(index) != "ivf":
+        return index
+    invlists = index.invlists
+    new_invlists = faiss.ArrayInvertedLists(index.nlist, invlists.code_size)
+    for list_no in range(index.nlist):
+        if size := invlists.list_size(list_no):
+            new_invlists.add_entries(
+                list_no, size, invlists.get_ids(list_no), invlists.get_codes(list_no)
+            )
+    index.replace_invlists(new_invlists, True)
+    new_invlists.this.disown()
+    return index
+
+
+def index_nbytes(index: faiss.Index, mmap: bool = False) -> int:
+    """
+    估算索引占用的内存（字节）。mmap=True 表示 IVF 倒排表仍是内存映射的，不计入内存
+    """
+    kind = index_kind(index)
+    if kind == "ivf":
+        nbytes = index.nlist * index.d * 4
+        if not mmap:
+            # 编码 + 标签 + 哈希直接映射
+            nbytes += index.ntotal * (index.code_size + 8 + 16)
+        return nbytes
+    if kind == "hnsw":
+        storage = faiss.downcast_index(index.storage)
+        return index.ntotal * storage.code_size + index.hnsw.neighbors.size() * 4
+    return index.ntotal * getattr(index, "code_size", index.d * 4)
+
+
+def search_params(
+    index: faiss.Index,
+    spec: Optional[FaissIndexSpec],
+    k: int,
+    nprobe: int = None,
+    ef_search: int = None,
+    sel: faiss.IDSelector = None,
+) -> Optional[faiss.SearchParameters]:
+    spec = spec or FaissIndexSpec()
+    kind = index_kind(index)
+    if kind == "ivf":
+        params = faiss.SearchParametersIVF(nprobe=min(nprobe or spec.nprobe, index.nlist))
+    elif kind == "hnsw":
+        params = faiss.SearchParametersHNSW(efSearch=max(ef_search or spec.ef_search, k))
+    elif sel is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if sel is not None:
+        params.sel = sel
+    return params
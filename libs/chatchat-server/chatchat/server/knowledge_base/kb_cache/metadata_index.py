@@ -0,0 +1,187 @@
+import os
+import pickle
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class SourceIndex:
+    """
+    metadata["source"] -> 文档 id 的倒排索引，用于按文件查找/删除文档。文件名不区分大小写。
+    """
+
+    VERSION = 1
+
+    def __init__(self):
+        self.sources: Dict[str, Set[str]] = {}
+        self.doc_sources: Dict[str, Optional[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_sources)
+
+    @staticmethod
+    def _key(source: str) -> str:
+        return str(source).lower()
+
+    def add(self, ids: Iterable[str], metadatas: Iterable[Dict]):
+        for id, metadata in zip(ids, metadatas):
+            self.delete([id])
+            source = (metadata or {}).get("source")
+            # 没有 source 的文档也要记录，以便与向量库的文档数核对
+            key = None if source is None else self._key(source)
+            self.doc_sources[id] = key
+            if key is not None:
+                self.sources.setdefault(key, set()).add(id)
+
+    def delete(self, ids: Iterable[str]):
+        for id in ids:
+            if (key := self.doc_sources.pop(id, None)) is None:
+                continue
+            ids_of_source = self.sources.get(key)
+            if ids_of_source is not None:
+                ids_of_source.discard(id)
+                if not ids_of_source:
+                    del self.sources[key]
+
+    def clear(self):
+        self.sources.clear()
+        self.doc_sources.clear()
+
+    def get(self, source: str) -> List[str]:
+        return list(self.sources.get(self._key(source), ()))
+
+    def save(self, path: str):
+        state = {
+            "version": self.VERSION,
+            "sources": self.sources,
+            "doc_sources": self.doc_sources,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as fp:
+            pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["SourceIndex"]:
+        """
+        从文件加载索引，文件不存在或版本不匹配时返回 None
+        """
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as fp:
+            state = pickle.load(fp)
+        if state.get("version") != cls.VERSION:
+            return None
+        index = cls()
+        index.sources = state["sources"]
+        index.doc_sources = state["doc_sources"]
+        return index
+
+
+def filter_values(value: Any) -> List[str]:
+    """
+    过滤条件中的取值：单个值或值列表（满足其一即可），统一转为字符串比较
+    """
+    if isinstance(value, (list, tuple, set)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+def match_metadata(metadata: Dict, filter: Dict[str, Any]) -> bool:
+    """
+    metadata 是否满足 filter：各键之间为“且”，键的取值列表之间为“或”
+    """
+    for key, value in filter.items():
+        if key not in metadata or str(metadata[key]) not in filter_values(value):
+            return False
+    return True
+
+
+class MetadataIndex:
+    """
+    metadata 一级键值 -> 文档 id 的倒排索引，用于带 metadata 过滤条件的检索。
+    值统一转为字符串比较；只索引标量值，过长的字符串（多为摘要等内容）不索引。
+    """
+
+    VERSION = 1
+    MAX_VALUE_LEN = 256
+
+    def __init__(self):
+        self.values: Dict[Tuple[str, str], Set[str]] = {}
+        self.doc_values: Dict[str, List[Tuple[str, str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_values)
+
+    @classmethod
+    def _indexable(cls, value: Any) -> bool:
+        if isinstance(value, str):
+            return len(value) <= cls.MAX_VALUE_LEN
+        return isinstance(value, (int, float, bool))
+
+    def add(self, ids: Iterable[str], metadatas: Iterable[Dict]):
+        for id, metadata in zip(ids, metadatas):
+            self.delete([id])
+            pairs = [
+                (key, str(value))
+                for key, value in (metadata or {}).items()
+                if self._indexable(value)
+            ]
+            self.doc_values[id] = pairs
+            for pair in pairs:
+                self.values.setdefault(pair, set()).add(id)
+
+    def delete(self, ids: Iterable[str]):
+        for id in ids:
+            for pair in self.doc_values.pop(id, ()):
+                ids_of_value = self.values.get(pair)
+                if ids_of_value is not None:
+                    ids_of_value.discard(id)
+                    if not ids_of_value:
+                        del self.values[pair]
+
+    def clear(self):
+        self.values.clear()
+        self.doc_values.clear()
+
+    def get_ids(self, filter: Dict[str, Any]) -> Optional[Set[str]]:
+        """
+        返回满足 filter 的文档 id；filter 中有未被索引的取值（如过长的字符串）时返回 None
+        """
+        result = None
+        for key, value in filter.items():
+            values = filter_values(value)
+            if any(len(v) > self.MAX_VALUE_LEN for v in values):
+                return None
+            ids = set()
+            for v in values:
+                ids.update(self.values.get((key, v), ()))
+            result = ids if result is None else result & ids
+            if not result:
+                break
+        return result if result is not None else set(self.doc_values)
+
+    def save(self, path: str):
+        state = {
+            "version": self.VERSION,
+            "values": self.values,
+            "doc_values": self.doc_values,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as fp:
+            pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["MetadataIndex"]:
+        """
+        从文件加载索引，文件不存在或版本不匹配时返回 None
+        """
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as fp:
+            state = pickle.load(fp)
+        if state.get("version") != cls.VERSION:
+            return None
+        index = cls()
+        index.values = state["values"]
+        index.doc_values = state["doc_values"]
+        return index
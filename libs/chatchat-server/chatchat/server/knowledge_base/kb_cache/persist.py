@@ -0,0 +1,134 @@
+import threading
+import time
+from typing import Dict, Set, Tuple, Union
+
+from chatchat.utils import build_logger
+
+
+logger = build_logger()
+
+
+class PersistScheduler:
+    """
+    延迟合并的后台持久化：写入后只把对象标记为脏，由后台线程在距首次修改 interval 秒后
+    或未保存的变更数达到 max_dirty 时调用 item.persist() 保存，多次写入合并为一次保存。
+    interval <= 0 时不启用，由调用方同步保存。
+    """
+
+    def __init__(self, interval: float = 5, max_dirty: int = 1000):
+        self.interval = interval
+        self.max_dirty = max_dirty
+        # key -> (item, 变更数, 首次修改时间)
+        self._dirty: Dict[Union[str, Tuple], Tuple[object, int, float]] = {}
+        # 正在保存的对象，及其中已被放弃、保存失败后不再重试的对象
+        self._saving: Dict[Union[str, Tuple], object] = {}
+        self._cancelled: Set[Union[str, Tuple]] = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0 and not self._stopped
+
+    def mark_dirty(self, item, count: int = 1):
+        with self._cond:
+            key = item.key
+            _, n, since = self._dirty.get(key, (item, 0, time.time()))
+            self._dirty[key] = (item, n + count, since)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="faiss-persist", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def discard(self, key: Union[str, Tuple], wait: bool = False):
+        """
+        放弃尚未保存的变更，如向量库已被清空或已显式保存。
+        wait=True 时同时等待正在进行的保存结束，且保存失败后不再重试
+        """
+        with self._cond:
+            self._dirty.pop(key, None)
+            if wait and key in self._saving:
+                self._cancelled.add(key)
+                self._wait_saving(key)
+
+    def _wait_saving(self, key: Union[str, Tuple]):
+        while key in self._saving:
+            self._cond.wait()
+
+    def is_dirty(self, key: Union[str, Tuple]) -> bool:
+        return key in self._dirty
+
+    def _due(self) -> Tuple[list, float]:
+        now = time.time()
+        due, wait = [], self.interval
+        for key, (_, n, since) in self._dirty.items():
+            remain = since + self.interval - now
+            if remain <= 0 or n >= self.max_dirty:
+                due.append(key)
+            else:
+                wait = min(wait, remain)
+        return due, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due, wait = self._due()
+                while not due and not self._stopped:
+                    self._cond.wait(wait if self._dirty else None)
+                    due, wait = self._due()
+                if self._stopped:
+                    return
+            for key in due:
+                self.flush(key)
+
+    def _save(self, item) -> bool:
+        try:
+            item.persist()
+            return True
+        except Exception as e:
+            logger.exception(f"保存 {item.key} 失败：{e}")
+            return False
+
+    def flush(self, key: Union[str, Tuple] = None):
+        """
+        立即保存指定（或全部）有未保存变更的对象。
+        指定的对象正在由其它线程保存时，等待其保存结束；保存失败的对象重新标记为脏，interval 秒后重试
+        """
+        with self._cond:
+            if key is None:
+                while self._saving:
+                    self._cond.wait()
+                entries = list(self._dirty.items())
+                self._dirty.clear()
+            else:
+                self._wait_saving(key)
+                entries = [(key, self._dirty.pop(key))] if key in self._dirty else []
+            for k, (item, _, _) in entries:
+                self._saving[k] = item
+        for k, (item, n, _) in entries:
+            ok = False
+            try:
+                ok = self._save(item)
+            finally:
+                with self._cond:
+                    del self._saving[k]
+                    if k in self._cancelled:
+                        self._cancelled.discard(k)
+                    elif not ok:
+                        _, m, _ = self._dirty.get(k, (item, 0, 0))
+                        # 变更数不超过 max_dirty，避免立即重试
+                        count = max(min(n + m, self.max_dirty - 1), 0)
+                        self._dirty[k] = (item, count, time.time())
+                    self._cond.notify_all()
+
+    def stop(self):
+        """
+        停止后台线程并保存全部未保存的变更，在服务退出时调用
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self.flush()
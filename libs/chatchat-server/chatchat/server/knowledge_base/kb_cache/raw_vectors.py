@@ -0,0 +1,161 @@
+import os
+import pickle
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class RawVectors:
+    """
+    压缩索引对应的原始 float32 向量，以 文档 id -> 行号 的方式保存在 {index_name}.f32 文件中，
+    检索重排时以内存映射方式按需读取，不占用常驻内存。
+    新增的向量先保存在内存中，save 时追加到文件末尾；删除只移除行号，已删除的行在文件中
+    无效数据超过有效数据时重写文件回收。
+    """
+
+    VERSION = 1
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        # 绑定的向量文件，未保存过时为 None
+        self.path: Optional[str] = None
+        self.rows: Dict[str, int] = {}
+        self.nrows = 0
+        self._pending: Dict[str, np.ndarray] = {}
+        self._mmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.rows) + len(self._pending)
+
+    def __contains__(self, id: object) -> bool:
+        return id in self._pending or id in self.rows
+
+    @property
+    def pending_nbytes(self) -> int:
+        return len(self._pending) * self.dim * 4
+
+    def add(self, ids: Iterable[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        for id, vector in zip(ids, vectors):
+            self.rows.pop(id, None)
+            self._pending[id] = vector.copy()
+
+    def delete(self, ids: Iterable[str]):
+        for id in ids:
+            self._pending.pop(id, None)
+            self.rows.pop(id, None)
+
+    def clear(self):
+        self._pending.clear()
+        self.rows.clear()
+
+    def _get_mmap(self) -> Tuple[Dict[str, int], Optional[np.memmap]]:
+        """
+        返回一致的 (行号, 内存映射)：保存时可能与检索并发重新绑定文件，二者须取自同一次绑定
+        """
+        with self._lock:
+            if self._mmap is None and self.path and self.nrows:
+                self._mmap = np.memmap(
+                    self.path, dtype=np.float32, mode="r", shape=(self.nrows, self.dim)
+                )
+            return self.rows, self._mmap
+
+    def get(self, ids: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        返回与 ids 一一对应的原始向量，不存在的为 None
+        """
+        rows = mm = None
+        result = []
+        for id in ids:
+            # 重新绑定时先更新行号再清空 _pending，因此先查 _pending
+            vector = self._pending.get(id)
+            if vector is None:
+                if rows is None:
+                    rows, mm = self._get_mmap()
+                row = rows.get(id)
+                if row is not None and mm is not None and row < len(mm):
+                    vector = np.array(mm[row])
+            result.append(vector)
+        return result
+
+    def _rebind(self, path: str, rows: Dict[str, int], nrows: int):
+        with self._lock:
+            self.path, self.rows, self.nrows = path, rows, nrows
+            self._mmap = None
+        self._pending.clear()
+
+    def _write_all(self, path: str) -> Dict[str, int]:
+        """
+        把全部有效向量写入新文件，返回新的行号
+        """
+        ids = list(self.rows) + list(self._pending)
+        rows = {}
+        with open(f"{path}.tmp", "wb") as fp:
+            for start in range(0, len(ids), 4096):
+                batch = ids[start : start + 4096]
+                vectors = self.get(batch)
+                for id, vector in zip(batch, vectors):
+                    rows[id] = len(rows)
+                    fp.write(np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(f"{path}.tmp", path)
+        return rows
+
+    def _append_pending(self):
+        rows = dict(self.rows)
+        nrows = self.nrows
+        with open(self.path, "ab") as fp:
+            # 丢弃上次中断时写入的不完整数据
+            fp.truncate(nrows * self.dim * 4)
+            for id, vector in self._pending.items():
+                fp.write(vector.tobytes())
+                rows[id] = nrows
+                nrows += 1
+            fp.flush()
+            os.fsync(fp.fileno())
+        self._rebind(self.path, rows, nrows)
+
+    def save(self, folder_path: str, index_name: str = "index"):
+        path = os.path.join(folder_path, f"{index_name}.f32")
+        bound = self.path is not None and os.path.isfile(self.path)
+        if bound and not (os.path.isfile(path) and os.path.samefile(path, self.path)):
+            # 保存到其它目录时写入完整副本，仍保持绑定原文件
+            rows = self._write_all(path)
+            self._save_rows(path, rows, len(rows))
+            return
+
+        if not bound or self.nrows > 2 * len(self) + 1024:
+            rows = self._write_all(path)
+            self._rebind(path, rows, len(rows))
+        elif self._pending:
+            self._append_pending()
+        self._save_rows(path, self.rows, self.nrows)
+
+    def _save_rows(self, path: str, rows: Dict[str, int], nrows: int):
+        state = {"version": self.VERSION, "dim": self.dim, "rows": rows, "nrows": nrows}
+        rows_path = f"{path}.ids"
+        with open(f"{rows_path}.tmp", "wb") as fp:
+            pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{rows_path}.tmp", rows_path)
+
+    @classmethod
+    def load(cls, folder_path: str, index_name: str = "index") -> Optional["RawVectors"]:
+        """
+        从文件加载，文件不存在、版本不匹配或数据不完整时返回 None
+        """
+        path = os.path.join(folder_path, f"{index_name}.f32")
+        rows_path = f"{path}.ids"
+        if not (os.path.isfile(path) and os.path.isfile(rows_path)):
+            return None
+        with open(rows_path, "rb") as fp:
+            state = pickle.load(fp)
+        if state.get("version") != cls.VERSION:
+            return None
+        raw = cls(state["dim"])
+        if os.path.getsize(path) < state["nrows"] * raw.dim * 4:
+            return None
+        raw.path, raw.rows, raw.nrows = path, state["rows"], state["nrows"]
+        return raw
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+from chatchat.settings import Settings
+from chatchat.utils import build_logger
+
+logger = build_logger()
+
+
+class KBVersions:
+    """
+    知识库内容版本号，每次增删改文档后更新。
+    检索结果缓存以版本号作为键的一部分，知识库变更后旧的缓存自然失效。
+    指定 root 时，版本号同时保存在 {root}/{知识库名称}/.version 文件中（每次变更写入新的随机值），
+    同一台机器上的多个 worker 进程共享；否则只在本进程内有效
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, kb_name: str) -> str:
+        return os.path.join(self.root, kb_name, ".version")
+
+    def get(self, kb_name: str) -> Hashable:
+        local = self._versions.get(kb_name, 0)
+        if not self.root:
+            return local
+        try:
+            with open(self._path(kb_name), encoding="utf-8") as fp:
+                shared = fp.read()
+        except OSError:
+            shared = ""
+        return local, shared
+
+    def bump(self, kb_name: str):
+        with self._lock:
+            self._versions[kb_name] = self._versions.get(kb_name, 0) + 1
+        # 知识库目录不存在（如已删除）时不创建
+        if not self.root or not os.path.isdir(os.path.join(self.root, kb_name)):
+            return
+        path = self._path(kb_name)
+        token = uuid.uuid4().hex
+        try:
+            with open(f"{path}.{token}.tmp", "w", encoding="utf-8") as fp:
+                fp.write(token)
+            os.replace(f"{path}.{token}.tmp", path)
+        except OSError as e:
+            logger.warning(f"更新知识库 {kb_name} 的版本文件失败，其它进程的检索结果缓存可能不会失效：{e}")
+
+
+class SearchResultCache:
+    """
+    检索结果的 LRU 缓存，条目超过 ttl 秒后过期。max_size <= 0 时不缓存
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        # 统一全角/半角字符并合并空白
+        return " ".join(unicodedata.normalize("NFKC", query).split())
+
+    def make_key(
+        self,
+        kb_name: str,
+        version: Hashable,
+        query: str,
+        top_k: int,
+        score_threshold: float,
+        **kwargs: Any,
+    ) -> Tuple:
+        return (
+            kb_name,
+            version,
+            self.normalize_query(query),
+            top_k,
+            score_threshold,
+            _freeze(kwargs),
+        )
+
+    def get(self, key: Hashable) -> Optional[List[Document]]:
+        with self._lock:
+            item = self._cache.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expire_at, docs = item
+            if expire_at < time.time():
+                del self._cache[key]
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+        # 返回副本，避免调用方修改缓存中的文档
+        return [doc.copy(deep=True) for doc in docs]
+
+    def set(self, key: Hashable, docs: List[Document]):
+        if not self.enabled:
+            return
+        docs = [doc.copy(deep=True) for doc in docs]
+        with self._lock:
+            self._cache[key] = (time.time() + self.ttl, docs)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._cache),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, set):
+        return frozenset(_freeze(v) for v in value)
+    return value
+
+
+kb_versions = KBVersions(Settings.basic_settings.KB_ROOT_PATH)
+search_result_cache = SearchResultCache(
+    max_size=Settings.kb_settings.SEARCH_CACHE_SIZE,
+    ttl=Settings.kb_settings.SEARCH_CACHE_TTL,
+)
@@ -1,10 +1,12 @@
 import asyncio
+import heapq
 import json
 import os
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 
-from fastapi import Body, File, Form, Query, UploadFile
+from fastapi import Body, File, Form, HTTPException, Query, UploadFile
 from fastapi.responses import FileResponse
 from langchain.docstore.document import Document
 from sse_starlette import EventSourceResponse
@@ -41,7 +43,8 @@ def search_temp_docs(knowledge_id: str = Body(..., description="知识库 ID", e
                      top_k: int = Body(..., description="返回的文档数量", examples=[5]),
                      score_threshold: float = Body(..., description="分数阈值", examples=[0.8])) -> List[Dict]:
     '''从临时 FAISS 知识库中检索文档，用于文件对话'''
-    with memo_faiss_pool.acquire(knowledge_id) as vs:
+    vector_store = memo_faiss_pool.load_vector_store(knowledge_id, create=False)
+    with vector_store.acquire(shared=True) as vs:
         docs = vs.similarity_search_with_score(
             query, k=top_k, score_threshold=score_threshold
         )
@@ -64,13 +67,23 @@ def search_docs(
             le=2.0,
         ),
         file_name: str = Body("", description="文件名称，支持 sql 通配符"),
-        metadata: dict = Body({}, description="根据 metadata 进行过滤，仅支持一级键"),
+        metadata: dict = Body({}, description="根据 metadata 进行过滤，仅支持一级键，值可以是列表（满足其一即可）。"
+                                              "指定 query 时在检索中过滤"),
+        nprobe: int = Body(None, description="IVF 索引检索时访问的聚类数，仅对 faiss 近似索引有效"),
+        ef_search: int = Body(None, description="HNSW 索引检索时的搜索深度，仅对 faiss 近似索引有效"),
 ) -> List[Dict]:
     kb = KBServiceFactory.get_service_by_name(knowledge_base_name)
     data = []
     if kb is not None:
         if query:
-            docs = kb.search_docs(query, top_k, score_threshold)
+            docs = kb.search_docs(
+                query,
+                top_k,
+                score_threshold,
+                filter=metadata,
+                nprobe=nprobe,
+                ef_search=ef_search,
+            )
             # data = [DocumentWithVSId(**x[0].dict(), score=x[1], id=x[0].metadata.get("id")) for x in docs]
             data = [DocumentWithVSId(**{"id": x.metadata.get("id"), **x.dict()}) for x in docs]
         elif file_name or metadata:
@@ -81,6 +94,152 @@ def search_docs(
     return [x.dict() for x in data]
 
 
+def list_docs(
+        knowledge_base_name: str = Body(..., description="知识库名称", examples=["samples"]),
+        file_name: str = Body("", description="文件名称，支持 sql 通配符"),
+        metadata: dict = Body({}, description="根据 metadata 进行过滤，仅支持一级键"),
+        offset: int = Body(0, ge=0, description="跳过的文档数"),
+        limit: int = Body(100, ge=1, le=1000, description="每页文档数"),
+        cursor: int = Body(None, description="上一页返回的 next_cursor，指定时从其后继续列出，比 offset 更高效"),
+) -> BaseResponse:
+    """
+    分页列出知识库（文件）中的文档
+    """
+    kb = KBServiceFactory.get_service_by_name(knowledge_base_name)
+    if kb is None:
+        return BaseResponse(code=404, msg=f"未找到知识库 {knowledge_base_name}")
+
+    docs, next_cursor = kb.list_docs_page(
+        file_name=file_name,
+        metadata=metadata,
+        offset=offset,
+        limit=limit,
+        cursor=cursor,
+    )
+    for d in docs:
+        d.metadata.pop("vector", None)
+    return BaseResponse(
+        data={
+            "docs": [x.dict() for x in docs],
+            "total": kb.count_docs(file_name=file_name, metadata=metadata),
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+def search_docs_batch(
+        queries: List[str] = Body(..., description="用户输入列表", examples=[["你好", "如何启动"]]),
+        knowledge_base_name: str = Body(
+            ..., description="知识库名称", examples=["samples"]
+        ),
+        top_k: int = Body(Settings.kb_settings.VECTOR_SEARCH_TOP_K, description="匹配向量数"),
+        score_threshold: float = Body(
+            Settings.kb_settings.SCORE_THRESHOLD,
+            description="知识库匹配相关度阈值，取值范围在0-1之间，"
+                        "SCORE越小，相关度越高，"
+                        "取到2相当于不筛选，建议设置在0.5左右",
+            ge=0.0,
+            le=2.0,
+        ),
+        metadata: dict = Body({}, description="根据 metadata 进行过滤，仅支持一级键，值可以是列表（满足其一即可）"),
+        nprobe: int = Body(None, description="IVF 索引检索时访问的聚类数，仅对 faiss 近似索引有效"),
+        ef_search: int = Body(None, description="HNSW 索引检索时的搜索深度，仅对 faiss 近似索引有效"),
+) -> List[List[Dict]]:
+    '''批量检索知识库，返回与 queries 一一对应的结果'''
+    kb = KBServiceFactory.get_service_by_name(knowledge_base_name)
+    if kb is None:
+        return [[] for _ in queries]
+    results = kb.search_docs_batch(
+        queries,
+        top_k,
+        score_threshold,
+        filter=metadata,
+        nprobe=nprobe,
+        ef_search=ef_search,
+    )
+    return [
+        [DocumentWithVSId(**{"id": x.metadata.get("id"), **x.dict()}).dict() for x in docs]
+        for docs in results
+    ]
+
+
+def merge_ranked_docs(
+        results: List[List[Document]],
+        top_k: int,
+        rrf_k: int = 60,
+) -> List[Dict]:
+    '''
+    以倒数排名融合（RRF）合并多个知识库的检索结果：不同向量库、嵌入模型的得分不可比，
+    只按文档在各自结果中的排名 rank 计算得分 1 / (rrf_k + rank)，取得分最高的 top_k 个文档
+    '''
+    ranked = (
+        (1.0 / (rrf_k + rank), -i, rank, doc)
+        for i, docs in enumerate(results)
+        for rank, doc in enumerate(docs, 1)
+    )
+    # 得分相同时，排名靠前、知识库顺序靠前的优先
+    top = heapq.nlargest(top_k, ranked, key=lambda x: (x[0], x[1]))
+    return [
+        DocumentWithVSId(**{"id": doc.metadata.get("id"), **doc.dict(), "score": score}).dict()
+        for score, _, _, doc in top
+    ]
+
+
+def search_docs_in_kbs(
+        query: str = Body(..., description="用户输入", examples=["你好"]),
+        knowledge_base_names: List[str] = Body(
+            ..., description="知识库名称列表", examples=[["samples"]]
+        ),
+        top_k: int = Body(Settings.kb_settings.VECTOR_SEARCH_TOP_K, description="匹配向量数"),
+        score_threshold: float = Body(
+            Settings.kb_settings.SCORE_THRESHOLD,
+            description="知识库匹配相关度阈值，取值范围在0-1之间，"
+                        "SCORE越小，相关度越高，"
+                        "取到2相当于不筛选，建议设置在0.5左右",
+            ge=0.0,
+            le=2.0,
+        ),
+) -> List[Dict]:
+    '''
+    并行检索多个知识库并以倒数排名融合（RRF，见 merge_ranked_docs）合并结果。
+    文档的 metadata["kb_name"] 为其所属知识库；score 为 RRF 得分，越大越相关，
+    只用于排序，不能与单个知识库检索的 score 或 score_threshold 比较。
+    知识库名称不合法时返回 403，知识库不存在时返回 404，数量超过 MAX_KBS_PER_SEARCH 时返回 400
+    '''
+    names = list(dict.fromkeys(knowledge_base_names))
+    if len(names) > Settings.kb_settings.MAX_KBS_PER_SEARCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"一次最多检索 {Settings.kb_settings.MAX_KBS_PER_SEARCH} 个知识库",
+        )
+    kbs = []
+    for name in names:
+        if not validate_kb_name(name):
+            raise HTTPException(status_code=403, detail="Don't attack me")
+        if (kb := KBServiceFactory.get_service_by_name(name)) is None:
+            raise HTTPException(status_code=404, detail=f"未找到知识库 {name}")
+        kbs.append(kb)
+
+    def search(kb) -> List[Document]:
+        try:
+            docs = kb.search_docs(query, top_k, score_threshold)
+        except Exception as e:
+            logger.exception(f"检索知识库 {kb.kb_name} 出错：{e}")
+            return []
+        return [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "kb_name": kb.kb_name})
+            for doc in docs
+        ]
+
+    if len(kbs) <= 1:
+        results = [search(kb) for kb in kbs]
+    else:
+        workers = min(len(kbs), max(Settings.kb_settings.MAX_PARALLEL_KB_SEARCH, 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(search, kbs))
+    return merge_ranked_docs(results, top_k)
+
+
 def list_files(knowledge_base_name: str) -> ListResponse:
     if not validate_kb_name(knowledge_base_name):
         return ListResponse(code=403, msg="Don't attack me", data=[])
@@ -426,10 +585,19 @@ def recreate_vector_store(
                 if not ok:
                     yield {"code": 404, "msg": msg}
                 else:
-                    if kb.exists():
+                    # 已有知识库的 Embedding 模型与请求一致时不整体清空向量库，而是逐个文件重建：
+                    # add_doc 按文件取出已有向量，文本未变化的文档不再重新向量化
+                    reuse = kb.exists() and kb.embed_model == embed_model
+                    if kb.exists() and not reuse:
                         kb.clear_vs()
                     kb.create_kb()
                     files = list_files_from_folder(knowledge_base_name)
+                    if reuse:
+                        for file_name in set(kb.list_files()) - set(files):
+                            kb.delete_doc(
+                                KnowledgeFile(filename=file_name, knowledge_base_name=knowledge_base_name),
+                                not_refresh_vs_cache=True,
+                            )
                     kb_files = [(file, knowledge_base_name) for file in files]
                     i = 0
                     for status, result in files2docs_in_thread(
@@ -454,9 +622,18 @@ def recreate_vector_store(
                                 },
                                 ensure_ascii=False,
                             )
-                            kb.add_doc(kb_file, not_refresh_vs_cache=True)
+                            kb.add_doc(
+                                kb_file,
+                                reuse_embeddings=None if reuse else {},
+                                not_refresh_vs_cache=True,
+                            )
                         else:
                             kb_name, file_name, error = result
+                            if reuse:
+                                kb.delete_doc(
+                                    KnowledgeFile(filename=file_name, knowledge_base_name=kb_name),
+                                    not_refresh_vs_cache=True,
+                                )
                             msg = f"添加文件‘{file_name}’到知识库‘{knowledge_base_name}’时出错：{error}。已跳过。"
                             logger.error(msg)
                             yield json.dumps(
@@ -1,6 +1,7 @@
 import operator
 import os
 from abc import ABC, abstractmethod
+from functools import wraps
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 
@@ -19,14 +20,22 @@ from chatchat.server.db.repository.knowledge_base_repository import (
 )
 from chatchat.server.db.repository.knowledge_file_repository import (
     add_file_to_db,
+    count_docs_from_db,
     count_files_from_db,
     delete_file_from_db,
     delete_files_from_db,
     file_exists_in_db,
     get_file_detail,
+    list_doc_hashes_from_db,
     list_docs_from_db,
     list_files_from_db,
 )
+from chatchat.server.embeddings_cache import reusing_embeddings, text_hash
+from chatchat.server.knowledge_base.kb_cache.metadata_index import match_metadata
+from chatchat.server.knowledge_base.kb_cache.search_cache import (
+    kb_versions,
+    search_result_cache,
+)
 from chatchat.server.knowledge_base.model.kb_document_model import DocumentWithVSId
 from chatchat.server.knowledge_base.utils import (
     KnowledgeFile,
@@ -35,6 +44,7 @@ from chatchat.server.knowledge_base.utils import (
     list_files_from_folder,
     list_kbs_from_folder,
 )
+from chatchat.server.knowledge_base.warmup import kb_usage
 from chatchat.server.utils import (
     check_embed_model as _check_embed_model,
     get_default_embedding,
@@ -43,6 +53,9 @@ from chatchat.server.utils import (
 
 logger = build_logger()
 
+# 向量库不支持按 metadata 过滤时，先多取 top_k 的若干倍结果再过滤
+FILTER_FETCH_RATIO = 5
+
 
 class SupportedVSType:
     FAISS = "faiss"
@@ -55,18 +68,39 @@ class SupportedVSType:
     CHROMADB = "chromadb"
 
 
+def bump_kb_version(func):
+    """
+    修改知识库内容的方法执行后（无论成功与否）递增知识库版本号，使检索结果缓存失效
+    """
+
+    @wraps(func)
+    def wrapper(self: "KBService", *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            kb_versions.bump(self.kb_name)
+
+    return wrapper
+
+
 class KBService(ABC):
+    # 子类支持的额外检索参数，search_docs 只会把这些参数传给 do_search。
+    # 包含 "filter" 表示 do_search/do_search_batch 能在向量库中直接按 metadata 过滤
+    search_params: Tuple[str, ...] = ()
+
     def __init__(
         self,
         knowledge_base_name: str,
         kb_info: str = None,
         embed_model: str = get_default_embedding(),
+        index_spec: Dict = None,
     ):
         self.kb_name = knowledge_base_name
         self.kb_info = kb_info or Settings.kb_settings.KB_INFO.get(
             knowledge_base_name, f"关于{knowledge_base_name}的知识库"
         )
         self.embed_model = embed_model
+        self.index_spec = index_spec
         self.kb_path = get_kb_path(self.kb_name)
         self.doc_path = get_doc_path(self.kb_name)
         self.do_init()
@@ -91,13 +125,18 @@ class KBService(ABC):
             os.makedirs(self.doc_path)
 
         status = add_kb_to_db(
-            self.kb_name, self.kb_info, self.vs_type(), self.embed_model
+            self.kb_name,
+            self.kb_info,
+            self.vs_type(),
+            self.embed_model,
+            self.index_spec,
         )
 
         if status:
             self.do_create_kb()
         return status
 
+    @bump_kb_version
     def clear_vs(self):
         """
         删除向量库中所有内容
@@ -106,6 +145,7 @@ class KBService(ABC):
         status = delete_files_from_db(self.kb_name)
         return status
 
+    @bump_kb_version
     def drop_kb(self):
         """
         删除知识库
@@ -114,10 +154,19 @@ class KBService(ABC):
         status = delete_kb_from_db(self.kb_name)
         return status
 
-    def add_doc(self, kb_file: KnowledgeFile, docs: List[Document] = [], **kwargs):
+    @bump_kb_version
+    def add_doc(
+        self,
+        kb_file: KnowledgeFile,
+        docs: List[Document] = [],
+        reuse_embeddings: Dict[str, List[float]] = None,
+        **kwargs,
+    ):
         """
         向知识库添加文件
         如果指定了docs，则不再将文本向量化，并将数据库对应条目标为custom_docs=True
+        reuse_embeddings: {文本哈希: 向量}，文本未变化的文档直接使用其中的向量。
+        未指定时使用该文件当前在向量库中的向量
         """
         if not self.check_embed_model()[0]:
             return False
@@ -141,8 +190,14 @@ class KBService(ABC):
                     print(
                         f"cannot convert absolute path ({source}) to relative path. error is : {e}"
                     )
+            if reuse_embeddings is None:
+                reuse_embeddings = self.get_reusable_embeddings(kb_file.filename)
             self.delete_doc(kb_file)
-            doc_infos = self.do_add_doc(docs, **kwargs)
+            with reusing_embeddings(self.embed_model, reuse_embeddings):
+                doc_infos = self.do_add_doc(docs, **kwargs)
+            # 各向量库返回的 doc_infos 与 docs 一一对应
+            for info, doc in zip(doc_infos or [], docs):
+                info["content_hash"] = text_hash(doc.page_content)
             status = add_file_to_db(
                 kb_file,
                 custom_docs=custom_docs,
@@ -153,6 +208,7 @@ class KBService(ABC):
             status = False
         return status
 
+    @bump_kb_version
     def delete_doc(
         self, kb_file: KnowledgeFile, delete_content: bool = False, **kwargs
     ):
@@ -184,8 +240,12 @@ class KBService(ABC):
             return False
 
         if os.path.exists(kb_file.filepath):
+            # 删除前取出已有向量，未变化的文本不再重新向量化
+            reuse_embeddings = self.get_reusable_embeddings(kb_file.filename)
             self.delete_doc(kb_file, **kwargs)
-            return self.add_doc(kb_file, docs=docs, **kwargs)
+            return self.add_doc(
+                kb_file, docs=docs, reuse_embeddings=reuse_embeddings, **kwargs
+            )
 
     def exist_doc(self, file_name: str):
         return file_exists_in_db(
@@ -203,19 +263,136 @@ class KBService(ABC):
         query: str,
         top_k: int = Settings.kb_settings.VECTOR_SEARCH_TOP_K,
         score_threshold: float = Settings.kb_settings.SCORE_THRESHOLD,
+        filter: Dict = None,
+        **kwargs,
     ) -> List[Document]:
+        """
+        filter: metadata 过滤条件 {键: 值或值列表}，仅支持一级键，值按字符串比较
+        kwargs 为向量库特有的检索参数（见 search_params），不支持或值为 None 的参数会被忽略。
+        结果按知识库版本缓存，知识库内容变更后缓存自动失效
+        """
         if not self.check_embed_model()[0]:
             return []
 
-        docs = self.do_search(query, top_k, score_threshold)
+        kb_usage.record(self.kb_name)
+        kwargs = self._filter_search_params(kwargs)
+        if filter:
+            kwargs["filter"] = filter
+        key = self._search_cache_key(query, top_k, score_threshold, **kwargs)
+        if (docs := search_result_cache.get(key)) is not None:
+            return docs
+        docs = self._search_batch([query], top_k, score_threshold, kwargs, batch=False)[0]
+        search_result_cache.set(key, docs)
         return docs
 
+    def search_docs_batch(
+        self,
+        queries: List[str],
+        top_k: int = Settings.kb_settings.VECTOR_SEARCH_TOP_K,
+        score_threshold: float = Settings.kb_settings.SCORE_THRESHOLD,
+        filter: Dict = None,
+        **kwargs,
+    ) -> List[List[Document]]:
+        """
+        批量检索，返回与 queries 一一对应的结果。查询文本一次性向量化，向量库支持时使用批量检索
+        """
+        if not queries:
+            return []
+        if not self.check_embed_model()[0]:
+            return [[] for _ in queries]
+
+        kb_usage.record(self.kb_name, len(queries))
+        kwargs = self._filter_search_params(kwargs)
+        if filter:
+            kwargs["filter"] = filter
+        keys = [
+            self._search_cache_key(query, top_k, score_threshold, **kwargs)
+            for query in queries
+        ]
+        results = [search_result_cache.get(key) for key in keys]
+        missed = [i for i, docs in enumerate(results) if docs is None]
+        if missed:
+            docs_list = self._search_batch(
+                [queries[i] for i in missed], top_k, score_threshold, kwargs
+            )
+            for i, docs in zip(missed, docs_list):
+                search_result_cache.set(keys[i], docs)
+                results[i] = docs
+        return results
+
+    def _search_batch(
+        self,
+        queries: List[str],
+        top_k: int,
+        score_threshold: float,
+        kwargs: Dict,
+        batch: bool = True,
+    ) -> List[List[Document]]:
+        """
+        调用 do_search(_batch)。向量库不支持原生 metadata 过滤时，多取一些结果后再过滤
+        """
+        filter = kwargs.get("filter")
+        k = top_k
+        if filter and "filter" not in self.search_params:
+            kwargs = {key: v for key, v in kwargs.items() if key != "filter"}
+            k = top_k * FILTER_FETCH_RATIO
+        if batch:
+            docs_list = self.do_search_batch(queries, k, score_threshold, **kwargs)
+        else:
+            docs_list = [self.do_search(queries[0], k, score_threshold, **kwargs)]
+        if k != top_k:
+            docs_list = [
+                [doc for doc in docs if match_metadata(doc.metadata, filter)][:top_k]
+                for docs in docs_list
+            ]
+        return docs_list
+
+    def _search_cache_key(self, query: str, top_k: int, score_threshold: float, **kwargs):
+        # 先取版本号再检索：检索期间知识库被修改时，结果以旧版本号缓存，不会被之后的请求命中
+        return search_result_cache.make_key(
+            self.kb_name,
+            kb_versions.get(self.kb_name),
+            query,
+            top_k,
+            score_threshold,
+            **kwargs,
+        )
+
+    def _filter_search_params(self, kwargs: Dict) -> Dict:
+        return {
+            k: v for k, v in kwargs.items() if k in self.search_params and v is not None
+        }
+
     def get_doc_by_ids(self, ids: List[str]) -> List[Document]:
-        return []
+        """
+        返回与 ids 一一对应的文档，不存在的文档为 None
+        """
+        return [None] * len(ids)
+
+    def get_vectors_by_ids(self, ids: List[str]) -> Dict[str, List[float]]:
+        """
+        读取向量库中已有文档的向量，用于复用未变化文本的向量。不支持的向量库返回空字典
+        """
+        return {}
+
+    def get_reusable_embeddings(self, file_name: str = None) -> Dict[str, List[float]]:
+        """
+        返回知识库（或其中某个文件）已有的向量：{文本哈希: 向量}
+        """
+        doc_hashes = list_doc_hashes_from_db(kb_name=self.kb_name, file_name=file_name)
+        if not doc_hashes:
+            return {}
+        try:
+            vectors = self.get_vectors_by_ids(list(doc_hashes))
+        except Exception as e:
+            logger.warning(f"读取知识库 {self.kb_name} 已有向量失败，将重新向量化：{e}")
+            return {}
+        return {doc_hashes[id]: vector for id, vector in vectors.items()}
 
     def del_doc_by_ids(self, ids: List[str]) -> bool:
         raise NotImplementedError
 
+    @bump_kb_version
     def update_doc_by_ids(self, docs: Dict[str, Document]) -> bool:
         """
         传入参数为： {doc_id: Document, ...}
@@ -244,17 +421,46 @@ class KBService(ABC):
         doc_infos = list_docs_from_db(
             kb_name=self.kb_name, file_name=file_name, metadata=metadata
         )
+        return self._fetch_docs(doc_infos)
+
+    def list_docs_page(
+        self,
+        file_name: str = None,
+        metadata: Dict = {},
+        offset: int = 0,
+        limit: int = 100,
+        cursor: int = None,
+    ) -> Tuple[List[DocumentWithVSId], Optional[int]]:
+        """
+        分页列出 Document，返回 (文档列表, 下一页的 cursor)，没有下一页时 cursor 为 None
+        """
+        doc_infos = list_docs_from_db(
+            kb_name=self.kb_name,
+            file_name=file_name,
+            metadata=metadata,
+            offset=offset,
+            limit=limit,
+            after=cursor,
+        )
+        next_cursor = doc_infos[-1]["row_id"] if len(doc_infos) == limit else None
+        return self._fetch_docs(doc_infos), next_cursor
+
+    def count_docs(self, file_name: str = None, metadata: Dict = {}) -> int:
+        return count_docs_from_db(
+            kb_name=self.kb_name, file_name=file_name, metadata=metadata
+        )
+
+    def _fetch_docs(self, doc_infos: List[Dict]) -> List[DocumentWithVSId]:
+        """
+        按 LIST_DOCS_BATCH_SIZE 分批从向量库读取文档，跳过向量库中已不存在的文档
+        """
+        batch_size = max(1, Settings.kb_settings.LIST_DOCS_BATCH_SIZE)
         docs = []
-        for x in doc_infos:
-            doc_info = self.get_doc_by_ids([x["id"]])[0]
-            if doc_info is not None:
-                # 处理非空的情况
-                doc_with_id = DocumentWithVSId(**{**doc_info.dict(), "id":x["id"]})
-                docs.append(doc_with_id)
-            else:
-                # 处理空的情况
-                # 可以选择跳过当前循环迭代或执行其他操作
-                pass
+        for i in range(0, len(doc_infos), batch_size):
+            ids = [x["id"] for x in doc_infos[i : i + batch_size]]
+            for id, doc in zip(ids, self.get_doc_by_ids(ids)):
+                if doc is not None:
+                    docs.append(DocumentWithVSId(**{**doc.dict(), "id": id}))
         return docs
 
     def get_relative_source_path(self, filepath: str):
@@ -319,6 +525,18 @@ class KBService(ABC):
         """
         pass
 
+    def do_search_batch(
+        self,
+        queries: List[str],
+        top_k: int,
+        score_threshold: float,
+        **kwargs,
+    ) -> List[List[Document]]:
+        """
+        批量检索知识库，默认逐条调用 do_search，支持批量检索的子类可以重写
+        """
+        return [self.do_search(query, top_k, score_threshold, **kwargs) for query in queries]
+
     @abstractmethod
     def do_add_doc(
         self,
@@ -352,6 +570,7 @@ class KBServiceFactory:
         vector_store_type: Union[str, SupportedVSType],
         embed_model: str = get_default_embedding(),
         kb_info: str = None,
+        index_spec: Dict = None,
     ) -> KBService:
         if isinstance(vector_store_type, str):
             vector_store_type = getattr(SupportedVSType, vector_store_type.upper())
@@ -359,6 +578,7 @@ class KBServiceFactory:
             "knowledge_base_name": kb_name,
             "embed_model": embed_model,
             "kb_info": kb_info,
+            "index_spec": index_spec,
         }
         if SupportedVSType.FAISS == vector_store_type:
             from chatchat.server.knowledge_base.kb_service.faiss_kb_service import (
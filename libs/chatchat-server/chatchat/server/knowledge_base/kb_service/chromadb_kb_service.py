@@ -48,6 +48,7 @@ def _results_to_docs_and_scores(results: Any) -> List[Tuple[Document, float]]:
 
 
 class ChromaKBService(KBService):
+    search_params = ("filter",)
     vs_path: str
     kb_path: str
     chroma: Chroma
@@ -88,13 +89,27 @@ class ChromaKBService(KBService):
             if not str(e) == f"Collection {self.kb_name} does not exist.":
                 raise e
 
+    @staticmethod
+    def _where(filter: Dict) -> Dict:
+        # chroma 按值的类型严格比较，这里保留原始类型
+        clauses = [
+            {key: {"$in": list(value) if isinstance(value, (list, tuple, set)) else [value]}}
+            for key, value in filter.items()
+        ]
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
     def do_search(
-        self, query: str, top_k: int, score_threshold: float = Settings.kb_settings.SCORE_THRESHOLD
+        self,
+        query: str,
+        top_k: int,
+        score_threshold: float = Settings.kb_settings.SCORE_THRESHOLD,
+        filter: Dict = None,
     ) -> List[Tuple[Document, float]]:
         retriever = get_Retriever("vectorstore").from_vectorstore(
             self.chroma,
             top_k=top_k,
             score_threshold=score_threshold,
+            search_kwargs={"filter": self._where(filter)} if filter else None,
         )
         docs = retriever.get_relevant_documents(query)
         return docs
@@ -115,7 +130,8 @@ class ChromaKBService(KBService):
 
     def get_doc_by_ids(self, ids: List[str]) -> List[Document]:
         get_result: GetResult = self.chroma._collection.get(ids=ids)
-        return _get_result_to_documents(get_result)
+        docs = dict(zip(get_result["ids"], _get_result_to_documents(get_result)))
+        return [docs.get(id) for id in ids]
 
     def del_doc_by_ids(self, ids: List[str]) -> bool:
         self.chroma._collection.delete(ids=ids)
@@ -1,7 +1,7 @@
 import logging
 import os
 import shutil
-from typing import List
+from typing import Dict, List
 
 from elasticsearch import BadRequestError, Elasticsearch
 from langchain.schema import Document
@@ -11,7 +11,9 @@ from langchain_community.vectorstores.elasticsearch import (
 )
 
 from chatchat.settings import Settings
+from chatchat.server.embeddings_cache import embed_queries
 from chatchat.server.file_rag.utils import get_Retriever
+from chatchat.server.knowledge_base.kb_cache.metadata_index import filter_values
 from chatchat.server.knowledge_base.kb_service.base import KBService, SupportedVSType
 from chatchat.server.knowledge_base.utils import KnowledgeFile
 from chatchat.server.utils import get_Embeddings
@@ -22,6 +24,8 @@ logger = build_logger()
 
 
 class ESKBService(KBService):
+    search_params = ("filter",)
+
     def do_init(self):
         self.kb_path = self.get_kb_path(self.kb_name)
         self.index_name = os.path.split(self.kb_path)[-1]
@@ -133,28 +137,84 @@ class ESKBService(KBService):
     def vs_type(self) -> str:
         return SupportedVSType.ES
 
-    def do_search(self, query: str, top_k: int, score_threshold: float):
+    @staticmethod
+    def _filter_clauses(filter: Dict) -> List[Dict]:
+        # metadata 中的字符串字段由动态映射生成 keyword 子字段，按其精确匹配
+        return [
+            {"terms": {f"metadata.{key}.keyword": filter_values(value)}}
+            for key, value in (filter or {}).items()
+        ]
+
+    def do_search(self, query: str, top_k: int, score_threshold: float, filter: Dict = None):
         # 文本相似性检索
         retriever = get_Retriever("vectorstore").from_vectorstore(
             self.db,
             top_k=top_k,
             score_threshold=score_threshold,
+            search_kwargs={"filter": self._filter_clauses(filter)} if filter else None,
         )
         docs = retriever.get_relevant_documents(query)
         return docs
 
-    def get_doc_by_ids(self, ids: List[str]) -> List[Document]:
+    def do_search_batch(
+        self, queries: List[str], top_k: int, score_threshold: float, **kwargs
+    ) -> List[List[Document]]:
+        # 一次向量化所有 query，通过 msearch 在一个请求中完成检索
+        embeddings = embed_queries(self.embeddings_model, queries)
+        # 近似检索的候选数不能小于 top_k，且 ES 限制最多 10000
+        fetch_k = min(max(top_k * 10, 50), 10000)
+        searches = []
+        for query, vector in zip(queries, embeddings):
+            body = self.db.strategy.query(
+                query_vector=vector,
+                query=query,
+                k=top_k,
+                fetch_k=fetch_k,
+                vector_query_field=self.db.vector_query_field,
+                text_field=self.db.query_field,
+                filter=self._filter_clauses(kwargs.get("filter")),
+                similarity=self.db.distance_strategy,
+            )
+            searches.append({"index": self.index_name})
+            searches.append({**body, "size": top_k, "_source": ["metadata", self.db.query_field]})
+        response = self.db.client.msearch(searches=searches)
+
+        # 与 do_search 的 similarity_score_threshold 检索一致，按相关度过滤
+        relevance_score_fn = self.db._select_relevance_score_fn()
         results = []
-        for doc_id in ids:
-            try:
-                response = self.es_client_python.get(index=self.index_name, id=doc_id)
-                source = response["_source"]
+        for item in response["responses"]:
+            docs = []
+            if "error" in item:
+                logger.error(f"ES 批量检索出错：{item['error']}")
+            for hit in item.get("hits", {}).get("hits", []):
+                if score_threshold is not None and relevance_score_fn(hit["_score"]) < score_threshold:
+                    continue
+                docs.append(
+                    Document(
+                        page_content=hit["_source"].get(self.db.query_field, ""),
+                        metadata=hit["_source"].get("metadata", {}),
+                    )
+                )
+            results.append(docs)
+        return results
+
+    def get_doc_by_ids(self, ids: List[str]) -> List[Document]:
+        results = [None] * len(ids)
+        if not ids:
+            return results
+        try:
+            # 一次请求取回全部文档，结果与 ids 一一对应
+            response = self.es_client_python.mget(index=self.index_name, ids=ids)
+            for i, hit in enumerate(response["docs"]):
+                if not hit.get("found"):
+                    continue
+                source = hit["_source"]
                 # Assuming your document has "text" and "metadata" fields
                 text = source.get("context", "")
                 metadata = source.get("metadata", {})
-                results.append(Document(page_content=text, metadata=metadata))
-            except Exception as e:
-                logger.error(f"Error retrieving document from Elasticsearch! {e}")
+                results[i] = Document(page_content=text, metadata=metadata)
+        except Exception as e:
+            logger.error(f"Error retrieving document from Elasticsearch! {e}")
         return results
 
     def del_doc_by_ids(self, ids: List[str]) -> bool:
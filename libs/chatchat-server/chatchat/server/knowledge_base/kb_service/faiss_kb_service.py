@@ -5,11 +5,18 @@ from typing import Dict, List, Tuple
 from langchain.docstore.document import Document
 
 from chatchat.settings import Settings
+from chatchat.server.embeddings_cache import embed_queries
+from chatchat.server.db.repository.knowledge_base_repository import (
+    get_kb_index_spec,
+    update_kb_index_spec,
+)
 from chatchat.server.file_rag.utils import get_Retriever
 from chatchat.server.knowledge_base.kb_cache.faiss_cache import (
     ThreadSafeFaiss,
     kb_faiss_pool,
+    persist_scheduler,
 )
+from chatchat.server.knowledge_base.kb_cache.faiss_index import FaissIndexSpec
 from chatchat.server.knowledge_base.kb_service.base import KBService, SupportedVSType
 from chatchat.server.knowledge_base.utils import KnowledgeFile, get_kb_path, get_vs_path
 
@@ -18,6 +25,7 @@ class FaissKBService(KBService):
     vs_path: str
     kb_path: str
     vector_name: str = None
+    search_params = ("nprobe", "ef_search", "filter")
 
     def vs_type(self) -> str:
         return SupportedVSType.FAISS
@@ -33,23 +41,44 @@ class FaissKBService(KBService):
             kb_name=self.kb_name,
             vector_name=self.vector_name,
             embed_model=self.embed_model,
+            index_spec=self.index_spec,
         )
 
     def save_vector_store(self):
         self.load_vector_store().save(self.vs_path)
 
+    def convert_index(self, index_spec: Dict):
+        """
+        用 index_spec 更新知识库的索引参数并立即按新参数重建索引，如为已有知识库启用向量压缩
+        """
+        spec = {**(self.index_spec or {}), **index_spec}
+        FaissIndexSpec.from_config(spec)
+        update_kb_index_spec(self.kb_name, spec)
+        self.index_spec = spec
+        self.load_vector_store().convert_index(spec)
+
     def get_doc_by_ids(self, ids: List[str]) -> List[Document]:
-        with self.load_vector_store().acquire() as vs:
+        with self.load_vector_store().acquire(shared=True) as vs:
             return [vs.docstore._dict.get(id) for id in ids]
 
+    def get_vectors_by_ids(self, ids: List[str]) -> Dict[str, List[float]]:
+        with self.load_vector_store().acquire(shared=True) as vs:
+            return vs.get_vectors_by_ids(ids)
+
     def del_doc_by_ids(self, ids: List[str]) -> bool:
-        with self.load_vector_store().acquire() as vs:
+        item = self.load_vector_store()
+        with item.acquire() as vs:
             vs.delete(ids)
+            item.mark_dirty(len(ids))
 
     def do_init(self):
         self.vector_name = self.vector_name or self.embed_model.replace(":", "_")
         self.kb_path = self.get_kb_path()
         self.vs_path = self.get_vs_path()
+        if self.index_spec is None:
+            self.index_spec = get_kb_index_spec(self.kb_name)
+        # 提前校验索引参数
+        FaissIndexSpec.from_config(self.index_spec)
 
     def do_create_kb(self):
         if not os.path.exists(self.vs_path):
@@ -68,16 +97,40 @@ class FaissKBService(KBService):
         query: str,
         top_k: int,
         score_threshold: float = Settings.kb_settings.SCORE_THRESHOLD,
+        **kwargs,
     ) -> List[Tuple[Document, float]]:
-        with self.load_vector_store().acquire() as vs:
+        with self.load_vector_store().acquire(shared=True) as vs:
             retriever = get_Retriever("ensemble").from_vectorstore(
                 vs,
                 top_k=top_k,
                 score_threshold=score_threshold,
+                search_kwargs=kwargs,
             )
             docs = retriever.get_relevant_documents(query)
         return docs
 
+    def do_search_batch(
+        self,
+        queries: List[str],
+        top_k: int,
+        score_threshold: float = Settings.kb_settings.SCORE_THRESHOLD,
+        **kwargs,
+    ) -> List[List[Document]]:
+        with self.load_vector_store().acquire(shared=True) as vs:
+            embeddings = embed_queries(vs.embeddings, queries)
+            vector_docs = vs.similarity_search_with_relevance_scores_by_vectors(
+                embeddings, k=top_k, score_threshold=score_threshold, **kwargs
+            )
+            retriever = get_Retriever("ensemble").from_vectorstore(
+                vs,
+                top_k=top_k,
+                score_threshold=score_threshold,
+                search_kwargs=kwargs,
+            )
+            return retriever.get_relevant_documents_batch(
+                queries, [[doc for doc, _ in docs] for docs in vector_docs]
+            )
+
     def do_add_doc(
         self,
         docs: List[Document],
@@ -85,32 +138,36 @@ class FaissKBService(KBService):
     ) -> List[Dict]:
         texts = [x.page_content for x in docs]
         metadatas = [x.metadata for x in docs]
-        with self.load_vector_store().acquire() as vs:
+        item = self.load_vector_store()
+        with item.acquire() as vs:
             embeddings = vs.embeddings.embed_documents(texts)
             ids = vs.add_embeddings(
                 text_embeddings=zip(texts, embeddings), metadatas=metadatas
             )
             if not kwargs.get("not_refresh_vs_cache"):
-                vs.save_local(self.vs_path)
+                item.mark_dirty(len(ids))
         doc_infos = [{"id": id, "metadata": doc.metadata} for id, doc in zip(ids, docs)]
         return doc_infos
 
     def do_delete_doc(self, kb_file: KnowledgeFile, **kwargs):
-        with self.load_vector_store().acquire() as vs:
-            ids = [
-                k
-                for k, v in vs.docstore._dict.items()
-                if v.metadata.get("source").lower() == kb_file.filename.lower()
-            ]
+        item = self.load_vector_store()
+        with item.acquire() as vs:
+            ids = vs.get_ids_by_source(kb_file.filename)
             if len(ids) > 0:
                 vs.delete(ids)
             if not kwargs.get("not_refresh_vs_cache"):
-                vs.save_local(self.vs_path)
+                item.mark_dirty(len(ids))
         return ids
 
     def do_clear_vs(self):
+        key = (self.kb_name, self.vector_name)
         with kb_faiss_pool.atomic:
-            kb_faiss_pool.pop((self.kb_name, self.vector_name))
+            item = kb_faiss_pool.pop(key)
+        if item is not None:
+            # 之后的写入与保存都不再落盘
+            item.path = None
+        # 放弃未保存的变更，并等待正在进行的保存结束，避免旧数据写回清空后的目录
+        persist_scheduler.discard(key, wait=True)
         try:
             shutil.rmtree(self.vs_path)
         except Exception:
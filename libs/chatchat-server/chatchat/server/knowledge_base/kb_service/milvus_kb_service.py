@@ -1,13 +1,16 @@
+import json
+import math
 import os
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 
 from langchain.schema import Document
 from langchain.vectorstores.milvus import Milvus
 
 from chatchat.settings import Settings
+from chatchat.server.embeddings_cache import embed_queries
 from chatchat.server.db.repository import list_file_num_docs_id_by_kb_name_and_file_name
 from chatchat.server.utils import get_Embeddings
-from chatchat.server.file_rag.utils import get_Retriever
+from chatchat.server.knowledge_base.kb_cache.metadata_index import filter_values
 from chatchat.server.knowledge_base.kb_service.base import (
     KBService,
     SupportedVSType,
@@ -18,6 +21,7 @@ from chatchat.server.knowledge_base.utils import KnowledgeFile
 
 class MilvusKBService(KBService):
     milvus: Milvus
+    search_params = ("filter",)
 
     @staticmethod
     def get_collection(milvus_name):
@@ -26,7 +30,7 @@ class MilvusKBService(KBService):
         return Collection(milvus_name)
 
     def get_doc_by_ids(self, ids: List[str]) -> List[Document]:
-        result = []
+        result = {}
         if self.milvus.col:
             # ids = [int(id) for id in ids]  # for milvus if needed #pr 2725
             data_list = self.milvus.col.query(
@@ -34,8 +38,17 @@ class MilvusKBService(KBService):
             )
             for data in data_list:
                 text = data.pop("text")
-                result.append(Document(page_content=text, metadata=data))
-        return result
+                result[str(data.get("pk"))] = Document(page_content=text, metadata=data)
+        return [result.get(str(_id)) for _id in ids]
+
+    def get_vectors_by_ids(self, ids: List[str]) -> Dict[str, List[float]]:
+        if not self.milvus.col:
+            return {}
+        data_list = self.milvus.col.query(
+            expr=f"pk in {[int(_id) for _id in ids]}",
+            output_fields=["pk", self.milvus._vector_field],
+        )
+        return {str(data["pk"]): data[self.milvus._vector_field] for data in data_list}
 
     def del_doc_by_ids(self, ids: List[str]) -> bool:
         self.milvus.col.delete(expr=f"pk in {ids}")
@@ -75,18 +88,66 @@ class MilvusKBService(KBService):
             self.milvus.col.release()
             self.milvus.col.drop()
 
-    def do_search(self, query: str, top_k: int, score_threshold: float):
+    def _filter_expr(self, filter: Dict) -> Optional[str]:
+        """
+        将 metadata 过滤条件转为 milvus 的 expr。metadata 以字符串保存在同名字段中，
+        过滤条件中有集合不存在的字段时没有文档能满足，返回 None
+        """
+        clauses = []
+        for key, value in filter.items():
+            if not key.isidentifier() or key not in self.milvus.fields:
+                return None
+            clauses.append(f"{key} in {json.dumps(filter_values(value), ensure_ascii=False)}")
+        return " and ".join(clauses)
+
+    def do_search(self, query: str, top_k: int, score_threshold: float, filter: Dict = None):
+        # 与批量检索共用同一实现，保证 score_threshold 均按相关度（见 _relevance_score_fn）过滤
+        return self.do_search_batch([query], top_k, score_threshold, filter=filter)[0]
+
+    def _relevance_score_fn(self) -> Callable[[float], float]:
+        """
+        将 milvus 返回的分数转为相关度（越大越相关），与 similarity_score_threshold 检索的阈值语义一致：
+        L2 返回的是距离的平方，先开方再按欧氏距离换算；IP/COSINE 返回的已是相似度
+        """
+        metric = (self.milvus.search_params or {}).get("metric_type", "L2")
+        if metric.upper() == "L2":
+            return lambda score: self.milvus._euclidean_relevance_score_fn(math.sqrt(max(score, 0.0)))
+        return lambda score: score
+
+    def do_search_batch(
+        self, queries: List[str], top_k: int, score_threshold: float, **kwargs
+    ) -> List[List[Document]]:
+        # 一次向量化所有 query，并以多向量方式检索
         self._load_milvus()
-        # embed_func = get_Embeddings(self.embed_model)
-        # embeddings = embed_func.embed_query(query)
-        # docs = self.milvus.similarity_search_with_score_by_vector(embeddings, top_k)
-        retriever = get_Retriever("milvusvectorstore").from_vectorstore(
-            self.milvus,
-            top_k=top_k,
-            score_threshold=score_threshold,
+        if self.milvus.col is None:
+            return [[] for _ in queries]
+        expr = None
+        if filter := kwargs.get("filter"):
+            if (expr := self._filter_expr(filter)) is None:
+                return [[] for _ in queries]
+        embeddings = embed_queries(self.milvus.embedding_func, queries)
+        output_fields = self.milvus.fields[:]
+        output_fields.remove(self.milvus._vector_field)
+        res = self.milvus.col.search(
+            data=embeddings,
+            anns_field=self.milvus._vector_field,
+            param=self.milvus.search_params,
+            limit=top_k,
+            expr=expr,
+            output_fields=output_fields,
+            timeout=self.milvus.timeout,
         )
-        docs = retriever.get_relevant_documents(query)
-        return docs
+        relevance_score_fn = self._relevance_score_fn()
+        results = []
+        for hits in res:
+            docs = []
+            for hit in hits:
+                if score_threshold is not None and relevance_score_fn(hit.score) < score_threshold:
+                    continue
+                data = {x: hit.entity.get(x) for x in output_fields}
+                docs.append(self.milvus._parse_document(data))
+            results.append(docs[:top_k])
+        return results
 
     def do_add_doc(self, docs: List[Document], **kwargs) -> List[Dict]:
         for doc in docs:
@@ -11,6 +11,7 @@ from sqlalchemy.orm import Session
 
 from chatchat.settings import Settings
 from chatchat.server.file_rag.utils import get_Retriever
+from chatchat.server.knowledge_base.kb_cache.metadata_index import filter_values
 from chatchat.server.knowledge_base.kb_service.base import (
     KBService,
     SupportedVSType,
@@ -21,6 +22,7 @@ from chatchat.server.utils import get_Embeddings
 
 
 class PGKBService(KBService):
+    search_params = ("filter",)
     engine: Engine = sqlalchemy.create_engine(
         Settings.kb_settings.kbs_config.get("pg").get("connection_uri"), pool_size=10
     )
@@ -37,13 +39,13 @@ class PGKBService(KBService):
     def get_doc_by_ids(self, ids: List[str]) -> List[Document]:
         with Session(PGKBService.engine) as session:
             stmt = text(
-                "SELECT document, cmetadata FROM langchain_pg_embedding WHERE custom_id = ANY(:ids)"
+                "SELECT custom_id, document, cmetadata FROM langchain_pg_embedding WHERE custom_id = ANY(:ids)"
             )
-            results = [
-                Document(page_content=row[0], metadata=row[1])
+            results = {
+                row[0]: Document(page_content=row[1], metadata=row[2])
                 for row in session.execute(stmt, {"ids": ids}).fetchall()
-            ]
-            return results
+            }
+            return [results.get(_id) for _id in ids]
 
     def del_doc_by_ids(self, ids: List[str]) -> bool:
         return super().del_doc_by_ids(ids)
@@ -75,11 +77,19 @@ class PGKBService(KBService):
             session.commit()
             shutil.rmtree(self.kb_path)
 
-    def do_search(self, query: str, top_k: int, score_threshold: float):
+    def _filter_clause(self, filter: Dict) -> Dict:
+        # 由 PGVector 转为 cmetadata 上的 WHERE 条件，按字符串比较
+        if getattr(self.pg_vector, "use_jsonb", False):
+            clauses = [{key: {"$in": filter_values(value)}} for key, value in filter.items()]
+            return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+        return {key: {"in": filter_values(value)} for key, value in filter.items()}
+
+    def do_search(self, query: str, top_k: int, score_threshold: float, filter: Dict = None):
         retriever = get_Retriever("vectorstore").from_vectorstore(
             self.pg_vector,
             top_k=top_k,
             score_threshold=score_threshold,
+            search_kwargs={"filter": self._filter_clause(filter)} if filter else None,
         )
         docs = retriever.get_relevant_documents(query)
         return docs
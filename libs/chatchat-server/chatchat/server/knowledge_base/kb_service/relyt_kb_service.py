@@ -31,13 +31,13 @@ class RelytKBService(KBService):
         ids_str = ", ".join([f"{id}" for id in ids])
         with Session(self.engine) as session:
             stmt = text(
-                f"SELECT text, meta FROM collection_{self.kb_name} WHERE id in (:ids)"
+                f"SELECT id, text, meta FROM collection_{self.kb_name} WHERE id in (:ids)"
             )
-            results = [
-                Document(page_content=row[0], metadata=row[1])
+            results = {
+                str(row[0]): Document(page_content=row[1], metadata=row[2])
                 for row in session.execute(stmt, {"ids": ids_str}).fetchall()
-            ]
-            return results
+            }
+            return [results.get(str(id)) for id in ids]
 
     def del_doc_by_ids(self, ids: List[str]) -> bool:
         ids_str = ", ".join([f"{id}" for id in ids])
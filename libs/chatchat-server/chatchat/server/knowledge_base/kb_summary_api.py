@@ -252,6 +252,7 @@ def summary_doc_ids_to_vector_store(
         doc_info_with_ids = [
             DocumentWithVSId(**{**doc.dict(), "id":with_id})
             for with_id, doc in zip(doc_ids, doc_infos)
+            if doc is not None
         ]
 
         docs = summary.summarize(
@@ -1,8 +1,10 @@
+import json
 import os
 from datetime import datetime
-from typing import List, Literal
+from typing import Dict, List, Literal
 
 from dateutil.parser import parse
+from sqlalchemy import inspect, text
 
 from chatchat.settings import Settings
 from chatchat.server.db.base import Base, engine
@@ -37,6 +39,28 @@ logger = build_logger()
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    upgrade_tables()
+
+
+def upgrade_tables():
+    """
+    create_all 不会修改已存在的表，这里为旧版本数据库补充新增的字段
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(
+                        text(
+                            f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                        )
+                    )
+                    logger.info(f"已为数据表 {table.name} 添加字段 {column.name}")
 
 
 def reset_tables():
@@ -204,6 +228,22 @@ def folder2db(
         print("-" * 100 + "\n")
 
 
+def convert_index(kb_names: List[str], index_spec: Dict):
+    """
+    convert existing FAISS knowledge bases to the given index spec (e.g. {"quantizer": "int8"}).
+    the spec is merged into and saved as the knowledge base's index spec, then the index is rebuilt.
+    """
+    from chatchat.server.knowledge_base.kb_service.faiss_kb_service import FaissKBService
+
+    for kb_name in kb_names or list_kbs_from_folder():
+        kb = KBServiceFactory.get_service_by_name(kb_name)
+        if not isinstance(kb, FaissKBService):
+            print(f"skip {kb_name}: not a FAISS knowledge base in database")
+            continue
+        kb.convert_index(index_spec)
+        print(f"success to convert index of {kb_name}: {json.dumps(kb.index_spec)}")
+
+
 def prune_db_docs(kb_names: List[str]):
     """
     delete docs in database that not existed in local folder.
@@ -471,7 +471,8 @@ def format_reference(kb_name: str, docs: List[Dict], api_base_url: str="") -> Li
         filename = doc.get("metadata", {}).get("source")
         parameters = urlencode(
             {
-                "knowledge_base_name": kb_name,
+                # 多知识库检索时，文档所属的知识库记录在 metadata 中
+                "knowledge_base_name": doc.get("metadata", {}).get("kb_name", kb_name),
                 "file_name": filename,
             }
         )
@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from chatchat.settings import Settings
+from chatchat.server.db.repository.knowledge_base_repository import list_kbs_from_db
+from chatchat.utils import build_logger
+
+
+logger = build_logger()
+
+
+class KBUsage:
+    """
+    各知识库的检索次数，用于启动时选择预加载的知识库。
+    统计与以往保存的结果累加；有新的检索时每隔 interval 秒保存到文件，服务退出时也会保存（interval <= 0 时只在退出时保存）
+    """
+
+    def __init__(self, path: str = None, interval: float = 0):
+        self.path = path
+        self.interval = interval
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saver = None
+        if path and os.path.isfile(path):
+            try:
+                with open(path, encoding="utf-8") as fp:
+                    self._counts.update(json.load(fp))
+            except Exception as e:
+                logger.warning(f"读取知识库使用统计 {path} 失败：{e}")
+
+    def record(self, kb_name: str, count: int = 1):
+        with self._lock:
+            self._counts[kb_name] += count
+            self._dirty = True
+            if self._saver is None and self.path and self.interval > 0:
+                self._saver = threading.Thread(
+                    target=self._save_forever, name="kb-usage-saver", daemon=True
+                )
+                self._saver.start()
+
+    def most_common(self, n: int) -> List[str]:
+        with self._lock:
+            return [name for name, _ in self._counts.most_common(n)]
+
+    def _save_forever(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.save()
+            except Exception as e:
+                logger.warning(f"保存知识库使用统计 {self.path} 失败：{e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            counts = dict(self._counts)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                json.dump(counts, fp, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            with self._lock:
+                self._dirty = True
+            raise
+
+
+kb_usage = KBUsage(
+    str(Settings.basic_settings.DATA_PATH / "cache" / "kb_usage.json"),
+    interval=Settings.kb_settings.WARMUP_USAGE_SAVE_INTERVAL,
+)
+
+
+def warmup_enabled() -> bool:
+    return bool(Settings.kb_settings.WARMUP_KBS or Settings.kb_settings.WARMUP_TOP_N > 0)
+
+
+def _warmup_text_processing():
+    """
+    加载 jieba 词典与默认的文本分割器（可能需要加载 tokenizer），避免首次检索或上传文件时的延迟
+    """
+    import jieba
+
+    from chatchat.server.knowledge_base.utils import make_text_splitter
+
+    jieba.initialize()
+    make_text_splitter(
+        splitter_name=Settings.kb_settings.TEXT_SPLITTER_NAME,
+        chunk_size=Settings.kb_settings.CHUNK_SIZE,
+        chunk_overlap=Settings.kb_settings.OVERLAP_SIZE,
+    )
+
+
+def _warmup_kb(kb_name: str):
+    # kb_service 依赖本模块的 kb_usage，在此导入以避免循环导入
+    from chatchat.server.knowledge_base.kb_service.base import KBServiceFactory
+
+    kb = KBServiceFactory.get_service_by_name(kb_name)
+    if kb is None:
+        raise ValueError(f"未找到知识库 {kb_name}")
+    # FAISS 知识库需要从磁盘加载到缓存，其它向量库在创建服务时已建立连接
+    if hasattr(kb, "load_vector_store"):
+        kb.load_vector_store()
+
+
+def _limit_to_capacity(kb_names: List[str]) -> List[str]:
+    """
+    向量库缓存最多保留 CACHED_VS_NUM 个知识库，多余的知识库加载后会立即被淘汰（常驻知识库除外），因此不预加载
+    """
+    capacity = Settings.kb_settings.CACHED_VS_NUM
+    if capacity <= 0:
+        return kb_names
+    pinned = set(Settings.kb_settings.PINNED_KBS)
+    selected, dropped = [], []
+    remain = capacity - sum(1 for name in kb_names if name in pinned)
+    for name in kb_names:
+        if name in pinned:
+            selected.append(name)
+        elif remain > 0:
+            selected.append(name)
+            remain -= 1
+        else:
+            dropped.append(name)
+    if dropped:
+        logger.warning(
+            f"预加载的知识库数量超过向量库缓存数量 CACHED_VS_NUM={capacity}，以下知识库不预加载：{dropped}"
+        )
+    return selected
+
+
+def select_warmup_kbs(kb_names: List[str] = None, top_n: int = None) -> List[str]:
+    """
+    需要预加载的知识库：指定的知识库，加上检索次数最多的 top_n 个知识库，总数不超过向量库缓存数量
+    """
+    if kb_names is None:
+        kb_names = Settings.kb_settings.WARMUP_KBS
+    if top_n is None:
+        top_n = Settings.kb_settings.WARMUP_TOP_N
+    existing = set(list_kbs_from_db())
+    selected = [name for name in kb_names if name in existing]
+    if top_n > 0:
+        most_used = [
+            name
+            for name in kb_usage.most_common(len(existing))
+            if name in existing and name not in selected
+        ]
+        selected += most_used[:top_n]
+    return _limit_to_capacity(selected)
+
+
+def warmup(
+    kb_names: List[str] = None,
+    top_n: int = None,
+    max_workers: int = None,
+) -> Dict[str, bool]:
+    """
+    并行预加载知识库及分词等依赖，返回 {知识库名称: 是否加载成功}
+    """
+    start = time.time()
+    kb_names = select_warmup_kbs(kb_names, top_n)
+    max_workers = max_workers or Settings.kb_settings.WARMUP_WORKERS
+    result = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        text_future = pool.submit(_warmup_text_processing)
+        futures = {name: pool.submit(_warmup_kb, name) for name in kb_names}
+        for name, future in futures.items():
+            try:
+                future.result()
+                result[name] = True
+            except Exception as e:
+                logger.error(f"预加载知识库 {name} 失败：{e}")
+                result[name] = False
+        try:
+            text_future.result()
+        except Exception as e:
+            logger.warning(f"预加载文本分割器失败：{e}")
+    logger.info(
+        f"预加载完成，耗时 {time.time() - start:.2f} 秒，知识库：{kb_names}"
+    )
+    return result
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import threading
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from typing import (
     Any,
     Callable,
@@ -28,10 +31,12 @@ from tenacity import (
     wait_exponential,
 )
 
-from chatchat.server.utils import run_in_thread_pool
-
 logger = logging.getLogger(__name__)
 
+# Shared by all instances so that embedding documents does not start new threads
+# on every call; each call still runs at most ``max_concurrency`` batches at a time.
+_BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="localai-embed")
+
 
 def _create_retry_decorator(embeddings: LocalAIEmbeddings) -> Callable[[Any], Any]:
     import openai
@@ -156,6 +161,8 @@ class LocalAIEmbeddings(BaseModel, Embeddings):
     disallowed_special: Union[Literal["all"], Set[str], Sequence[str]] = "all"
     chunk_size: int = 1000
     """Maximum number of texts to embed in each batch"""
+    max_concurrency: int = 4
+    """Maximum number of batches to embed concurrently."""
     max_retries: int = 3
     """Maximum number of retries to make when generating."""
     request_timeout: Union[float, Tuple[float, float], Any, None] = Field(
@@ -277,47 +284,57 @@ class LocalAIEmbeddings(BaseModel, Embeddings):
             }  # type: ignore[assignment]  # noqa: E501
         return openai_args
 
-    def _embedding_func(self, text: str, *, engine: str) -> List[float]:
-        """Call out to LocalAI's embedding endpoint."""
-        # handle large input text
+    def _prepare_texts(self, texts: List[str]) -> List[str]:
         if self.model.endswith("001"):
             # See: https://github.com/openai/openai-python/issues/418#issuecomment-1525939500
             # replace newlines, which can negatively affect performance.
-            text = text.replace("\n", " ")
-        return (
-            embed_with_retry(
-                self,
-                input=[text],
-                **self._invocation_params,
+            texts = [text.replace("\n", " ") for text in texts]
+        return texts
+
+    def _batches(self, texts: List[str], chunk_size: Optional[int]) -> List[List[str]]:
+        size = chunk_size or self.chunk_size
+        texts = self._prepare_texts(texts)
+        return [texts[i : i + size] for i in range(0, len(texts), size)]
+
+    @staticmethod
+    def _parse_response(response: Any, count: int) -> List[List[float]]:
+        data = sorted(response.data, key=lambda d: d.index)
+        if len(data) != count:
+            import openai
+
+            raise openai.APIError(
+                f"LocalAI API returned {len(data)} embeddings for {count} texts"
             )
-            .data[0]
-            .embedding
+        return [d.embedding for d in data]
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Call out to LocalAI's embedding endpoint with a batch of texts."""
+        response = embed_with_retry(self, input=texts, **self._invocation_params)
+        return self._parse_response(response, len(texts))
+
+    async def _aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Call out to LocalAI's embedding endpoint async with a batch of texts."""
+        response = await async_embed_with_retry(
+            self, input=texts, **self._invocation_params
         )
+        return self._parse_response(response, len(texts))
+
+    def _embedding_func(self, text: str, *, engine: str) -> List[float]:
+        """Call out to LocalAI's embedding endpoint."""
+        return self._embed_batch(self._prepare_texts([text]))[0]
 
     async def _aembedding_func(self, text: str, *, engine: str) -> List[float]:
         """Call out to LocalAI's embedding endpoint."""
-        # handle large input text
-        if self.model.endswith("001"):
-            # See: https://github.com/openai/openai-python/issues/418#issuecomment-1525939500
-            # replace newlines, which can negatively affect performance.
-            text = text.replace("\n", " ")
-        return (
-            (
-                await async_embed_with_retry(
-                    self,
-                    input=[text],
-                    **self._invocation_params,
-                )
-            )
-            .data[0]
-            .embedding
-        )
+        return (await self._aembed_batch(self._prepare_texts([text])))[0]
 
     def embed_documents(
         self, texts: List[str], chunk_size: Optional[int] = 0
     ) -> List[List[float]]:
         """Call out to LocalAI's embedding endpoint for embedding search docs.
 
+        Texts are sent in batches of ``chunk_size``, at most ``max_concurrency``
+        batches at a time. Each batch is retried on its own.
+
         Args:
             texts: The list of texts to embed.
             chunk_size: The chunk size of embeddings. If None, will use the chunk size
@@ -326,21 +343,34 @@ class LocalAIEmbeddings(BaseModel, Embeddings):
         Returns:
             List of embeddings, one for each text.
         """
-
-        # call _embedding_func for each text with multithreads
-        def task(seq, text):
-            return (seq, self._embedding_func(text, engine=self.deployment))
-
-        params = [{"seq": i, "text": text} for i, text in enumerate(texts)]
-        result = list(run_in_thread_pool(func=task, params=params))
-        result = sorted(result, key=lambda x: x[0])
-        return [x[1] for x in result]
+        batches = self._batches(texts, chunk_size)
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            semaphore = threading.Semaphore(self.max_concurrency)
+
+            def embed(batch: List[str]) -> List[List[float]]:
+                try:
+                    return self._embed_batch(batch)
+                finally:
+                    semaphore.release()
+
+            futures = []
+            for batch in batches:
+                semaphore.acquire()
+                futures.append(_BATCH_EXECUTOR.submit(embed, batch))
+            # futures keep the order of batches
+            results = [future.result() for future in futures]
+        return [embedding for batch in results for embedding in batch]
 
     async def aembed_documents(
         self, texts: List[str], chunk_size: Optional[int] = 0
     ) -> List[List[float]]:
         """Call out to LocalAI's embedding endpoint async for embedding search docs.
 
+        Texts are sent in batches of ``chunk_size``, at most ``max_concurrency``
+        batches at a time. Each batch is retried on its own.
+
         Args:
             texts: The list of texts to embed.
             chunk_size: The chunk size of embeddings. If None, will use the chunk size
@@ -349,11 +379,16 @@ class LocalAIEmbeddings(BaseModel, Embeddings):
         Returns:
             List of embeddings, one for each text.
         """
-        embeddings = []
-        for text in texts:
-            response = await self._aembedding_func(text, engine=self.deployment)
-            embeddings.append(response)
-        return embeddings
+        semaphore = asyncio.Semaphore(max(self.max_concurrency, 1))
+
+        async def embed(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self._aembed_batch(batch)
+
+        results = await asyncio.gather(
+            *[embed(batch) for batch in self._batches(texts, chunk_size)]
+        )
+        return [embedding for batch in results for embedding in batch]
 
     def embed_query(self, text: str) -> List[float]:
         """Call out to LocalAI's embedding endpoint for embedding query text.
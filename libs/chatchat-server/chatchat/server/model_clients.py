@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import weakref
+from typing import Dict, List, Optional, Tuple, Union
+
+import httpx
+import openai
+
+from chatchat.settings import Settings
+from chatchat.utils import build_logger
+
+logger = build_logger()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+
+        return True
+    except ImportError:
+        return False
+
+
+def _close_http_client(
+    http_client: Union[httpx.Client, httpx.AsyncClient],
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+):
+    """
+    客户端被回收时关闭其连接池：同步客户端直接关闭，异步客户端在其所属的事件循环中关闭
+    """
+    try:
+        if loop is None:
+            http_client.close()
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(lambda: loop.create_task(http_client.aclose()))
+    except Exception as e:
+        logger.warning(f"关闭模型客户端失败：{e}")
+
+
+class ModelClientRegistry:
+    """
+    复用访问模型平台的 openai 客户端及其 httpx 连接池，避免每次请求重新建立 TCP/TLS 连接。
+    客户端按 (base_url, api_key, proxy, 同步/异步) 缓存；异步客户端的连接绑定事件循环，因此另按事件循环区分，
+    没有运行中的事件循环时不缓存异步客户端。
+    MODEL_PLATFORMS 配置重新加载后（与 _ModelIndex 相同，以配置对象是否变化判断）丢弃全部缓存的客户端。
+    丢弃的客户端可能仍在被其它请求使用，因此不立即关闭，而是在最后一个使用者释放、客户端被回收时关闭其连接池。
+    """
+
+    def __init__(self):
+        self._clients: Dict[Tuple, Union[openai.OpenAI, openai.AsyncOpenAI]] = {}
+        # 异步客户端所属的事件循环，循环关闭后丢弃对应的客户端
+        self._loops: Dict[int, asyncio.AbstractEventLoop] = {}
+        self._config: Optional[List] = None
+        self._lock = threading.Lock()
+        self._http2: Optional[bool] = None
+
+    def _check_platforms(self):
+        config = Settings.model_settings.MODEL_PLATFORMS
+        if config is not self._config:
+            if self._config is not None:
+                logger.info("模型平台配置已变化，重新创建模型客户端")
+            self._drop_all()
+            self._config = config
+
+    def _drop_all(self):
+        # 客户端被回收时由 _close_http_client 关闭
+        self._clients.clear()
+        self._loops.clear()
+
+    def _drop_closed_loops(self):
+        # 事件循环已关闭，其中的连接无法再关闭，直接丢弃
+        closed = {key for key, loop in self._loops.items() if loop.is_closed()}
+        if closed:
+            self._clients = {k: v for k, v in self._clients.items() if k[-1] not in closed}
+            for key in closed:
+                del self._loops[key]
+
+    def _use_http2(self) -> bool:
+        if self._http2 is None:
+            self._http2 = Settings.model_settings.HTTPX_HTTP2 and _http2_available()
+            if Settings.model_settings.HTTPX_HTTP2 and not self._http2:
+                logger.warning("HTTPX_HTTP2 需要安装 h2，请执行 pip install httpx[http2]")
+        return self._http2
+
+    def new_http_client(
+        self, proxy: str = None, is_async: bool = False
+    ) -> Union[httpx.Client, httpx.AsyncClient]:
+        ms = Settings.model_settings
+        limits = httpx.Limits(
+            max_connections=ms.HTTPX_MAX_CONNECTIONS,
+            max_keepalive_connections=ms.HTTPX_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=ms.HTTPX_KEEPALIVE_EXPIRY,
+        )
+        transport_cls = httpx.AsyncHTTPTransport if is_async else httpx.HTTPTransport
+        client_cls = httpx.AsyncClient if is_async else httpx.Client
+        params = dict(
+            limits=limits,
+            http2=self._use_http2(),
+            timeout=openai.DEFAULT_TIMEOUT,
+            follow_redirects=True,
+        )
+        if proxy:
+            params.update(
+                proxies=proxy,
+                transport=transport_cls(
+                    local_address="0.0.0.0", limits=limits, http2=params["http2"]
+                ),
+            )
+        return client_cls(**params)
+
+    def get_openai_client(
+        self,
+        base_url: str,
+        api_key: str,
+        proxy: str = None,
+        is_async: bool = False,
+    ) -> Union[openai.OpenAI, openai.AsyncOpenAI]:
+        loop_key = None
+        if is_async:
+            try:
+                loop = asyncio.get_running_loop()
+                loop_key = id(loop)
+            except RuntimeError:
+                # 不知道客户端将在哪个事件循环中使用，不能缓存
+                return openai.AsyncOpenAI(
+                    base_url=base_url,
+                    api_key=api_key,
+                    http_client=self.new_http_client(proxy=proxy, is_async=True),
+                )
+        key = (base_url, api_key, proxy or None, is_async, loop_key)
+        with self._lock:
+            self._check_platforms()
+            if (client := self._clients.get(key)) is None:
+                self._drop_closed_loops()
+                http_client = self.new_http_client(proxy=proxy, is_async=is_async)
+                client_cls = openai.AsyncOpenAI if is_async else openai.OpenAI
+                client = client_cls(base_url=base_url, api_key=api_key, http_client=http_client)
+                weakref.finalize(client, _close_http_client, http_client, loop if is_async else None)
+                self._clients[key] = client
+                if loop_key is not None:
+                    self._loops[loop_key] = loop
+            return client
+
+    def clear(self):
+        with self._lock:
+            self._drop_all()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "sync": sum(1 for k in self._clients if not k[3]),
+                "async": sum(1 for k in self._clients if k[3]),
+                "http2": bool(self._http2),
+            }
+
+
+model_clients = ModelClientRegistry()
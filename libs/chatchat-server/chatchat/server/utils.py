@@ -1,9 +1,11 @@
 import asyncio
 import multiprocessing as mp
+import operator
 import os
 import requests
 import socket
 import sys
+import threading
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from urllib.parse import urlparse
@@ -59,8 +61,11 @@ def get_config_platforms() -> Dict[str, Dict]:
     """
     获取配置的模型平台，会将 pydantic model 转换为字典。
     """
-    platforms = [m.model_dump() for m in Settings.model_settings.MODEL_PLATFORMS]
-    return {m["platform_name"]: m for m in platforms}
+    index = _model_index
+    # 平台配置与 xinference 检测结果无关，配置未重新加载时不必检查
+    if index is None or index.config is not Settings.model_settings.MODEL_PLATFORMS:
+        index = _get_model_index()
+    return {k: dict(v) for k, v in index.platforms.items()}
 
 
 @cached(max_size=10, ttl=60, algorithm=CachingAlgorithmFlag.LRU)
@@ -110,6 +115,96 @@ def detect_xf_models(xf_url: str) -> Dict[str, List[str]]:
     return models
 
 
+_MODEL_TYPES = [
+    "llm_models",
+    "embed_models",
+    "text2image_models",
+    "image2image_models",
+    "image2text_models",
+    "rerank_models",
+    "speech2text_models",
+    "text2speech_models",
+]
+
+
+class _ModelIndex:
+    """
+    MODEL_PLATFORMS 中模型的索引：模型名称 -> 各平台的模型信息，模型类型 -> 模型。
+    配置重新加载（MODEL_PLATFORMS 被替换）或 xinference 自动检测的结果变化时重建。
+    """
+
+    def __init__(self, config: List):
+        self.config = config
+        self.platforms: Dict[str, Dict] = {}
+        # xinference 地址 -> 构建索引时 detect_xf_models 的结果
+        self.xf_models: Dict[str, Dict] = {}
+        # 按平台、模型类型的顺序排列的 (model_type, 模型信息)
+        self.entries: List[Tuple[str, Dict]] = []
+        self.by_name: Dict[str, List[Tuple[str, Dict]]] = {}
+        self.by_type: Dict[str, Dict[str, Dict]] = {t.split("_")[0]: {} for t in _MODEL_TYPES}
+        self.all: Dict[str, Dict] = {}
+
+        for p in config:
+            m = p.model_dump()
+            self.platforms[m["platform_name"]] = m
+        for m in self.platforms.values():
+            models_by_type = m
+            if m.get("auto_detect_model"):
+                if not m.get("platform_type") == "xinference":  # TODO：当前仅支持 xf 自动检测模型
+                    logger.warning(f"auto_detect_model not supported for {m.get('platform_type')} yet")
+                    continue
+                xf_url = get_base_url(m.get("api_base_url"))
+                xf_models = self.xf_models[xf_url] = detect_xf_models(xf_url)
+                models_by_type = {t: xf_models.get(t, []) for t in _MODEL_TYPES}
+
+            for m_type in _MODEL_TYPES:
+                models = models_by_type.get(m_type, [])
+                if models == "auto":
+                    logger.warning("you should not set `auto` without auto_detect_model=True")
+                    continue
+                elif not models:
+                    continue
+                model_type = m_type.split("_")[0]
+                for m_name in models:
+                    info = {
+                        "platform_name": m.get("platform_name"),
+                        "platform_type": m.get("platform_type"),
+                        "model_type": model_type,
+                        "model_name": m_name,
+                        "api_base_url": m.get("api_base_url"),
+                        "api_key": m.get("api_key"),
+                        "api_proxy": m.get("api_proxy"),
+                        "api_concurrencies": m.get("api_concurrencies"),
+                    }
+                    self.entries.append((model_type, info))
+                    self.by_name.setdefault(m_name, []).append((model_type, info))
+                    # 重名模型以最后一个为准
+                    self.by_type[model_type][m_name] = info
+                    self.all[m_name] = info
+
+    def is_stale(self, config: List) -> bool:
+        if config is not self.config:
+            return True
+        return any(detect_xf_models(url) != models for url, models in self.xf_models.items())
+
+
+_model_index: Optional[_ModelIndex] = None
+_model_index_lock = threading.Lock()
+
+
+def _get_model_index() -> _ModelIndex:
+    global _model_index
+
+    config = Settings.model_settings.MODEL_PLATFORMS
+    index = _model_index
+    if index is None or index.is_stale(config):
+        with _model_index_lock:
+            if _model_index is None or _model_index.is_stale(config):
+                _model_index = _ModelIndex(config)
+            index = _model_index
+    return index
+
+
 def get_config_models(
         model_name: str = None,
         model_type: Optional[Literal[
@@ -127,56 +222,25 @@ def get_config_models(
         "api_base_url": xx,
         "api_key": xx,
         "api_proxy": xx,
+        "api_concurrencies": xx,
     }}
     """
-    result = {}
-    if model_type is None:
-        model_types = [
-            "llm_models",
-            "embed_models",
-            "text2image_models",
-            "image2image_models",
-            "image2text_models",
-            "rerank_models",
-            "speech2text_models",
-            "text2speech_models",
-        ]
+    index = _get_model_index()
+    if model_name is not None:
+        entries = index.by_name.get(model_name, [])
+    elif platform_name is None:
+        models = index.all if model_type is None else index.by_type.get(model_type, {})
+        return {k: dict(v) for k, v in models.items()}
     else:
-        model_types = [f"{model_type}_models"]
+        entries = index.entries
 
-    for m in list(get_config_platforms().values()):
-        if platform_name is not None and platform_name != m.get("platform_name"):
+    result = {}
+    for m_type, info in entries:
+        if model_type is not None and m_type != model_type:
             continue
-
-        if m.get("auto_detect_model"):
-            if not m.get("platform_type") == "xinference":  # TODO：当前仅支持 xf 自动检测模型
-                logger.warning(f"auto_detect_model not supported for {m.get('platform_type')} yet")
-                continue
-            xf_url = get_base_url(m.get("api_base_url"))
-            xf_models = detect_xf_models(xf_url)
-            for m_type in model_types:
-                # if m.get(m_type) != "auto":
-                #     continue
-                m[m_type] = xf_models.get(m_type, [])
-
-        for m_type in model_types:
-            models = m.get(m_type, [])
-            if models == "auto":
-                logger.warning("you should not set `auto` without auto_detect_model=True")
-                continue
-            elif not models:
-                continue
-            for m_name in models:
-                if model_name is None or model_name == m_name:
-                    result[m_name] = {
-                        "platform_name": m.get("platform_name"),
-                        "platform_type": m.get("platform_type"),
-                        "model_type": m_type.split("_")[0],
-                        "model_name": m_name,
-                        "api_base_url": m.get("api_base_url"),
-                        "api_key": m.get("api_key"),
-                        "api_proxy": m.get("api_proxy"),
-                    }
+        if platform_name is not None and info["platform_name"] != platform_name:
+            continue
+        result[info["model_name"]] = dict(info)
     return result
 
 
@@ -197,6 +261,16 @@ def get_model_info(
         return {}
 
 
+def get_model_platforms(model_name: str) -> List[Dict]:
+    """
+    返回提供该模型的所有平台的模型信息（每个平台一条），用于在重名模型之间调度
+    """
+    result: Dict[str, Dict] = {}
+    for _, info in _get_model_index().by_name.get(model_name, []):
+        result[info["platform_name"]] = dict(info)
+    return list(result.values())
+
+
 def get_default_llm():
     available_llms = list(get_config_models(model_type="llm").keys())
     if Settings.model_settings.DEFAULT_LLM_MODEL in available_llms:
@@ -216,6 +290,26 @@ def get_default_embedding():
         return available_embeddings[0]
 
 
+def _pooled_openai_clients(
+        base_url: str,
+        api_key: str,
+        proxy: str = None,
+        resource: str = "chat.completions",
+) -> Dict:
+    """
+    返回可复用的同步/异步 openai 客户端资源（如 chat.completions），作为 langchain 模型的 client/async_client 参数
+    """
+    from chatchat.server.model_clients import model_clients
+
+    get_resource = operator.attrgetter(resource)
+    return dict(
+        client=get_resource(model_clients.get_openai_client(base_url, api_key, proxy)),
+        async_client=get_resource(
+            model_clients.get_openai_client(base_url, api_key, proxy, is_async=True)
+        ),
+    )
+
+
 def get_ChatOpenAI(
         model_name: str = get_default_llm(),
         temperature: float = Settings.model_settings.TEMPERATURE,
@@ -253,6 +347,9 @@ def get_ChatOpenAI(
                 openai_api_key=model_info.get("api_key"),
                 openai_proxy=model_info.get("api_proxy"),
             )
+        params.update(_pooled_openai_clients(
+            params["openai_api_base"], params["openai_api_key"], params.get("openai_proxy")
+        ))
         model = ChatOpenAI(**params)
     except Exception as e:
         logger.exception(f"failed to create ChatOpenAI for model: {model_name}.")
@@ -295,6 +392,12 @@ def get_OpenAI(
                 openai_api_key=model_info.get("api_key"),
                 openai_proxy=model_info.get("api_proxy"),
             )
+        params.update(_pooled_openai_clients(
+            params["openai_api_base"],
+            params["openai_api_key"],
+            params.get("openai_proxy"),
+            resource="completions",
+        ))
         model = OpenAI(**params)
     except Exception as e:
         logger.exception(f"failed to create OpenAI for model: {model_name}.")
@@ -305,6 +408,31 @@ def get_OpenAI(
 def get_Embeddings(
     embed_model: str = None,
     local_wrap: bool = False,  # use local wrapped api
+    cache: bool = True,  # 缓存相同文本的向量，见 EMBEDDING_CACHE_SIZE
+) -> Embeddings:
+    embed_model = embed_model or get_default_embedding()
+    embeddings = _get_Embeddings(embed_model, local_wrap=local_wrap)
+    if Settings.model_settings.EMBEDDING_BATCH_WAIT > 0:
+        from chatchat.server.embeddings_batcher import BatchingEmbeddings, get_query_batcher
+        from chatchat.server.localai_embeddings import LocalAIEmbeddings
+
+        # 合并并发的查询请求，见 EMBEDDING_BATCH_WAIT
+        if isinstance(embeddings, LocalAIEmbeddings):
+            batcher = get_query_batcher(
+                f"{embed_model}:{local_wrap}", embeddings, config=_get_model_index()
+            )
+            embeddings = BatchingEmbeddings(embeddings, batcher)
+    if cache and embeddings is not None:
+        from chatchat.server.embeddings_cache import CachedEmbeddings, embedding_cache
+
+        # 即使未启用缓存也需要包装，以便复用向量库中已有的向量，见 reusing_embeddings
+        return CachedEmbeddings(embeddings, embed_model, embedding_cache)
+    return embeddings
+
+
+def _get_Embeddings(
+    embed_model: str,
+    local_wrap: bool = False,
 ) -> Embeddings:
     from langchain_community.embeddings import OllamaEmbeddings
     from langchain_openai import OpenAIEmbeddings
@@ -313,7 +441,6 @@ def get_Embeddings(
         LocalAIEmbeddings,
     )
 
-    embed_model = embed_model or get_default_embedding()
     model_info = get_model_info(model_name=embed_model)
     params = dict(model=embed_model)
     try:
@@ -328,6 +455,13 @@ def get_Embeddings(
                 openai_api_key=model_info.get("api_key"),
                 openai_proxy=model_info.get("api_proxy"),
             )
+        if model_info.get("platform_type") != "ollama":
+            params.update(_pooled_openai_clients(
+                params["openai_api_base"],
+                params["openai_api_key"],
+                params.get("openai_proxy"),
+                resource="embeddings",
+            ))
         if model_info.get("platform_type") == "openai":
             return OpenAIEmbeddings(**params)
         elif model_info.get("platform_type") == "ollama":
@@ -345,15 +479,11 @@ def check_embed_model(embed_model: str = None) -> Tuple[bool, str]:
     '''
     check weather embed_model accessable, use default embed model if None
     '''
+    from chatchat.server.embeddings_health import embed_health
+
     embed_model = embed_model or get_default_embedding()
-    embeddings = get_Embeddings(embed_model=embed_model)
-    try:
-        embeddings.embed_query("this is a test")
-        return True, ""
-    except Exception as e:
-        msg = f"failed to access embed model '{embed_model}': {e}"
-        logger.error(msg)
-        return False, msg
+    # 返回缓存的模型状态，过期后在后台重新检查，见 EMBEDDING_HEALTH_TTL
+    return embed_health.check(embed_model)
 
 
 def get_OpenAIClient(
@@ -375,25 +505,15 @@ def get_OpenAIClient(
         platform_name = platform_info.get("platform_name")
     platform_info = get_config_platforms().get(platform_name)
     assert platform_info, f"cannot find configured platform: {platform_name}"
-    params = {
-        "base_url": platform_info.get("api_base_url"),
-        "api_key": platform_info.get("api_key"),
-    }
-    httpx_params = {}
-    if api_proxy := platform_info.get("api_proxy"):
-        httpx_params = {
-            "proxies": api_proxy,
-            "transport": httpx.HTTPTransport(local_address="0.0.0.0"),
-        }
-
-    if is_async:
-        if httpx_params:
-            params["http_client"] = httpx.AsyncClient(**httpx_params)
-        return openai.AsyncClient(**params)
-    else:
-        if httpx_params:
-            params["http_client"] = httpx.Client(**httpx_params)
-        return openai.Client(**params)
+    from chatchat.server.model_clients import model_clients
+
+    # 复用客户端及其连接池，见 HTTPX_MAX_CONNECTIONS
+    return model_clients.get_openai_client(
+        base_url=platform_info.get("api_base_url"),
+        api_key=platform_info.get("api_key"),
+        proxy=platform_info.get("api_proxy"),
+        is_async=is_async,
+    )
 
 
 class MsgType:
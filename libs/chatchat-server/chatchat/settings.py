@@ -139,11 +139,69 @@ class KBSettings(BaseFileSettings):
     """默认向量库/全文检索引擎类型"""
 
     CACHED_VS_NUM: int = 1
-    """缓存向量库数量（针对FAISS）"""
+    """缓存向量库数量（针对FAISS），设为 -1 时不限数量，仅按 CACHED_VS_MEMORY 淘汰"""
+
+    CACHED_VS_MEMORY: float = 0
+    """缓存向量库占用内存上限（MB，针对FAISS），超出后按最近最少使用淘汰，0 表示不限制"""
+
+    PINNED_KBS: t.List[str] = []
+    """常驻内存的知识库名称列表（针对FAISS），不会被缓存淘汰"""
+
+    WARMUP_KBS: t.List[str] = []
+    """API 服务启动时预先加载的知识库名称列表，加载完成后服务才开始接受请求。
+    预加载的知识库总数不超过 CACHED_VS_NUM（PINNED_KBS 中的知识库除外），超出部分不会预加载"""
+
+    WARMUP_TOP_N: int = 0
+    """API 服务启动时另外预先加载检索次数最多的 N 个知识库（按以往运行的统计），0 表示不加载"""
+
+    WARMUP_WORKERS: int = 4
+    """并行预加载知识库的线程数"""
+
+    WARMUP_USAGE_SAVE_INTERVAL: int = 300
+    """知识库检索次数统计（用于 WARMUP_TOP_N）定期保存到磁盘的间隔（秒），0 表示只在服务退出时保存"""
 
     CACHED_MEMO_VS_NUM: int = 10
     """缓存临时向量库数量（针对FAISS），用于文件对话"""
 
+    MEMO_VS_TTL: float = 1800
+    """临时向量库空闲超过该时间（秒）后从内存中释放并保存到临时目录，再次使用时自动加载；0 表示不按空闲时间释放"""
+
+    MEMO_VS_EXPIRE: float = 86400
+    """临时向量库最后一次使用超过该时间（秒）后，删除其临时目录（上传的文件及保存的向量库）；0 表示不删除"""
+
+    SEARCH_CACHE_SIZE: int = 1000
+    """知识库检索结果缓存的条目数，0 表示不缓存。知识库内容变更后对应的缓存自动失效：
+    版本号保存在知识库目录下的 .version 文件中，同一台机器上的多个 worker 进程共享；
+    多台服务器各自保存知识库目录（如共用同一个 ES/Milvus）时无法及时失效，此时应设为 0 或缩短 SEARCH_CACHE_TTL"""
+
+    SEARCH_CACHE_TTL: float = 600
+    """知识库检索结果缓存的有效期（秒）"""
+
+    LIST_DOCS_BATCH_SIZE: int = 500
+    """列出文件内文档时，每次从向量库批量读取的文档数"""
+
+    FAISS_PERSIST_INTERVAL: float = 5
+    """FAISS 向量库写入后延迟保存到磁盘的时间（秒），期间的多次写入合并为一次后台保存；0 表示每次写入后同步保存"""
+
+    FAISS_PERSIST_MAX_DIRTY: int = 1000
+    """FAISS 向量库未保存的文档变更数达到该值时立即在后台保存"""
+
+    FAISS_DELTA_LOG: bool = True
+    """FAISS 向量库保存时只把增删操作追加到增量日志（index.log），加载时重放，避免每次保存都重写整个索引"""
+
+    FAISS_DELTA_LOG_RATIO: float = 0.5
+    """增量日志大小超过快照（index.faiss + index.pkl）的该比例时，重写完整快照并清空日志"""
+
+    FAISS_MMAP: bool = False
+    """以内存映射（只读）方式加载 FAISS 索引，多个进程共享页缓存，首次写入时自动转为内存索引。目前仅对 IVF 类索引有效"""
+
+    FAISS_DOCSTORE: t.Literal["memory", "sqlite", "file"] = "memory"
+    """FAISS 知识库文档的存储方式。memory: 全部文档随 index.pkl 加载到内存；sqlite: 文档保存在 docstore.db 中，按需读取；
+    file: 文档追加写入 docstore.data，内存中只保留偏移索引，按需读取"""
+
+    FAISS_DOCSTORE_COMPRESS: bool = False
+    """FAISS_DOCSTORE 为 file 时是否使用 zstd 压缩文档，需要安装 zstandard"""
+
     CHUNK_SIZE: int = 750
     """知识库中单段文本长度(不适用MarkdownHeaderTextSplitter)"""
 
@@ -156,6 +214,12 @@ class KBSettings(BaseFileSettings):
     SCORE_THRESHOLD: float = 2.0
     """知识库匹配相关度阈值，取值范围在0-2之间，SCORE越小，相关度越高，取到2相当于不筛选，建议设置在0.5左右"""
 
+    MAX_KBS_PER_SEARCH: int = 10
+    """同时检索多个知识库时，一次请求最多包含的知识库数量"""
+
+    MAX_PARALLEL_KB_SEARCH: int = 4
+    """同时检索多个知识库时，一次请求中并行检索的知识库数量"""
+
     DEFAULT_SEARCH_ENGINE: t.Literal["bing", "duckduckgo", "metaphor", "searx"] = "duckduckgo"
     """默认搜索引擎"""
 
@@ -312,6 +376,40 @@ class ApiModelSettings(BaseFileSettings):
     DEFAULT_EMBEDDING_MODEL: str = "bge-m3"
     """默认选用的 Embedding 名称"""
 
+    EMBEDDING_CACHE_SIZE: float = 64
+    """Embedding 向量缓存占用内存上限（MB），相同模型、相同文本不重复调用 Embedding 模型，0 表示不缓存"""
+
+    EMBEDDING_CACHE_DISK_SIZE: float = 0
+    """Embedding 向量磁盘缓存（DATA_PATH/cache/embeddings.db）大小上限（MB），重启后仍然有效，0 表示不使用磁盘缓存"""
+
+    EMBEDDING_BATCH_WAIT: float = 5
+    """并发的查询向量请求合并为一个批量请求前最多等待的时间（毫秒），0 表示不合并。
+    只在有其它批次正在发送时等待，没有并发请求时立即发送。目前仅对 LocalAIEmbeddings 有效"""
+
+    EMBEDDING_BATCH_SIZE: int = 32
+    """合并查询向量请求时每批最多的文本数"""
+
+    EMBEDDING_HEALTH_TTL: float = 60
+    """Embedding 模型可用性检查结果的有效期（秒），过期后在后台重新检查；实际调用失败时立即标记为不可用。0 表示每次都调用模型检查"""
+
+    HTTPX_MAX_CONNECTIONS: int = 100
+    """每个模型平台客户端连接池的最大连接数。访问模型平台的客户端在请求间复用，保持长连接"""
+
+    HTTPX_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    """每个模型平台客户端连接池保持的最大空闲连接数"""
+
+    HTTPX_KEEPALIVE_EXPIRY: float = 30
+    """空闲连接保持的时间（秒）"""
+
+    HTTPX_HTTP2: bool = False
+    """访问 https 模型平台时是否启用 HTTP/2（需要安装 h2，即 pip install httpx[http2]）"""
+
+    MODEL_ROUTER_FAILURE_THRESHOLD: int = 3
+    """重名模型调度：某平台连续失败（错误或超时）该次数后暂停向其转发请求"""
+
+    MODEL_ROUTER_COOLDOWN: float = 30
+    """重名模型调度：平台暂停转发的时间（秒），之后先放行一个请求试探，成功后恢复"""
+
     Agent_MODEL: str = "" # TODO: 似乎与 LLM_MODEL_CONFIG 重复了
     """AgentLM模型的名称 (可以不指定，指定之后就锁定进入Agent之后的Chain的模型，不指定就是 DEFAULT_LLM_MODEL)"""
 
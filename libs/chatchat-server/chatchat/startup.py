@@ -30,9 +30,20 @@ logger = build_logger()
 def _set_app_event(app: FastAPI, started_event: mp.Event = None):
     @asynccontextmanager
     async def lifespan(app: FastAPI):
+        from chatchat.server.knowledge_base.warmup import warmup, warmup_enabled
+
+        # 预加载完成后才开始接受请求，并通知服务已启动
+        if warmup_enabled():
+            await asyncio.to_thread(warmup)
         if started_event is not None:
             started_event.set()
         yield
+        # 退出前保存尚未写入磁盘的向量库，以及知识库使用统计
+        from chatchat.server.knowledge_base.kb_cache.faiss_cache import persist_scheduler
+        from chatchat.server.knowledge_base.warmup import kb_usage
+
+        persist_scheduler.stop()
+        kb_usage.save()
 
     app.router.lifespan_context = lifespan
 
@@ -367,13 +367,21 @@ def knowledge_base_page(api: ApiRequest, is_lite: bool = None):
         df = pd.DataFrame([], columns=["seq", "id", "content", "source"])
         if selected_rows:
             file_name = selected_rows[0]["file_name"]
-            docs = api.search_kb_docs(
-                knowledge_base_name=selected_kb, file_name=file_name
-            )
+            # 按页从服务端读取，避免一次取回整个文件的文档
+            page_size = 100
+            page = st.number_input("文档页码", min_value=1, value=1, step=1)
+            result = api.list_kb_file_docs(
+                knowledge_base_name=selected_kb,
+                file_name=file_name,
+                offset=(page - 1) * page_size,
+                limit=page_size,
+            ) or {}
+            docs = result.get("docs", [])
+            st.caption(f"共 {result.get('total', 0)} 条文档，当前第 {page} 页")
 
             data = [
                 {
-                    "seq": i + 1,
+                    "seq": (page - 1) * page_size + i + 1,
                     "id": x["id"],
                     "page_content": x["page_content"],
                     "source": x["metadata"].get("source"),
@@ -436,6 +436,35 @@ class ApiRequest:
             response, as_json=True, value_func=lambda r: r.get("data", [])
         )
 
+    def list_kb_file_docs(
+        self,
+        knowledge_base_name: str,
+        file_name: str = "",
+        metadata: dict = {},
+        offset: int = 0,
+        limit: int = 100,
+        cursor: int = None,
+    ) -> Dict:
+        """
+        对应api.py/knowledge_base/list_docs接口
+        返回形式：{"docs": [...], "total": int, "next_cursor": int}
+        """
+        data = {
+            "knowledge_base_name": knowledge_base_name,
+            "file_name": file_name,
+            "metadata": metadata,
+            "offset": offset,
+            "limit": limit,
+            "cursor": cursor,
+        }
+        response = self.post(
+            "/knowledge_base/list_docs",
+            json=data,
+        )
+        return self._get_response_value(
+            response, as_json=True, value_func=lambda r: r.get("data", {})
+        )
+
     def search_kb_docs(
         self,
         knowledge_base_name: str,
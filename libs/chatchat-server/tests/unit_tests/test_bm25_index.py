@@ -0,0 +1,49 @@
+from langchain_community.embeddings import FakeEmbeddings
+
+from chatchat.server.file_rag.retrievers.bm25 import BM25Index
+
+
+def _split(text):
+    return text.split()
+
+
+def test_bm25_index_incremental(tmp_path):
+    index = BM25Index(preprocess_func=_split)
+    index.add(["a", "b", "c"], ["apple banana", "banana cherry", "cherry durian"])
+    assert {id for id, _ in index.search("banana", k=5)} == {"a", "b"}
+
+    index.delete(["a"])
+    assert [id for id, _ in index.search("apple banana", k=5)] == ["b"]
+    assert "apple" not in index.postings
+
+    path = str(tmp_path / "index.bm25")
+    index.save(path)
+    loaded = BM25Index.load(path, preprocess_func=_split)
+    assert len(loaded) == 2
+    assert loaded.search("durian", k=1) == index.search("durian", k=1)
+
+
+def test_indexed_faiss_keeps_bm25_in_sync(tmp_path):
+    from langchain.docstore.document import Document
+
+    from chatchat.server.knowledge_base.kb_cache.faiss_cache import IndexedFAISS
+
+    embeddings = FakeEmbeddings(size=8)
+    vs = IndexedFAISS.from_documents(
+        [Document(page_content="init")], embeddings, normalize_L2=True
+    )
+    vs.delete(list(vs.docstore._dict.keys()))
+    vs.enable_bm25()
+
+    ids = vs.add_texts(["hello world", "foo bar"])
+    assert len(vs.bm25_index) == 2
+    vs.delete(ids[:1])
+    assert len(vs.bm25_index) == 1
+
+    vs.save_local(str(tmp_path))
+    assert (tmp_path / "index.bm25").is_file()
+    loaded = IndexedFAISS.load_local(
+        str(tmp_path), embeddings, allow_dangerous_deserialization=True
+    )
+    loaded.enable_bm25(str(tmp_path))
+    assert len(loaded.bm25_index) == 1
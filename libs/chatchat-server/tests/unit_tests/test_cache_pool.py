@@ -0,0 +1,75 @@
+import time
+
+from chatchat.server.knowledge_base.kb_cache.base import CachePool, ThreadSafeObject
+
+
+class SizedObject(ThreadSafeObject):
+    def __init__(self, key, size, pool):
+        super().__init__(key, obj=object(), pool=pool)
+        self.size = size
+
+    def get_nbytes(self) -> int:
+        return self.size
+
+
+def _load(pool, key, size):
+    item = SizedObject(key, size, pool)
+    pool.set(key, item)
+    with item.acquire():
+        item.finish_loading()
+    return item
+
+
+def test_evict_by_bytes_with_pinning():
+    pool = CachePool(cache_num=-1, max_bytes=100, pinned=["a"])
+    _load(pool, ("a", "m"), 40)
+    _load(pool, ("b", "m"), 40)
+    with pool.acquire(("b", "m"), shared=True):
+        pass
+    _load(pool, ("c", "m"), 40)
+    # 淘汰最久未使用且未常驻的 b
+    assert pool.keys() == [("a", "m"), ("c", "m")]
+
+    _load(pool, ("d", "m"), 70)
+    # a 常驻，d 为最近使用，只能淘汰 c，超出上限时保留
+    assert pool.keys() == [("a", "m"), ("d", "m")]
+    assert pool.total_bytes() == 110
+
+    pool.unpin("a")
+    assert pool.keys() == [("d", "m")]
+    stats = pool.stats()
+    assert stats["evictions"] == 3
+    assert stats["total_bytes"] == 70
+
+
+def test_count_limit_keeps_loading_items():
+    pool = CachePool(cache_num=1)
+    loading = SizedObject("x", 1, pool)
+    pool.set("x", loading)
+    _load(pool, "y", 1)
+    assert pool.keys() == ["x", "y"]
+    with loading.acquire():
+        loading.finish_loading()
+    assert pool.keys() == ["x"]
+
+
+def test_ttl_expires_idle_items_and_calls_on_evict():
+    evicted = []
+
+    class Pool(CachePool):
+        def on_evict(self, key, item):
+            evicted.append(key)
+            super().on_evict(key, item)
+
+    pool = Pool(cache_num=10, ttl=0.05)
+    _load(pool, "a", 1)
+    _load(pool, "b", 1)
+    time.sleep(0.1)
+    with pool.acquire("b", shared=True):
+        pass
+    pool.check_limits()
+    # 空闲超时的 a 被淘汰，刚使用过的 b 保留
+    assert pool.keys() == ["b"]
+    assert evicted == ["a"]
+    assert pool.stats()["expirations"] == 1
+    assert not pool._evicting
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+
+from chatchat.server.knowledge_base.kb_cache.faiss_cache import IndexedFAISS
+
+
+def _load(folder, embeddings):
+    vs = IndexedFAISS.load_local(
+        folder, embeddings, normalize_L2=True, allow_dangerous_deserialization=True
+    )
+    vs.enable_bm25(folder)
+    vs.enable_source_index(folder)
+    vs.enable_delta_log(folder)
+    return vs
+
+
+@pytest.mark.parametrize("docstore_type", ["memory", "sqlite"])
+def test_delta_log_replay_and_compaction(tmp_path, docstore_type):
+    folder = str(tmp_path)
+    embeddings = FakeEmbeddings(size=8)
+    vs = IndexedFAISS.from_documents(
+        [Document(page_content=f"doc {i}", metadata={"source": "a.md"}) for i in range(50)],
+        embeddings,
+        normalize_L2=True,
+    )
+    vs.use_docstore(docstore_type, folder)
+    vs.enable_delta_log(folder)
+    vs.save_local(folder)
+    base = {f: os.path.getmtime(tmp_path / f) for f in ("index.faiss", "index.pkl")}
+
+    ids = vs.add_texts(["hello world"], metadatas=[{"source": "b.md"}])
+    vs.delete(vs.get_ids_by_source("a.md")[:10])
+    vs.save_local(folder)
+    assert (tmp_path / "index.log").is_file()
+    assert base == {f: os.path.getmtime(tmp_path / f) for f in base}
+
+    loaded = _load(folder, embeddings)
+    assert len(loaded.index_to_docstore_id) == 41
+    assert loaded.get_ids_by_source("b.md") == ids
+    assert len(loaded.bm25_index) == 41
+    assert loaded.docstore.search(ids[0]).page_content == "hello world"
+    assert loaded.similarity_search_with_score_by_vector(
+        embeddings.embed_query("x"), k=50
+    )
+
+    # 日志超过快照大小的比例后写完整快照
+    for _ in range(20):
+        loaded.add_texts([f"more {i}" for i in range(20)])
+        loaded.save_local(folder)
+    assert os.path.getsize(tmp_path / "index.log") < os.path.getsize(tmp_path / "index.pkl")
+    reloaded = _load(folder, embeddings)
+    assert len(reloaded.index_to_docstore_id) == 441
+
+
+def test_truncated_log_is_ignored(tmp_path):
+    folder = str(tmp_path)
+    embeddings = FakeEmbeddings(size=8)
+    vs = IndexedFAISS.from_texts([f"text {i}" for i in range(100)], embeddings)
+    vs.enable_delta_log(folder)
+    vs.save_local(folder)
+    vs.add_texts(["c"])
+    vs.save_local(folder)
+    vs.add_texts(["d"])
+    vs.save_local(folder)
+    with open(tmp_path / "index.log", "r+b") as f:
+        f.truncate(os.path.getsize(tmp_path / "index.log") - 5)
+
+    loaded = _load(folder, embeddings)
+    assert len(loaded.index_to_docstore_id) == 101
@@ -0,0 +1,72 @@
+import threading
+import time
+from typing import List
+
+import pytest
+
+from chatchat.server.embeddings_batcher import QueryBatcher, get_query_batcher
+
+
+def test_concurrent_queries_are_batched():
+    calls = []
+
+    def embed(texts: List[str]) -> List[List[float]]:
+        calls.append(list(texts))
+        time.sleep(0.05)
+        return [[float(len(t))] for t in texts]
+
+    batcher = QueryBatcher(embed, max_wait=0.2, max_batch=4)
+    results = {}
+
+    def worker(text):
+        results[text] = batcher.embed(text)
+
+    texts = ["a" * (i + 1) for i in range(10)]
+    threads = [threading.Thread(target=worker, args=(t,)) for t in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {t: [float(len(t))] for t in texts}
+    assert sum(len(c) for c in calls) == 10
+    assert all(len(c) <= 4 for c in calls)
+    assert len(calls) < 10
+    stats = batcher.stats()
+    assert stats["requests"] == 10
+    assert stats["batches"] == len(calls)
+
+
+def test_single_query_is_not_delayed():
+    batcher = QueryBatcher(lambda texts: [[1.0] for _ in texts], max_wait=5)
+    start = time.perf_counter()
+    assert batcher.embed("x") == [1.0]
+    # 没有其它批次正在发送时不等待 max_wait
+    assert time.perf_counter() - start < 1
+
+
+def test_errors_reach_every_caller():
+    def embed(texts):
+        raise ValueError("boom")
+
+    batcher = QueryBatcher(embed, max_wait=0.001)
+    with pytest.raises(ValueError):
+        batcher.embed("x")
+    assert batcher.stats()["errors"] == 1
+
+
+def test_batcher_is_rebuilt_when_config_changes():
+    class Fake:
+        def __init__(self, value):
+            self.value = value
+
+        def embed_documents(self, texts):
+            return [[self.value] for _ in texts]
+
+    old_config, new_config = object(), object()
+    batcher = get_query_batcher("test-model", Fake(1.0), config=old_config)
+    assert get_query_batcher("test-model", Fake(2.0), config=old_config) is batcher
+    assert batcher.embed("x") == [1.0]
+
+    batcher = get_query_batcher("test-model", Fake(2.0), config=new_config)
+    assert batcher.embed("x") == [2.0]
@@ -0,0 +1,106 @@
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from chatchat.server.embeddings_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.texts = []
+
+    def _vec(self, text: str) -> List[float]:
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.texts.extend(texts)
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.texts.append(text)
+        return self._vec(text)
+
+
+def test_embedding_cache_hits(tmp_path):
+    inner = CountingEmbeddings()
+    cache = EmbeddingCache(max_bytes=1024 * 1024)
+    emb = CachedEmbeddings(inner, "fake", cache)
+
+    assert emb.embed_query("你好") == inner._vec("你好")
+    assert emb.embed_query("你好") == inner._vec("你好")
+    assert inner.texts == ["你好"]
+
+    vecs = emb.embed_documents(["a", "b", "a", "你好"])
+    assert vecs == [inner._vec(t) for t in ["a", "b", "a", "你好"]]
+    # 批次内重复文本只计算一次；查询与文档分别缓存
+    assert inner.texts == ["你好", "a", "b", "你好"]
+    emb.embed_documents(["b", "a"])
+    assert len(inner.texts) == 4
+
+    # 不同模型不共享缓存
+    CachedEmbeddings(inner, "other", cache).embed_query("你好")
+    assert len(inner.texts) == 5
+
+    stats = cache.stats()
+    assert stats["hits"] == 3
+    assert stats["misses"] == 6
+
+
+def test_embedding_cache_bounded_and_disk(tmp_path):
+    inner = CountingEmbeddings()
+    cache = EmbeddingCache(
+        max_bytes=2 * (12 + 200),
+        disk_path=str(tmp_path / "embeddings.db"),
+        max_disk_bytes=1024 * 1024,
+    )
+    emb = CachedEmbeddings(inner, "fake", cache)
+    emb.embed_documents(["a", "b", "c"])
+    assert cache.stats()["entries"] == 2
+
+    # 内存中已淘汰的条目从磁盘读取
+    cache2 = EmbeddingCache(
+        max_bytes=1024,
+        disk_path=str(tmp_path / "embeddings.db"),
+        max_disk_bytes=1024 * 1024,
+    )
+    assert CachedEmbeddings(inner, "fake", cache2).embed_documents(["a"]) == [inner._vec("a")]
+    assert len(inner.texts) == 3
+    assert cache2.stats()["disk_hits"] == 1
+
+
+def test_embedding_cache_disk_pruned_incrementally(tmp_path):
+    import numpy as np
+
+    path = tmp_path / "embeddings.db"
+    cache = EmbeddingCache(max_bytes=0, disk_path=str(path), max_disk_bytes=256 * 1024)
+    assert cache._db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    for i in range(20):
+        cache.set_many({f"k{i}-{j}": np.ones(256, dtype=np.float32) for j in range(50)})
+    # 超过上限时删除最早的条目并归还空间，文件不会持续增长
+    assert path.stat().st_size <= 2 * 256 * 1024
+    assert cache._db.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert cache.get_many(["k19-0"])[0] is not None
+
+
+def test_reuse_existing_vectors():
+    from chatchat.server.embeddings_cache import reusing_embeddings, text_hash
+    from chatchat.server.knowledge_base.kb_cache.faiss_cache import IndexedFAISS
+
+    inner = CountingEmbeddings()
+    emb = CachedEmbeddings(inner, "fake", EmbeddingCache(max_bytes=0))
+    vs = IndexedFAISS.from_texts(["a", "bb", "ccc"], emb, ids=["1", "2", "3"])
+    assert len(inner.texts) == 3
+
+    vectors = vs.get_vectors_by_ids(["1", "3", "missing"])
+    assert set(vectors) == {"1", "3"}
+    reuse = {text_hash("a"): vectors["1"], text_hash("ccc"): vectors["3"]}
+
+    # 只有变化的文本需要重新向量化；其它模型不复用
+    with reusing_embeddings("fake", reuse):
+        result = emb.embed_documents(["a", "dddd", "ccc"])
+        CachedEmbeddings(inner, "other", EmbeddingCache(max_bytes=0)).embed_documents(["a"])
+    assert result == [inner._vec(t) for t in ["a", "dddd", "ccc"]]
+    assert inner.texts[3:] == ["dddd", "a"]
+
+    emb.embed_documents(["a"])
+    assert inner.texts[-1] == "a"
@@ -0,0 +1,61 @@
+import time
+
+from chatchat.server import utils
+from chatchat.server.embeddings_health import EmbedHealthRegistry, is_unavailable_error
+
+
+class FakeEmbeddings:
+    def __init__(self, calls, fail=False):
+        self.calls = calls
+        self.fail = fail
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        if self.fail:
+            raise ConnectionError("down")
+        return [1.0]
+
+
+def test_health_is_cached_and_refreshed(monkeypatch):
+    calls = []
+    state = {"fail": False}
+    monkeypatch.setattr(
+        utils,
+        "get_Embeddings",
+        lambda embed_model=None, cache=True: FakeEmbeddings(calls, state["fail"]),
+    )
+    registry = EmbedHealthRegistry(ttl=0.05)
+
+    assert registry.check("m") == (True, "")
+    assert registry.check("m") == (True, "")
+    assert len(calls) == 1
+
+    # 实际调用失败后立即标记为不可用，不再探测
+    registry.report_failure("m", ConnectionError("down"))
+    ok, msg = registry.check("m")
+    assert not ok and "down" in msg
+    assert len(calls) == 1
+
+    # 过期后先返回旧状态，并在后台重新探测
+    time.sleep(0.1)
+    assert not registry.check("m")[0]
+    for _ in range(100):
+        if registry.check("m")[0]:
+            break
+        time.sleep(0.01)
+    assert registry.check("m") == (True, "")
+    assert len(calls) == 2
+
+
+def test_only_unavailable_errors_affect_health():
+    assert is_unavailable_error(ConnectionError("down"))
+    assert is_unavailable_error(TimeoutError())
+    assert not is_unavailable_error(ValueError("input too long"))
+
+    class StatusError(Exception):
+        def __init__(self, status_code):
+            self.status_code = status_code
+
+    assert is_unavailable_error(StatusError(503))
+    assert is_unavailable_error(StatusError(429))
+    assert not is_unavailable_error(StatusError(400))
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+
+from chatchat.server.knowledge_base.kb_cache.faiss_cache import IndexedFAISS
+from chatchat.server.knowledge_base.kb_cache.faiss_index import (
+    FaissIndexSpec,
+    build_index,
+    index_encoding,
+    index_kind,
+)
+
+
+def _new_store(spec: FaissIndexSpec) -> IndexedFAISS:
+    vs = IndexedFAISS.from_documents(
+        [Document(page_content="init")], FakeEmbeddings(size=16), normalize_L2=True
+    )
+    vs.delete(list(vs.docstore._dict.keys()))
+    vs.index_spec = spec
+    return vs
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "hnsw"])
+def test_rebuild_keeps_docs_in_sync(index_type):
+    spec = FaissIndexSpec(index_type=index_type, train_threshold=200, nlist=4)
+    vs = _new_store(spec)
+    vectors = np.random.default_rng(0).random((300, 16)).tolist()
+    texts = [f"doc {i}" for i in range(300)]
+    ids = vs.add_embeddings(list(zip(texts[:250], vectors[:250])))
+    assert vs.index_needs_rebuild()
+
+    # 模拟后台重建：导出向量后仍有文档被增删
+    snapshot_ids, snapshot_vectors = vs.begin_rebuild()
+    index = build_index(spec, snapshot_vectors, vs.index.d)
+    ids += vs.add_embeddings(list(zip(texts[250:], vectors[250:])))
+    vs.delete(ids[:10])
+    vs.swap_index(index, snapshot_ids)
+
+    assert index_kind(vs.index) == ("hnsw" if index_type == "hnsw" else "ivf")
+    assert len(vs.index_to_docstore_id) == 290
+    docs = vs.similarity_search_with_score_by_vector(vectors[280], k=1, nprobe=4)
+    assert docs[0][0].page_content == "doc 280"
+    docs = vs.similarity_search_with_score_by_vector(vectors[5], k=5, ef_search=64)
+    assert "doc 5" not in [doc.page_content for doc, _ in docs]
+
+
+@pytest.mark.parametrize(
+    "index_type,quantizer", [("flat", "int8"), ("hnsw", "fp16"), ("ivf_flat", "int8")]
+)
+def test_quantized_index_with_rerank(tmp_path, index_type, quantizer):
+    spec = FaissIndexSpec(
+        index_type=index_type, quantizer=quantizer, train_threshold=200, nlist=4
+    )
+    vs = _new_store(spec)
+    vs.enable_raw_vectors()
+    vectors = np.random.default_rng(1).random((300, 16)).tolist()
+    texts = [f"doc {i}" for i in range(300)]
+    ids = vs.add_embeddings(list(zip(texts, vectors)))
+    assert vs.index_needs_rebuild()
+
+    snapshot_ids, snapshot_vectors = vs.begin_rebuild()
+    vs.swap_index(build_index(spec, snapshot_vectors, vs.index.d), snapshot_ids)
+    assert index_encoding(vs.index) == quantizer
+    assert not vs.index_needs_rebuild()
+
+    # 重排后的得分与精确距离一致
+    query = np.asarray(vectors[42], dtype=np.float32)
+    query /= np.linalg.norm(query)
+    docs = vs.similarity_search_with_score_by_vector(query.tolist(), k=3, nprobe=4)
+    assert docs[0][0].page_content == "doc 42"
+    assert docs[0][1] == pytest.approx(0, abs=1e-5)
+
+    # 原始向量随向量库保存/加载，删除的向量不再返回
+    vs.delete(ids[:5])
+    vs.save_local(str(tmp_path))
+    loaded = IndexedFAISS.load_local(
+        str(tmp_path), FakeEmbeddings(size=16), allow_dangerous_deserialization=True
+    )
+    loaded.index_spec = spec
+    loaded.enable_raw_vectors(str(tmp_path))
+    assert len(loaded.raw_vectors) == 295
+    exact = loaded.get_vectors_by_ids([ids[42]])[ids[42]]
+    assert np.allclose(exact, query, atol=1e-6)
+
+
+def test_docstore_nbytes_tracked_incrementally():
+    vs = _new_store(FaissIndexSpec())
+    ids = vs.add_texts([f"doc {i}" * 10 for i in range(20)])
+    base = vs.memory_usage()
+    vs.delete(ids[:5])
+    vs.add_texts(["x" * 1000])
+    vs.memory_usage()
+    # 增量更新的结果与重新统计全部文档一致
+    expected = vs._docstore_nbytes
+    vs._docstore_nbytes = None
+    vs.memory_usage()
+    assert vs._docstore_nbytes == expected
+    assert base > 0
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw"])
+def test_id_to_label_kept_in_sync(index_type):
+    spec = FaissIndexSpec(index_type=index_type, train_threshold=200, nlist=4)
+    vs = _new_store(spec)
+    vectors = np.random.default_rng(1).random((50, 16)).astype(np.float32)
+    ids = vs.add_embeddings([(f"doc {i}", v.tolist()) for i, v in enumerate(vectors)])
+    vs.delete(ids[:10])
+    ids += vs.add_embeddings([("new", vectors[0].tolist())])
+    vs.delete(ids[20:25])
+
+    # 增量维护的映射与重新构建的结果一致
+    expected = {id: label for label, id in vs.index_to_docstore_id.items()}
+    assert vs._id_to_label == expected
+    found = vs.get_vectors_by_ids([ids[30], ids[0], ids[-1]])
+    assert set(found) == {ids[30], ids[-1]}
+    expected_vector = vectors[30] / np.linalg.norm(vectors[30])
+    np.testing.assert_allclose(found[ids[30]], expected_vector, rtol=1e-5)
+    with pytest.raises(ValueError):
+        vs.delete([ids[0]])
@@ -0,0 +1,108 @@
+import os
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+
+from chatchat.server.knowledge_base.kb_cache.docstore import (
+    FileDocstore,
+    SQLiteDocstore,
+)
+from chatchat.server.knowledge_base.kb_cache.faiss_cache import IndexedFAISS
+from chatchat.server.knowledge_base.kb_cache.faiss_index import (
+    FaissIndexSpec,
+    build_index,
+)
+
+
+def _new_store() -> IndexedFAISS:
+    vs = IndexedFAISS.from_documents(
+        [Document(page_content="init")], FakeEmbeddings(size=16), normalize_L2=True
+    )
+    vs.delete(list(vs.docstore._dict.keys()))
+    return vs
+
+
+@pytest.mark.parametrize(
+    "docstore_type, docstore_cls", [("sqlite", SQLiteDocstore), ("file", FileDocstore)]
+)
+def test_mmap_ivf_and_disk_docstore(tmp_path, docstore_type, docstore_cls):
+    folder = str(tmp_path)
+    vs = _new_store()
+    assert vs.use_docstore(docstore_type, folder)
+    vectors = np.random.default_rng(0).random((300, 16)).tolist()
+    ids = vs.add_embeddings(
+        [(f"doc {i}", v) for i, v in enumerate(vectors)],
+        metadatas=[{"source": f"{i % 3}.txt"} for i in range(300)],
+    )
+    spec = FaissIndexSpec(index_type="ivf_flat", train_threshold=100, nlist=4)
+    vs.swap_index(build_index(spec, vs.begin_rebuild()[1], 16), ids)
+    vs.save_local(folder)
+
+    loaded = IndexedFAISS.load_local(
+        folder,
+        FakeEmbeddings(size=16),
+        normalize_L2=True,
+        allow_dangerous_deserialization=True,
+        mmap=True,
+    )
+    assert isinstance(loaded.docstore, docstore_cls)
+    assert loaded._mmap_path is not None
+    assert len(loaded.docstore._dict) == 300
+    assert loaded.docstore._dict[ids[7]].metadata["source"] == "1.txt"
+    docs = loaded.similarity_search_with_score_by_vector(vectors[7], k=1, nprobe=4)
+    assert docs[0][0].page_content == "doc 7"
+
+    # 首次写入时转为内存索引
+    loaded.delete(ids[:10])
+    assert loaded._mmap_path is None
+    loaded.save_local(folder)
+    reloaded = IndexedFAISS.load_local(
+        folder, FakeEmbeddings(size=16), allow_dangerous_deserialization=True
+    )
+    assert len(reloaded.index_to_docstore_id) == 290
+    assert ids[0] not in reloaded.docstore._dict
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_file_docstore(tmp_path, compress):
+    if compress:
+        pytest.importorskip("zstandard")
+    folder = str(tmp_path)
+    docstore = FileDocstore(folder, compress=compress)
+    docstore.add({str(i): Document(page_content=f"doc {i}", metadata={"i": i}) for i in range(10)})
+    docstore.delete(["0", "1"])
+    docstore.add({"2": Document(page_content="doc 2 v2")})
+    assert docstore.search("2").page_content == "doc 2 v2"
+    assert docstore.search("2").metadata["id"] == "2"
+    assert "0" not in docstore._dict
+    docstore.persist()
+    # 保存偏移索引之后追加的记录在重新打开时通过扫描恢复
+    docstore.add({"10": Document(page_content="doc 10")})
+    docstore.close()
+
+    reopened = FileDocstore(folder, compress=compress)
+    assert sorted(reopened.ids(), key=int) == [str(i) for i in range(2, 11)]
+    assert reopened._dict["9"].metadata == {"i": 9}
+    reopened.delete([str(i) for i in range(2, 9)])
+    reopened.persist()  # 无效数据过多，压缩数据文件
+    assert reopened._garbage == 0
+    assert [doc.page_content for _, doc in reopened.iter_docs()] == ["doc 9", "doc 10"]
+
+
+def test_file_docstore_truncates_partial_record(tmp_path):
+    folder = str(tmp_path)
+    docstore = FileDocstore(folder)
+    docstore.add({"a": Document(page_content="doc a"), "b": Document(page_content="doc b")})
+    docstore.close()
+    # 模拟写入中断：最后一条记录只写入了一部分
+    path = os.path.join(folder, FileDocstore.file_name)
+    with open(path, "r+b") as fp:
+        fp.truncate(os.path.getsize(path) - 3)
+
+    reopened = FileDocstore(folder)
+    assert reopened.ids() == ["a"]
+    reopened.add({"c": Document(page_content="doc c")})
+    reopened.close()
+    assert FileDocstore(folder).search("c").page_content == "doc c"
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+from langchain.docstore.document import Document
+
+from chatchat.server.knowledge_base.kb_service import base
+from chatchat.server.knowledge_base.kb_service.default_kb_service import DefaultKBService
+
+
+class FakeKBService(DefaultKBService):
+    def __init__(self, docs):
+        super().__init__("fake_kb")
+        self.docs = docs
+        self.calls = []
+
+    def get_doc_by_ids(self, ids):
+        self.calls.append(list(ids))
+        return [self.docs.get(id) for id in ids]
+
+
+def test_list_docs_batched_and_paged(monkeypatch):
+    rows = [{"id": str(i), "metadata": {}, "row_id": i + 1} for i in range(7)]
+
+    def fake_list_docs_from_db(kb_name, file_name=None, metadata={}, offset=0, limit=None, after=None):
+        result = [r for r in rows if after is None or r["row_id"] > after][offset:]
+        return result if limit is None else result[:limit]
+
+    monkeypatch.setattr(base, "list_docs_from_db", fake_list_docs_from_db)
+    # 向量库中缺失的文档被跳过
+    kb = FakeKBService({str(i): Document(page_content=f"d{i}") for i in range(7) if i != 4})
+    monkeypatch.setattr(
+        base, "Settings", SimpleNamespace(kb_settings=SimpleNamespace(LIST_DOCS_BATCH_SIZE=3))
+    )
+
+    docs = kb.list_docs()
+    assert [d.id for d in docs] == ["0", "1", "2", "3", "5", "6"]
+    assert [len(c) for c in kb.calls] == [3, 3, 1]
+
+    docs, cursor = kb.list_docs_page(limit=3)
+    assert [d.id for d in docs] == ["0", "1", "2"] and cursor == 3
+    docs, cursor = kb.list_docs_page(limit=3, cursor=cursor)
+    assert [d.id for d in docs] == ["3", "5"] and cursor == 6
+    docs, cursor = kb.list_docs_page(limit=3, cursor=cursor)
+    assert [d.id for d in docs] == ["6"] and cursor is None
+    docs, _ = kb.list_docs_page(offset=5, limit=3)
+    assert [d.id for d in docs] == ["5", "6"]
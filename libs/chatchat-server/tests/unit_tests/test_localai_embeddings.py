@@ -0,0 +1,59 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from chatchat.server.localai_embeddings import LocalAIEmbeddings
+
+
+def _response(texts):
+    # 故意打乱返回顺序，检查按 index 还原
+    data = [
+        SimpleNamespace(index=i, embedding=[float(len(t)), float(i)])
+        for i, t in enumerate(texts)
+    ]
+    return SimpleNamespace(data=data[::-1])
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def create(self, input, **kwargs):
+        with self.lock:
+            self.calls.append(list(input))
+        return _response(input)
+
+
+class FakeAsyncClient(FakeClient):
+    async def create(self, input, **kwargs):
+        return super().create(input, **kwargs)
+
+
+def _embeddings(**kwargs):
+    return LocalAIEmbeddings(
+        model="fake",
+        openai_api_key="EMPTY",
+        client=FakeClient(),
+        async_client=FakeAsyncClient(),
+        **kwargs,
+    )
+
+
+def test_embed_documents_in_batches():
+    emb = _embeddings(chunk_size=3, max_concurrency=2)
+    texts = [str(i) * (i + 1) for i in range(8)]
+    vecs = emb.embed_documents(texts)
+    assert [v[0] for v in vecs] == [float(len(t)) for t in texts]
+    assert sorted(len(c) for c in emb.client.calls) == [2, 3, 3]
+
+    assert emb.embed_documents([]) == []
+    assert emb.embed_query("abc") == [3.0, 0.0]
+
+
+def test_aembed_documents_in_batches():
+    emb = _embeddings(chunk_size=2)
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    vecs = asyncio.run(emb.aembed_documents(texts))
+    assert [v[0] for v in vecs] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert len(emb.async_client.calls) == 3
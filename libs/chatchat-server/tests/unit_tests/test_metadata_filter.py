@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+
+from chatchat.server.file_rag.retrievers.bm25 import BM25Index, BM25IndexRetriever
+from chatchat.server.knowledge_base.kb_cache.faiss_cache import IndexedFAISS
+from chatchat.server.knowledge_base.kb_cache.faiss_index import FaissIndexSpec, build_index
+from chatchat.server.knowledge_base.kb_cache.metadata_index import (
+    MetadataIndex,
+    match_metadata,
+)
+from chatchat.server.knowledge_base.kb_service.default_kb_service import DefaultKBService
+
+
+def test_metadata_index():
+    index = MetadataIndex()
+    index.add(
+        ["a", "b", "c"],
+        [{"source": "x.md", "page": 1}, {"source": "y.md", "page": 1}, {"summary": "s" * 1000}],
+    )
+    assert index.get_ids({"source": "x.md"}) == {"a"}
+    assert index.get_ids({"source": ["x.md", "y.md"], "page": "1"}) == {"a", "b"}
+    assert index.get_ids({"source": "x.md", "page": 2}) == set()
+    # 过长的值没有索引，无法通过索引判断
+    assert index.get_ids({"summary": "s" * 1000}) is None
+
+    index.delete(["a"])
+    assert index.get_ids({"page": 1}) == {"b"}
+    assert ("source", "x.md") not in index.values
+    assert match_metadata({"page": 1, "source": "x.md"}, {"page": ["1", "2"]})
+    assert not match_metadata({"source": "x.md"}, {"page": 1})
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_faiss_filtered_search(tmp_path, index_type):
+    rng = np.random.default_rng(0)
+    vectors = rng.random((300, 16)).tolist()
+    texts = [f"doc {i}" for i in range(300)]
+    metadatas = [{"source": f"{i % 3}.md", "page": i} for i in range(300)]
+    vs = IndexedFAISS.from_embeddings(
+        list(zip(texts, vectors)),
+        FakeEmbeddings(size=16),
+        metadatas=metadatas,
+        ids=[str(i) for i in range(300)],
+    )
+    vs.enable_metadata_index()
+    if index_type == "hnsw":
+        spec = FaissIndexSpec(index_type="hnsw")
+        ids, snapshot = vs.begin_rebuild()
+        vs.swap_index(build_index(spec, snapshot, 16), ids)
+    vs.delete(["0"])
+
+    docs = vs.similarity_search_with_score_by_vector(
+        vectors[4], k=5, filter={"source": "1.md"}, ef_search=300
+    )
+    assert len(docs) == 5
+    assert docs[0][0].page_content == "doc 4"
+    assert all(doc.metadata["source"] == "1.md" for doc, _ in docs)
+    # 已删除的文档不会被返回
+    assert vs.similarity_search_with_score_by_vector(vectors[0], k=3, filter={"page": 0}) == []
+    # 结果数不受 fetch_k 限制
+    docs = vs.similarity_search_with_score_by_vector(
+        vectors[0], k=50, filter={"source": ["0.md", "2.md"]}, fetch_k=10, ef_search=300
+    )
+    assert len(docs) == 50
+
+    vs.save_local(str(tmp_path))
+    loaded = IndexedFAISS.load_local(
+        str(tmp_path), FakeEmbeddings(size=16), allow_dangerous_deserialization=True
+    )
+    loaded.enable_metadata_index(str(tmp_path))
+    assert len(loaded.metadata_index) == 299
+    assert loaded.get_ids_by_metadata({"page": 7}) == {"7"}
+
+
+def test_bm25_retriever_with_filter():
+    docs = {
+        "a": Document(page_content="苹果 香蕉", metadata={"source": "a.md"}),
+        "b": Document(page_content="苹果", metadata={"source": "b.md"}),
+    }
+    index = BM25Index(preprocess_func=str.split)
+    index.add(list(docs), [d.page_content for d in docs.values()])
+    docstore = SimpleNamespace(search=docs.get)
+
+    retriever = BM25IndexRetriever(index=index, docstore=docstore, k=2, ids={"b"})
+    assert [d.metadata["source"] for d in retriever.invoke("苹果")] == ["b.md"]
+    retriever = BM25IndexRetriever(index=index, docstore=docstore, k=2, filter={"source": "a.md"})
+    assert [d.metadata["source"] for d in retriever.invoke("苹果")] == ["a.md"]
+
+
+class FakeKBService(DefaultKBService):
+    def check_embed_model(self):
+        return True, ""
+
+    def do_search(self, query, top_k, score_threshold, **kwargs):
+        self.calls.append((top_k, kwargs))
+        return [Document(page_content=str(i), metadata={"page": i % 2}) for i in range(top_k)]
+
+
+def test_search_docs_filter_fallback():
+    kb = FakeKBService("fake_filter_kb")
+    kb.calls = []
+    # 不支持原生过滤的向量库：多取结果后过滤
+    docs = kb.search_docs("q", top_k=3, score_threshold=1.0, filter={"page": 1})
+    assert [d.page_content for d in docs] == ["1", "3", "5"]
+    assert kb.calls == [(15, {})]
+
+    kb.search_params = ("filter",)
+    kb.search_docs("q", top_k=3, score_threshold=1.0, filter={"page": 0})
+    assert kb.calls[-1] == (3, {"filter": {"page": 0}})
@@ -0,0 +1,42 @@
+import asyncio
+import gc
+
+import openai
+
+from chatchat.server import model_clients as mc
+from chatchat.settings import Settings
+
+
+def test_clients_are_reused_until_platforms_change(monkeypatch):
+    monkeypatch.setattr(Settings.model_settings, "MODEL_PLATFORMS", [])
+    registry = mc.ModelClientRegistry()
+
+    client = registry.get_openai_client("http://127.0.0.1:9997/v1", "EMPTY")
+    assert isinstance(client, openai.OpenAI)
+    assert registry.get_openai_client("http://127.0.0.1:9997/v1", "EMPTY") is client
+    assert registry.get_openai_client("http://127.0.0.1:9998/v1", "EMPTY") is not client
+
+    async def get_async():
+        return registry.get_openai_client("http://127.0.0.1:9997/v1", "EMPTY", is_async=True)
+
+    async def same_loop():
+        return await get_async() is await get_async()
+
+    assert asyncio.run(same_loop())
+    # 异步客户端的连接绑定事件循环，不同循环使用不同的客户端
+    assert isinstance(asyncio.run(get_async()), openai.AsyncOpenAI)
+    assert registry.stats()["clients"] == 3
+    # 没有运行中的事件循环时不缓存异步客户端
+    registry.get_openai_client("http://127.0.0.1:9997/v1", "EMPTY", is_async=True)
+    assert registry.stats()["clients"] == 3
+
+    # 配置重新加载后丢弃原有的客户端，仍在使用的客户端不会被关闭
+    monkeypatch.setattr(Settings.model_settings, "MODEL_PLATFORMS", [])
+    assert registry.get_openai_client("http://127.0.0.1:9997/v1", "EMPTY") is not client
+    assert registry.stats()["clients"] == 1
+    http_client = client._client
+    assert not http_client.is_closed
+    # 最后一个使用者释放后关闭其连接池
+    del client
+    gc.collect()
+    assert http_client.is_closed
@@ -0,0 +1,40 @@
+from chatchat.server import utils
+from chatchat.settings import PlatformConfig
+
+
+def _config():
+    return [
+        PlatformConfig(
+            platform_name="p1",
+            platform_type="openai",
+            llm_models=["glm4-chat", "qwen"],
+            embed_models=["bge-m3"],
+        ),
+        PlatformConfig(
+            platform_name="p2",
+            platform_type="oneapi",
+            llm_models=["qwen"],
+        ),
+    ]
+
+
+def test_model_index_lookups(monkeypatch):
+    config = _config()
+    index = utils._ModelIndex(config)
+    monkeypatch.setattr(utils, "_get_model_index", lambda: index)
+
+    # 重名模型以最后一个平台为准，与逐个遍历平台的结果一致
+    assert utils.get_model_info("qwen")["platform_name"] == "p2"
+    assert utils.get_model_info("qwen", platform_name="p1")["platform_name"] == "p1"
+    assert list(utils.get_config_models(model_type="llm")) == ["glm4-chat", "qwen"]
+    assert list(utils.get_config_models(model_type="embed")) == ["bge-m3"]
+    assert list(utils.get_config_models(platform_name="p2")) == ["qwen"]
+    assert utils.get_config_models(model_name="bge-m3", model_type="llm") == {}
+    assert [t for t, _ in index.by_name["qwen"]] == ["llm", "llm"]
+
+    # 返回值是副本，修改不影响索引
+    utils.get_model_info("qwen")["api_key"] = "changed"
+    assert utils.get_model_info("qwen")["api_key"] == "EMPTY"
+
+    assert not index.is_stale(config)
+    assert index.is_stale(_config())
@@ -0,0 +1,159 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+from pydantic import BaseModel
+
+from chatchat.server.api_server import model_router as mr
+from chatchat.server.api_server import openai_routes
+
+
+def _platforms(model_name):
+    return [
+        {"platform_name": "p1", "api_concurrencies": 2},
+        {"platform_name": "p2", "api_concurrencies": 2},
+    ]
+
+
+def test_least_loaded_and_circuit_breaking(monkeypatch):
+    monkeypatch.setattr(mr, "get_model_platforms", _platforms)
+
+    async def run():
+        router = mr.ModelRouter(failure_threshold=2, cooldown=60)
+        first = await router.acquire("m")
+        second = await router.acquire("m")
+        # 第一个平台已有未完成的请求，第二个请求转发到另一个平台
+        assert {first.platform_name, second.platform_name} == {"p1", "p2"}
+        first.success()
+        first.release()
+        second.success()
+        second.release()
+
+        # 连续失败后熔断，只转发到另一个平台
+        for _ in range(2):
+            route = await router.acquire("m", exclude=["p2"])
+            route.failure(ConnectionError("down"))
+            route.release()
+        for _ in range(3):
+            route = await router.acquire("m")
+            assert route.platform_name == "p2"
+            route.release()
+        # 已排除唯一可用的平台且不允许选择熔断的平台时，没有可用平台
+        assert await router.acquire("m", exclude=["p2"], allow_open=False) is None
+
+        stats = {s["platform_name"]: s for s in router.stats()["m"]}
+        assert stats["p1"]["circuit"] == "open"
+        assert stats["p1"]["failures"] == 2
+        assert stats["p2"]["outstanding"] == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_probe_allows_another_probe(monkeypatch):
+    monkeypatch.setattr(mr, "get_model_platforms", _platforms)
+
+    async def run():
+        router = mr.ModelRouter(failure_threshold=1, cooldown=0.01)
+        route = await router.acquire("m", exclude=["p2"])
+        route.failure(ConnectionError("down"))
+        route.release()
+        await asyncio.sleep(0.02)
+
+        probe = await router.acquire("m", exclude=["p2"], allow_open=False)
+        assert probe.platform_name == "p1"
+        assert await router.acquire("m", exclude=["p2"], allow_open=False) is None
+        # 试探请求被取消，没有结果
+        probe.release()
+        probe.release()
+        route = await router.acquire("m", exclude=["p2"], allow_open=False)
+        assert route.platform_name == "p1"
+        route.release()
+        assert router.stats()["m"][0]["outstanding"] == 0
+
+    asyncio.run(run())
+
+
+def _status_error(status_code: int) -> openai.APIStatusError:
+    request = httpx.Request("POST", "http://platform/v1/chat/completions")
+    response = httpx.Response(status_code, request=request)
+    return openai.APIStatusError(f"status {status_code}", response=response, body=None)
+
+
+def test_retryable_errors():
+    request = httpx.Request("POST", "http://platform/v1/chat/completions")
+    assert mr.is_retryable(openai.APIConnectionError(request=request))
+    assert mr.is_retryable(openai.APITimeoutError(request=request))
+    assert mr.is_retryable(httpx.ReadError("reset", request=request))
+    for status_code in (408, 429, 500, 503):
+        assert mr.is_retryable(_status_error(status_code))
+    for status_code in (400, 401, 404, 422):
+        assert not mr.is_retryable(_status_error(status_code))
+    assert not mr.is_retryable(ValueError("bad request"))
+    assert not mr.is_retryable(TypeError("bug"))
+    assert mr.is_model_missing(_status_error(404))
+    assert not mr.is_model_missing(_status_error(400))
+
+
+class _Body(BaseModel):
+    model: str = "m"
+    stream: bool = False
+
+
+class _Result(BaseModel):
+    platform: str
+
+
+def _routed(monkeypatch, errors):
+    """
+    各平台的请求依次抛出 errors 中对应的错误，为 None 时返回结果
+    """
+    router = mr.ModelRouter(failure_threshold=1, cooldown=60)
+    monkeypatch.setattr(mr, "get_model_platforms", _platforms)
+    monkeypatch.setattr(openai_routes, "model_router", router)
+    calls = []
+
+    def get_client(platform_name, is_async):
+        async def create(**kwargs):
+            calls.append(platform_name)
+            if (error := errors.get(platform_name)) is not None:
+                raise error
+            return _Result(platform=platform_name)
+
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    monkeypatch.setattr(openai_routes, "get_OpenAIClient", get_client)
+
+    async def request():
+        return await openai_routes.openai_routed_request("m", "chat.completions.create", _Body())
+
+    return router, calls, request
+
+
+def test_routed_request_retries_unavailable_and_missing(monkeypatch):
+    request = httpx.Request("POST", "http://platform/v1/chat/completions")
+    for error, counted in ((openai.APIConnectionError(request=request), 1), (_status_error(404), 0)):
+        router, calls, run = _routed(monkeypatch, {"p1": error, "p2": None})
+        # 两个平台都空闲时先选择 p1
+        result = asyncio.run(run())
+        assert calls == ["p1", "p2"]
+        assert result["platform"] == "p2"
+        stats = {s["platform_name"]: s for s in router.stats()["m"]}
+        # 平台上没有该模型不计入失败，也不熔断
+        assert stats["p1"]["failures"] == counted
+        assert stats["p1"]["circuit"] == ("open" if counted else "closed")
+        assert stats["p1"]["outstanding"] == 0
+
+
+def test_routed_request_raises_other_errors(monkeypatch):
+    for error in (_status_error(400), ValueError("bad request")):
+        router, calls, run = _routed(monkeypatch, {"p1": error, "p2": None})
+        with pytest.raises(type(error)):
+            asyncio.run(run())
+        # 不换平台重试，也不计入平台失败
+        assert calls == ["p1"]
+        stats = {s["platform_name"]: s for s in router.stats()["m"]}
+        assert stats["p1"]["failures"] == 0
+        assert stats["p1"]["circuit"] == "closed"
+        assert stats["p1"]["outstanding"] == 0
@@ -0,0 +1,47 @@
+import pytest
+from fastapi import HTTPException
+from langchain.docstore.document import Document
+
+from chatchat.server.knowledge_base import kb_doc_api
+from chatchat.server.knowledge_base.kb_doc_api import merge_ranked_docs, search_docs_in_kbs
+
+
+def _docs(kb, n):
+    return [
+        Document(page_content=f"{kb}-{i}", metadata={"id": f"{kb}{i}", "kb_name": kb})
+        for i in range(n)
+    ]
+
+
+def test_merge_ranked_docs_interleaves_by_rank():
+    merged = merge_ranked_docs([_docs("a", 3), _docs("b", 2), []], top_k=4)
+    assert [d["page_content"] for d in merged] == ["a-0", "b-0", "a-1", "b-1"]
+    assert merged[0]["id"] == "a0"
+    assert merged[0]["metadata"]["kb_name"] == "a"
+    assert merged[0]["score"] > merged[2]["score"]
+    assert merge_ranked_docs([], top_k=3) == []
+
+
+class _FakeKB:
+    def __init__(self, kb_name):
+        self.kb_name = kb_name
+
+    def search_docs(self, query, top_k, score_threshold):
+        return _docs(self.kb_name, top_k)
+
+
+def test_search_docs_in_kbs_validates_names(monkeypatch):
+    monkeypatch.setattr(
+        kb_doc_api.KBServiceFactory,
+        "get_service_by_name",
+        lambda name: _FakeKB(name) if name in ("a", "b") else None,
+    )
+    monkeypatch.setattr(kb_doc_api.Settings.kb_settings, "MAX_KBS_PER_SEARCH", 2)
+
+    merged = search_docs_in_kbs("q", ["a", "b", "a"], top_k=2, score_threshold=2.0)
+    assert [d["page_content"] for d in merged] == ["a-0", "b-0"]
+
+    for names, status_code in ((["a", "c"], 404), (["a", "../b"], 403), (["a", "b", "c"], 400)):
+        with pytest.raises(HTTPException) as exc:
+            search_docs_in_kbs("q", names, top_k=2, score_threshold=2.0)
+        assert exc.value.status_code == status_code
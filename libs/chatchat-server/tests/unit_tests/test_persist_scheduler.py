@@ -0,0 +1,88 @@
+import threading
+import time
+
+from chatchat.server.knowledge_base.kb_cache.persist import PersistScheduler
+
+
+class Item:
+    def __init__(self, key):
+        self.key = key
+        self.saved = 0
+        self.event = threading.Event()
+
+    def persist(self):
+        self.saved += 1
+        self.event.set()
+
+
+def test_saves_are_coalesced():
+    scheduler = PersistScheduler(interval=0.2, max_dirty=100)
+    item = Item("a")
+    for _ in range(10):
+        scheduler.mark_dirty(item)
+    assert item.saved == 0
+    assert item.event.wait(2)
+    time.sleep(0.1)
+    assert item.saved == 1
+    assert not scheduler.is_dirty("a")
+    scheduler.stop()
+
+
+def test_threshold_flush_and_stop():
+    scheduler = PersistScheduler(interval=60, max_dirty=5)
+    big, small, dropped = Item("big"), Item("small"), Item("dropped")
+    scheduler.mark_dirty(small)
+    scheduler.mark_dirty(dropped)
+    scheduler.mark_dirty(big, 5)
+    assert big.event.wait(2)
+    assert small.saved == 0
+
+    scheduler.discard("dropped")
+    scheduler.stop()
+    assert small.saved == 1
+    assert dropped.saved == 0
+    assert not scheduler.enabled
+
+
+class FlakyItem(Item):
+    def __init__(self, key, failures):
+        super().__init__(key)
+        self.failures = failures
+
+    def persist(self):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        super().persist()
+
+
+def test_failed_save_is_retried():
+    scheduler = PersistScheduler(interval=0.1, max_dirty=5)
+    item = FlakyItem("a", failures=1)
+    scheduler.mark_dirty(item, 5)
+    assert item.event.wait(2)
+    assert item.saved == 1
+    assert not scheduler.is_dirty("a")
+    scheduler.stop()
+
+
+def test_discard_waits_for_inflight_save():
+    scheduler = PersistScheduler(interval=60, max_dirty=100)
+    started, release = threading.Event(), threading.Event()
+
+    class SlowItem(Item):
+        def persist(self):
+            started.set()
+            release.wait(2)
+            raise OSError("directory removed")
+
+    item = SlowItem("a")
+    scheduler.mark_dirty(item)
+    threading.Thread(target=scheduler.flush, args=("a",), daemon=True).start()
+    assert started.wait(2)
+    threading.Timer(0.1, release.set).start()
+    scheduler.discard("a", wait=True)
+    # 已放弃的对象保存失败后不再重试
+    assert release.is_set()
+    assert not scheduler.is_dirty("a")
+    scheduler.stop()
@@ -0,0 +1,51 @@
+import threading
+import time
+
+from chatchat.server.knowledge_base.kb_cache.base import RWLock, ThreadSafeObject
+
+
+def test_readers_run_concurrently():
+    obj = ThreadSafeObject("key", obj=object())
+    inside = threading.Barrier(3, timeout=5)
+
+    def reader():
+        with obj.acquire(shared=True):
+            inside.wait()  # would time out if readers were serialized
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not inside.broken
+
+
+def test_writer_preference_and_reentrancy():
+    lock = RWLock()
+    order = []
+    lock.acquire_read()
+
+    def writer():
+        lock.acquire_write()
+        lock.acquire_read()  # writer may re-enter as reader
+        order.append("writer")
+        lock.release_read()
+        lock.release_write()
+
+    def reader():
+        lock.acquire_read()
+        order.append("reader")
+        lock.release_read()
+
+    w = threading.Thread(target=writer)
+    w.start()
+    while not lock._writers_waiting:
+        time.sleep(0.01)
+    r = threading.Thread(target=reader)
+    r.start()
+    time.sleep(0.1)
+    assert order == []  # new reader waits behind the pending writer
+    lock.release_read()
+    w.join(5)
+    r.join(5)
+    assert order == ["writer", "reader"]
@@ -0,0 +1,70 @@
+import hashlib
+from typing import List
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_core.embeddings import Embeddings
+
+from chatchat.server.embeddings_cache import CachedEmbeddings, EmbeddingCache, embed_queries
+from chatchat.server.file_rag.retrievers.ensemble import EnsembleRetrieverService
+from chatchat.server.knowledge_base.kb_cache.faiss_cache import IndexedFAISS
+
+
+def test_batch_search_matches_single_queries():
+    embeddings = FakeEmbeddings(size=16)
+    vs = IndexedFAISS.from_documents(
+        [Document(page_content=f"doc {i}", metadata={"source": f"{i}.md"}) for i in range(30)],
+        embeddings,
+        normalize_L2=True,
+    )
+    vs.enable_bm25()
+    vectors = [embeddings.embed_query(q) for q in ("a", "b", "c")]
+
+    batch = vs.similarity_search_with_score_by_vectors(vectors, k=5)
+    for vector, docs in zip(vectors, batch):
+        assert docs == vs.similarity_search_with_score_by_vector(vector, k=5)
+
+    relevance = vs.similarity_search_with_relevance_scores_by_vectors(
+        vectors, k=5, score_threshold=0.2
+    )
+    assert all(score >= 0.2 for docs in relevance for _, score in docs)
+
+    retriever = EnsembleRetrieverService.from_vectorstore(vs, top_k=3, score_threshold=0.0)
+    fused = retriever.get_relevant_documents_batch(
+        ["doc 1", "doc 2"], [[doc for doc, _ in docs] for docs in batch[:2]]
+    )
+    assert len(fused) == 2
+    assert all(len(docs) == 3 for docs in fused)
+
+
+class QueryPrefixEmbeddings(Embeddings):
+    """查询文本与文档文本的向量不同，用于检查批量检索使用查询语义"""
+
+    def _vector(self, text: str) -> List[float]:
+        rng = np.random.default_rng(int(hashlib.md5(text.encode()).hexdigest()[:8], 16))
+        return rng.random(16).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(f"query: {text}")
+
+
+def test_batch_search_uses_query_embeddings():
+    embeddings = CachedEmbeddings(
+        QueryPrefixEmbeddings(), "fake", EmbeddingCache(max_bytes=1024 * 1024)
+    )
+    vs = IndexedFAISS.from_documents(
+        [Document(page_content=f"doc {i}", metadata={"source": f"{i}.md"}) for i in range(30)],
+        embeddings,
+        normalize_L2=True,
+    )
+    queries = ["doc 1", "doc 2", "doc 3"]
+    vectors = embed_queries(vs.embeddings, queries)
+    assert vectors == [embeddings.embed_query(q) for q in queries]
+
+    batch = vs.similarity_search_with_relevance_scores_by_vectors(vectors, k=5)
+    for query, docs in zip(queries, batch):
+        assert docs == vs.similarity_search_with_relevance_scores(query, k=5)
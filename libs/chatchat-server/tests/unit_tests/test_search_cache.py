@@ -0,0 +1,52 @@
+import time
+
+from langchain.docstore.document import Document
+
+from chatchat.server.knowledge_base.kb_cache.search_cache import (
+    KBVersions,
+    SearchResultCache,
+)
+
+
+def test_cache_is_keyed_by_version_and_normalized_query():
+    cache = SearchResultCache(max_size=2, ttl=60)
+    versions = KBVersions()
+    key = cache.make_key("kb", versions.get("kb"), "重置  密码？", 3, 0.5, nprobe=8)
+    cache.set(key, [Document(page_content="a")])
+
+    same = cache.make_key("kb", versions.get("kb"), " 重置 密码? ", 3, 0.5, nprobe=8)
+    docs = cache.get(same)
+    assert [d.page_content for d in docs] == ["a"]
+    docs[0].metadata["x"] = 1
+    assert cache.get(same)[0].metadata == {}
+
+    assert cache.get(cache.make_key("kb", 0, "重置 密码?", 3, 0.5, nprobe=16)) is None
+    versions.bump("kb")
+    assert cache.get(cache.make_key("kb", versions.get("kb"), "重置 密码?", 3, 0.5, nprobe=8)) is None
+
+
+def test_cache_lru_and_ttl():
+    cache = SearchResultCache(max_size=2, ttl=0.05)
+    for q in ("a", "b", "c"):
+        cache.set(q, [])
+    assert cache.get("a") is None
+    assert cache.get("c") == []
+    time.sleep(0.1)
+    assert cache.get("c") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_versions_are_shared_between_processes(tmp_path):
+    (tmp_path / "kb").mkdir()
+    # 两个实例模拟两个 worker 进程
+    worker1, worker2 = KBVersions(str(tmp_path)), KBVersions(str(tmp_path))
+    version = worker2.get("kb")
+    worker1.bump("kb")
+    assert worker2.get("kb") != version
+    version = worker2.get("kb")
+    worker1.bump("kb")
+    assert worker2.get("kb") != version
+
+    # 知识库目录不存在时不创建版本文件
+    worker1.bump("missing")
+    assert not (tmp_path / "missing").exists()
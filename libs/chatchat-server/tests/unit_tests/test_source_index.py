@@ -0,0 +1,48 @@
+from langchain.docstore.document import Document
+from langchain_community.embeddings import FakeEmbeddings
+
+from chatchat.server.knowledge_base.kb_cache.faiss_cache import IndexedFAISS
+from chatchat.server.knowledge_base.kb_cache.metadata_index import SourceIndex
+
+
+def test_source_index():
+    index = SourceIndex()
+    index.add(["a", "b", "c"], [{"source": "A.md"}, {"source": "a.md"}, {}])
+    assert len(index) == 3
+    assert sorted(index.get("a.MD")) == ["a", "b"]
+
+    index.add(["b"], [{"source": "b.md"}])
+    assert index.get("a.md") == ["a"]
+    index.delete(["a", "c"])
+    assert index.get("a.md") == []
+    assert "a.md" not in index.sources
+    assert len(index) == 1
+
+
+def test_indexed_faiss_keeps_source_index_in_sync(tmp_path):
+    embeddings = FakeEmbeddings(size=8)
+    vs = IndexedFAISS.from_documents(
+        [Document(page_content="init", metadata={"source": "init.md"})], embeddings
+    )
+    vs.enable_source_index()
+    assert len(vs.get_ids_by_source("init.md")) == 1
+
+    ids = vs.add_documents(
+        [
+            Document(page_content="hello", metadata={"source": "a.md"}),
+            Document(page_content="world", metadata={"source": "a.md"}),
+            Document(page_content="foo", metadata={"source": "b.md"}),
+        ]
+    )
+    assert sorted(vs.get_ids_by_source("A.md")) == sorted(ids[:2])
+    vs.delete(vs.get_ids_by_source("a.md"))
+    assert vs.get_ids_by_source("a.md") == []
+
+    vs.save_local(str(tmp_path))
+    assert (tmp_path / "index.source").is_file()
+    loaded = IndexedFAISS.load_local(
+        str(tmp_path), embeddings, allow_dangerous_deserialization=True
+    )
+    loaded.enable_source_index(str(tmp_path))
+    assert loaded.get_ids_by_source("b.md") == ids[2:]
+    assert len(loaded.source_index) == 2
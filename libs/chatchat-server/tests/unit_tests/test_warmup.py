@@ -0,0 +1,64 @@
+import time
+
+from chatchat.server.knowledge_base import warmup as warmup_module
+from chatchat.server.knowledge_base.warmup import KBUsage
+from chatchat.settings import Settings
+
+
+def test_kb_usage_persist(tmp_path):
+    path = str(tmp_path / "cache" / "kb_usage.json")
+    usage = KBUsage(path)
+    usage.record("a")
+    usage.record("b", 3)
+    usage.save()
+
+    usage = KBUsage(path)
+    usage.record("a", 5)
+    assert usage.most_common(2) == ["a", "b"]
+
+
+def test_kb_usage_saved_periodically(tmp_path):
+    path = str(tmp_path / "kb_usage.json")
+    usage = KBUsage(path, interval=0.05)
+    usage.record("a", 2)
+    for _ in range(100):
+        if KBUsage(path).most_common(1) == ["a"]:
+            break
+        time.sleep(0.01)
+    assert KBUsage(path).most_common(1) == ["a"]
+
+
+def test_warmup_selects_and_loads(monkeypatch, tmp_path):
+    usage = KBUsage()
+    for name, count in [("hot", 10), ("warm", 5), ("gone", 20), ("cold", 1)]:
+        usage.record(name, count)
+    monkeypatch.setattr(warmup_module, "kb_usage", usage)
+    monkeypatch.setattr(warmup_module, "list_kbs_from_db", lambda: ["hot", "warm", "cold", "pinned", "bad"])
+    monkeypatch.setattr(Settings.kb_settings, "CACHED_VS_NUM", -1)
+
+    # 指定的知识库在前，已删除的知识库被忽略
+    assert warmup_module.select_warmup_kbs(["pinned", "missing"], top_n=2) == ["pinned", "hot", "warm"]
+    assert warmup_module.select_warmup_kbs(["hot"], top_n=1) == ["hot", "warm"]
+
+    loaded = []
+
+    def fake_warmup_kb(name):
+        if name == "bad":
+            raise RuntimeError("broken")
+        loaded.append(name)
+
+    monkeypatch.setattr(warmup_module, "_warmup_kb", fake_warmup_kb)
+    monkeypatch.setattr(warmup_module, "_warmup_text_processing", lambda: None)
+    result = warmup_module.warmup(["bad", "pinned"], top_n=1, max_workers=2)
+    assert result == {"bad": False, "pinned": True, "hot": True}
+    assert sorted(loaded) == ["hot", "pinned"]
+
+
+def test_warmup_limited_to_cache_capacity(monkeypatch):
+    monkeypatch.setattr(warmup_module, "kb_usage", KBUsage())
+    monkeypatch.setattr(warmup_module, "list_kbs_from_db", lambda: ["a", "b", "c", "p"])
+    monkeypatch.setattr(Settings.kb_settings, "CACHED_VS_NUM", 2)
+    monkeypatch.setattr(Settings.kb_settings, "PINNED_KBS", ["p"])
+
+    # 常驻的知识库总会预加载，其余的知识库填满剩余的缓存容量
+    assert warmup_module.select_warmup_kbs(["a", "p", "b", "c"], top_n=0) == ["a", "p"]